@@ -0,0 +1,136 @@
+"""
+Compara los backends de embeddings (pytorch, onnx, onnx-int8) sobre las FAQs.
+
+Para cada backend reporta la deriva de coseno respecto del baseline PyTorch, el recall@k
+de las preguntas contra sus respuestas, el solapamiento del top-k con el baseline y el
+throughput de vectorización, para elegir EMBEDDING_BACKEND a partir de datos.
+"""
+import json
+import time
+import logging
+import argparse
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config import FAQS_PATH, EMBEDDING_MODEL_NAME, MODELS_CACHE_DIR, EMBEDDING_ONNX_INT8_FILE
+from utils.embedding_backends import EMBEDDING_BACKENDS, create_embedding_model
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_faq_pairs() -> Tuple[List[str], List[str]]:
+    """
+    Lee las preguntas y respuestas de FAQs.csv.
+    
+    Returns:
+        Tuple[List[str], List[str]]: Preguntas y respuestas en el mismo orden
+    """
+    df = pd.read_csv(FAQS_PATH)
+    columns = df.columns.tolist()
+    pregunta_col = next((col for col in columns if 'pregunta' in col.lower()), columns[0])
+    respuesta_col = next((col for col in columns if 'respuesta' in col.lower()), columns[1])
+    df = df.dropna(subset=[pregunta_col, respuesta_col])
+    
+    return df[pregunta_col].astype(str).tolist(), df[respuesta_col].astype(str).tolist()
+
+
+def embed_timed(model, texts: List[str], repeats: int) -> Tuple[np.ndarray, float]:
+    """
+    Vectoriza los textos y mide el throughput promedio.
+    
+    Args:
+        model: Modelo de embeddings
+        texts (List[str]): Textos a vectorizar
+        repeats (int): Cantidad de repeticiones para medir
+        
+    Returns:
+        Tuple[np.ndarray, float]: Matriz normalizada de vectores y textos por segundo
+    """
+    model.embed_documents(texts[:2])  # Calentamiento
+    
+    start = time.perf_counter()
+    for _ in range(repeats):
+        vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+    elapsed = time.perf_counter() - start
+    
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, len(texts) * repeats / elapsed
+
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    """Índices de los k documentos más similares para cada consulta."""
+    return np.argsort(-queries @ corpus.T, axis=1)[:, :k]
+
+
+def run_benchmark(backends: List[str], k: int, repeats: int) -> Dict[str, Any]:
+    """
+    Ejecuta la comparación de backends.
+    
+    Args:
+        backends (List[str]): Backends a comparar; siempre se incluye pytorch como baseline
+        k (int): Tamaño del top-k para recall y solapamiento
+        repeats (int): Repeticiones para medir throughput
+        
+    Returns:
+        Dict[str, Any]: Métricas por backend
+    """
+    questions, answers = load_faq_pairs()
+    logger.info(f"FAQs cargadas: {len(questions)} pares pregunta/respuesta")
+    
+    ordered = ["pytorch"] + [backend for backend in backends if backend != "pytorch"]
+    expected = np.arange(len(questions))
+    results: Dict[str, Any] = {"k": k, "faqs": len(questions), "backends": {}}
+    baseline = None
+    
+    for backend in ordered:
+        logger.info(f"Evaluando backend: {backend}")
+        model = create_embedding_model(
+            EMBEDDING_MODEL_NAME, MODELS_CACHE_DIR, backend=backend, onnx_int8_file=EMBEDDING_ONNX_INT8_FILE
+        )
+        question_vectors, _ = embed_timed(model, questions, repeats)
+        answer_vectors, throughput = embed_timed(model, answers, repeats)
+        retrieved = top_k(question_vectors, answer_vectors, k)
+        
+        metrics = {
+            "throughput_texts_per_s": round(throughput, 1),
+            f"recall@{k}": float(np.mean([expected[i] in retrieved[i] for i in range(len(questions))])),
+        }
+        
+        if baseline is None:
+            baseline = (question_vectors, answer_vectors, retrieved)
+        else:
+            base_questions, base_answers, base_retrieved = baseline
+            drift = 1.0 - np.concatenate([
+                np.sum(question_vectors * base_questions, axis=1),
+                np.sum(answer_vectors * base_answers, axis=1),
+            ])
+            overlap = [len(set(retrieved[i]) & set(base_retrieved[i])) / k for i in range(len(questions))]
+            metrics.update({
+                "cosine_drift_mean": float(np.mean(drift)),
+                "cosine_drift_max": float(np.max(drift)),
+                f"overlap@{k}_vs_pytorch": float(np.mean(overlap)),
+            })
+        
+        results["backends"][backend] = metrics
+    
+    return results
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Compara backends de embeddings sobre las FAQs")
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKENDS,
+                        help="Backends a comparar (pytorch siempre se usa como baseline)")
+    parser.add_argument("--k", type=int, default=3, help="Tamaño del top-k")
+    parser.add_argument("--repeats", type=int, default=3, help="Repeticiones para medir throughput")
+    args = parser.parse_args()
+    
+    print(json.dumps(run_benchmark(args.backends, args.k, args.repeats), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
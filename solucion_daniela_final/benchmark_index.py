@@ -0,0 +1,155 @@
+"""
+Compara tipos de índice FAISS (Flat, HNSW, IVF-Flat, IVF-PQ) sobre los chunks del índice actual.
+
+Para cada cadena de fábrica reporta el tiempo de construcción (entrenamiento incluido), el tamaño
+serializado, la latencia p50/p99 de una consulta y el recall@k contra la búsqueda exacta (Flat),
+para elegir FAISS_INDEX_FACTORY a partir de datos.
+"""
+import json
+import math
+import time
+import logging
+import argparse
+from typing import List, Dict, Any
+
+import faiss
+import numpy as np
+
+from config import FAQS_PATH, FAISS_TRAIN_SAMPLE_SIZE, FAISS_NPROBE, FAISS_HNSW_EF_SEARCH
+from indexer import load_embeddings, load_embedding_store, load_index, load_catalog_product_names
+from utils.faiss_factory import build_trained_index, configure_search
+from utils.faq_index import read_faqs
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def default_factories(total: int, dimension: int) -> List[str]:
+    """
+    Cadenas de fábrica por defecto, dimensionadas según la cantidad de vectores.
+    
+    Args:
+        total (int): Cantidad de vectores del corpus
+        dimension (int): Dimensión de los vectores
+    
+    Returns:
+        List[str]: Cadenas de fábrica a comparar
+    """
+    # Regla usual: ~4·sqrt(n) listas, con al menos ~39 vectores de entrenamiento por lista
+    nlist = max(1, min(int(4 * math.sqrt(total)), total // 39))
+    # PQ necesita 2^bits vectores para entrenar cada subcuantizador
+    bits = max(1, min(8, int(math.log2(max(total, 2)))))
+    subquantizers = next(m for m in (32, 16, 8, 4, 2, 1) if dimension % m == 0 and m <= dimension)
+    
+    return ["Flat", "HNSW32", f"IVF{nlist},Flat", f"IVF{nlist},PQ{subquantizers}x{bits}"]
+
+
+def load_queries() -> List[str]:
+    """
+    Arma las consultas del benchmark: preguntas de FAQs.csv y preguntas de precio del catálogo.
+    
+    Returns:
+        List[str]: Consultas en lenguaje natural
+    """
+    queries = [faq["question"] for faq in read_faqs(FAQS_PATH)]
+    queries.extend(f"¿Cuánto cuesta el {name}?" for name in load_catalog_product_names())
+    return queries
+
+
+def percentile_ms(latencies: List[float], percentile: float) -> float:
+    """Percentil de una lista de latencias en segundos, expresado en milisegundos."""
+    return round(float(np.percentile(latencies, percentile)) * 1000, 3)
+
+
+def run_benchmark(factories: List[str], k: int, repeats: int, nprobe: int, ef_search: int) -> Dict[str, Any]:
+    """
+    Ejecuta la comparación de tipos de índice.
+    
+    Args:
+        factories (List[str]): Cadenas de fábrica a comparar; vacío para usar las de por defecto
+        k (int): Tamaño del top-k para el recall
+        repeats (int): Repeticiones de cada consulta para medir latencia
+        nprobe (int): Listas a recorrer en índices IVF
+        ef_search (int): Candidatos en índices HNSW
+    
+    Returns:
+        Dict[str, Any]: Métricas por tipo de índice
+    """
+    embeddings = load_embeddings()
+    db = load_index(embeddings)
+    if db is None:
+        raise RuntimeError("No existe el índice; ejecute primero indexer.py")
+    
+    ids = [db.index_to_docstore_id[position] for position in range(db.index.ntotal)]
+    texts = [db.docstore.search(docstore_id).page_content for docstore_id in ids]
+    store = load_embedding_store()
+    # Se vuelve a vectorizar (desde el almacén) porque el índice actual puede ser con pérdida
+    corpus = np.asarray(
+        embeddings.embed_documents(texts) if store is None else store.embed(texts, embeddings),
+        dtype=np.float32
+    )
+    if store is not None:
+        store.flush()
+    queries = np.asarray(embeddings.embed_documents(load_queries()), dtype=np.float32)
+    logger.info(f"Corpus: {len(corpus)} chunks; consultas: {len(queries)}")
+    
+    exact = faiss.IndexFlatL2(corpus.shape[1])
+    exact.add(corpus)
+    _, expected = exact.search(queries, k)
+    
+    factories = factories or default_factories(len(corpus), corpus.shape[1])
+    rng = np.random.default_rng(0)
+    sample = corpus[rng.permutation(len(corpus))[:FAISS_TRAIN_SAMPLE_SIZE]]
+    results: Dict[str, Any] = {"k": k, "chunks": len(corpus), "queries": len(queries), "indexes": {}}
+    
+    for factory in factories:
+        logger.info(f"Evaluando índice: {factory}")
+        try:
+            start = time.perf_counter()
+            index = build_trained_index(factory, sample)
+            index.add(corpus)
+            build_seconds = time.perf_counter() - start
+            configure_search(index, nprobe, ef_search)
+            
+            latencies = []
+            for _ in range(repeats):
+                for query in queries:
+                    start = time.perf_counter()
+                    index.search(query[None, :], k)
+                    latencies.append(time.perf_counter() - start)
+            _, retrieved = index.search(queries, k)
+        except RuntimeError as e:
+            results["indexes"][factory] = {"error": str(e)}
+            continue
+        
+        recall = [len(set(retrieved[i]) & set(expected[i])) / k for i in range(len(queries))]
+        results["indexes"][factory] = {
+            "index_type": type(faiss.downcast_index(index)).__name__,
+            "build_s": round(build_seconds, 3),
+            "size_bytes": int(len(faiss.serialize_index(index))),
+            "query_p50_ms": percentile_ms(latencies, 50),
+            "query_p99_ms": percentile_ms(latencies, 99),
+            f"recall@{k}_vs_flat": float(np.mean(recall)),
+        }
+    
+    return results
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Compara tipos de índice FAISS sobre los chunks indexados")
+    parser.add_argument("--factories", nargs="+", default=[],
+                        help="Cadenas de fábrica de FAISS (por defecto: Flat, HNSW32, IVF-Flat e IVF-PQ)")
+    parser.add_argument("--k", type=int, default=4, help="Tamaño del top-k")
+    parser.add_argument("--repeats", type=int, default=3, help="Repeticiones de cada consulta")
+    parser.add_argument("--nprobe", type=int, default=FAISS_NPROBE, help="Listas a recorrer en índices IVF")
+    parser.add_argument("--ef-search", type=int, default=FAISS_HNSW_EF_SEARCH, help="Candidatos en índices HNSW")
+    args = parser.parse_args()
+    
+    results = run_benchmark(args.factories, args.k, args.repeats, args.nprobe, args.ef_search)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Mide el tiempo al primer token con la disposición del prompt anterior y la actual, con un LLM simulado.
+
+El StubLLM simula la lectura del prompt (--prefill-tokens-per-second) y la caché de prefijos del
+proveedor (--cache-block): solo se lee la parte del prompt que no coincide con uno anterior.
+- anterior: un único mensaje con instrucciones, contexto, historial y pregunta, y la cadena se arma
+  en cada turno
+- actual: mensaje de sistema fijo primero, luego historial, contexto y pregunta, con la cadena
+  compilada una vez (get_chain)
+Las dos disposiciones reciben las mismas variables, preparadas una sola vez por turno con prepare_query.
+"""
+import json
+import time
+import logging
+import argparse
+from typing import List, Dict, Any
+
+import numpy as np
+from langchain_core.prompts import ChatPromptTemplate
+
+from load_test import synthetic_conversations
+from main import (
+    SYSTEM_PROMPT, CONTEXT_SECTION, HISTORY_SECTION, QUESTION_SECTION,
+    build_chain, create_conversation_memory, get_chain, load_embeddings, load_vector_db, prepare_query
+)
+from utils.stub_llm import StubLLM
+
+# Configurar logging
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Prompt anterior: todo en un mensaje, con el contexto antes del historial
+LEGACY_PROMPT_TEMPLATE = "\n\n".join([SYSTEM_PROMPT, CONTEXT_SECTION, HISTORY_SECTION, QUESTION_SECTION])
+
+
+def prepare_turns(vector_db, conversations: List[List[str]]) -> List[List[Dict[str, str]]]:
+    """
+    Arma las variables del prompt de cada turno que llega al LLM.
+    
+    Args:
+        vector_db: Base de datos vectorial
+        conversations (List[List[str]]): Mensajes del cliente de cada conversación
+    
+    Returns:
+        List[List[Dict[str, str]]]: Variables del prompt por turno, agrupadas por conversación
+    """
+    llm = StubLLM()  # Sin demoras: solo responde para completar el historial
+    sessions = []
+    for messages in conversations:
+        memory = create_conversation_memory(vector_db)
+        turns = []
+        for message in messages:
+            memory.add("user", message)
+            turn = prepare_query(message, vector_db, llm, memory.history(),
+                                 retrieval_context=memory.retrieval_context())
+            if turn["inputs"] is not None:
+                turns.append(turn["inputs"])
+            memory.add("assistant", turn["response"] or llm.invoke(message))
+            memory.wait()  # Resumen terminado antes del turno siguiente, para que la corrida sea reproducible
+        sessions.append(turns)
+    return sessions
+
+
+def measure_layout(layout: str, sessions: List[List[Dict[str, str]]], llm: StubLLM) -> Dict[str, Any]:
+    """
+    Recorre los turnos con una disposición del prompt y mide el tiempo al primer token.
+    
+    Args:
+        layout (str): "anterior" o "actual"
+        sessions (List[List[Dict[str, str]]]): Variables del prompt por turno
+        llm (StubLLM): LLM simulado nuevo, con la caché de prefijos vacía
+    
+    Returns:
+        Dict[str, Any]: Percentiles del tiempo al primer token, tiempo de armado de la cadena y
+        fracción del prompt leída de la caché
+    """
+    ttfts = []
+    chain_seconds = []
+    for turns in sessions:
+        for inputs in turns:
+            start = time.perf_counter()
+            if layout == "anterior":
+                chain = build_chain(llm, ChatPromptTemplate.from_template(LEGACY_PROMPT_TEMPLATE))
+            else:
+                chain = get_chain(llm)
+            chain_seconds.append(time.perf_counter() - start)
+            for _ in chain.stream(inputs):
+                ttfts.append(time.perf_counter() - start)
+                break
+    
+    stats = llm.cache_stats()
+    return {
+        "turns": len(ttfts),
+        **{f"ttft_p{p}_ms": round(float(np.percentile(ttfts, p)) * 1000, 1) for p in (50, 90, 99)},
+        "ttft_mean_ms": round(float(np.mean(ttfts)) * 1000, 1),
+        "chain_build_mean_ms": round(float(np.mean(chain_seconds)) * 1000, 3),
+        "prompt_tokens_mean": round(stats["prompt_tokens"] / max(stats["prompts"], 1), 1),
+        "cached_fraction": round(stats["cached_tokens"] / max(stats["prompt_tokens"], 1), 4),
+    }
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Compara el tiempo al primer token de las disposiciones del prompt")
+    parser.add_argument("--sessions", type=int, default=20, help="Conversaciones sintéticas")
+    parser.add_argument("--turns", type=int, default=6, help="Mensajes por conversación")
+    parser.add_argument("--seed", type=int, default=7, help="Semilla de las conversaciones")
+    parser.add_argument("--latency", type=float, default=0.2, help="Latencia fija del LLM simulado en segundos")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=5000.0,
+                        help="Ritmo de lectura del prompt del LLM simulado")
+    parser.add_argument("--cache-block", type=int, default=128,
+                        help="Bloque de la caché de prefijos simulada en tokens (0: sin caché)")
+    args = parser.parse_args()
+    
+    embeddings = load_embeddings()
+    vector_db = load_vector_db(embeddings)
+    conversations = synthetic_conversations(args.sessions, args.turns, args.seed)
+    
+    def stub():
+        return StubLLM(latency=args.latency, prefill_tokens_per_second=args.prefill_tokens_per_second,
+                       prefix_cache_block=args.cache_block)
+    
+    sessions = prepare_turns(vector_db, conversations)
+    report = {
+        "stub_llm": {"latency_s": args.latency, "prefill_tokens_per_second": args.prefill_tokens_per_second,
+                     "cache_block": args.cache_block},
+        "conversations": len(conversations),
+        "layouts": {layout: measure_layout(layout, sessions, stub()) for layout in ("anterior", "actual")},
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
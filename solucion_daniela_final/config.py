@@ -8,12 +8,141 @@ KNOWLEDGE_DIR = os.path.join(BASE_DIR, 'knowledge_base')
 CATALOGO_PATH = os.path.join(KNOWLEDGE_DIR, 'catalogo.csv')
 FAQS_PATH = os.path.join(KNOWLEDGE_DIR, 'FAQs.csv')
 
+# Manifest written by prepare_knowledge_base.py with the hash of every generated
+# markdown file and the paths changed or deleted by the last run
+KNOWLEDGE_MANIFEST_PATH = os.path.join(KNOWLEDGE_DIR, 'generated_manifest.json')
+
 # Define the directory for the FAISS index
 INDEX_DIR = os.path.join(BASE_DIR, 'faiss_index')
 
+# Open index vectors with memory-map at query time. Loading always checks file sizes against
+# the manifest; full checksums are hashed at startup only when this flag is on (the indexer
+# always verifies them before modifying the index)
+INDEX_USE_MMAP = True
+INDEX_VERIFY_CHECKSUM = False
+
+# Local cache for downloaded HuggingFace models
+MODELS_CACHE_DIR = os.path.join(BASE_DIR, 'models_cache')
+
 # Define the embedding model name
 EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
 
+# Embedding backend: 'pytorch' (full precision), 'onnx' or 'onnx-int8' (dynamic int8 quantization)
+EMBEDDING_BACKEND = 'pytorch'
+# Quantized ONNX file inside the model repository, used by the 'onnx-int8' backend
+EMBEDDING_ONNX_INT8_FILE = 'onnx/model_quint8_avx2.onnx'
+
+# Hybrid retrieval: BM25 lexical index fused with the dense FAISS results
+HYBRID_SEARCH_ENABLED = True
+BM25_TOP_K = 5
+# Smoothing constant for reciprocal rank fusion
+RRF_K = 60
+
+# Product entity index: when a query names at most this many catalog products,
+# their chunks are fetched by id; vector search is skipped only for pure product/price lookups
+ENTITY_DIRECT_LOOKUP = True
+ENTITY_DIRECT_MAX_PRODUCTS = 3
+
+# Structured catalog engine: price range/sort/compare questions are answered
+# from catalogo.csv columns instead of vector search
+CATALOG_ENGINE_ENABLED = True
+# Columnar copy of catalogo.csv, rebuilt when the CSV changes
+CATALOG_CACHE_PATH = os.path.join(MODELS_CACHE_DIR, 'catalog.npz')
+
+# FAQ fast path: return the curated FAQs.csv answer without an LLM call when the
+# nearest FAQ question clears the similarity threshold
+FAQ_FAST_PATH_ENABLED = True
+# None uses the threshold calibrated when the index was built
+FAQ_FAST_PATH_THRESHOLD = None
+# Minimum precision the calibration must keep on FAQ variants and product queries
+FAQ_CALIBRATION_MIN_PRECISION = 0.98
+
+# Where indexer.py takes documents from: 'csv' builds them in memory from
+# catalogo.csv and FAQs.csv (plus hand-added .md files); 'markdown' reads every
+# .md file exported by prepare_knowledge_base.py
+INDEX_SOURCE = 'csv'
+# Keep exporting the markdown files on rebuild/update-csv (only required when INDEX_SOURCE = 'markdown')
+KNOWLEDGE_MARKDOWN_EXPORT = True
+
+# Index build pipeline (indexer.py): documents are read, chunked, embedded and
+# added to FAISS one batch at a time
+INDEX_DOCUMENTS_PER_BATCH = 64
+# Threads reading markdown files
+INDEX_LOADER_THREADS = 8
+# Processes for chunking; 0 or 1 splits in the main process (the pool only pays off on large bases)
+INDEX_SPLIT_PROCESSES = 0
+# Texts per forward pass of the embedding model when indexing
+EMBEDDING_BATCH_SIZE = 32
+# Encode with one sentence-transformers worker per CPU core when indexing
+EMBEDDING_MULTI_PROCESS = False
+
+# FAISS index type as a FAISS factory string: 'Flat' (exact, default), 'HNSW32',
+# 'IVF<nlist>,Flat' or 'IVF<nlist>,PQ<m>x<bits>'. Compare them with benchmark_index.py
+FAISS_INDEX_FACTORY = 'Flat'
+# Vectors used to train IVF/PQ indexes before the rest are added
+FAISS_TRAIN_SAMPLE_SIZE = 20000
+# Search-time parameters: inverted lists visited (IVF) and candidate list size (HNSW)
+FAISS_NPROBE = 8
+FAISS_HNSW_EF_SEARCH = 64
+
+# Embedding cache (in-memory LRU plus an optional on-disk tier)
+EMBEDDING_CACHE_SIZE = 4096
+# SQLite file for the on-disk tier; None disables it
+EMBEDDING_CACHE_DISK_PATH = None
+
+# Content-addressed embedding store reused across index rebuilds; None disables it
+EMBEDDING_STORE_DIR = os.path.join(MODELS_CACHE_DIR, 'embedding_store')
+
+# Semantic answer cache for process_query
+ANSWER_CACHE_ENABLED = True
+# Minimum cosine similarity between query embeddings to reuse a cached answer
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_MAX_ENTRIES = 512
+# Previous chat messages that must match for a hit; 0 ignores the history
+ANSWER_CACHE_HISTORY_TURNS = 2
+
+# HTTP chat service (server.py)
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8000
+# Threads for CPU-bound retrieval; the LLM is awaited on the event loop
+SERVER_RETRIEVAL_WORKERS = 4
+SERVER_MAX_SESSIONS = 10000
+
+# Query pipeline instrumentation (utils/metrics.py): per-stage spans, counters and
+# histograms. Disabled, each stage costs a single flag check
+METRICS_ENABLED = False
+# JSON lines file with one record per turn; None keeps metrics in memory only
+# (server.py also serves them at GET /metrics/prometheus)
+METRICS_JSONL_PATH = None
+
+# Profiling mode (--profile flag or CASAMUEBLE_PROFILE=1 on main.py, indexer.py and
+# manage_knowledge_base.py): cProfile + tracemalloc written as collapsed stacks
+PROFILE_ENV_VAR = 'CASAMUEBLE_PROFILE'
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+# Chat turns per profile in main.py; 0 writes a single profile when the session ends
+PROFILE_EVERY_TURNS = 0
+# Entries printed in the top-offenders summary and frames kept per allocation
+PROFILE_TOP = 20
+PROFILE_TRACEMALLOC_FRAMES = 25
+
+# Token budget for the retrieved context in the prompt (counted with the LLM tokenizer)
+CONTEXT_TOKEN_BUDGET = 1200
+TOKENIZER_ENCODING = 'cl100k_base'
+# Minimum cosine similarity for dense results; BM25 and product lookups are exempt
+CONTEXT_MIN_SIMILARITY = 0.2
+# Longest text repeated between chunks of the same file (splitter chunk_overlap plus margin)
+CONTEXT_MAX_OVERLAP_CHARS = 250
+
+# Conversation memory (utils/conversation_memory.py): recent turns kept verbatim,
+# older turns folded off the critical path into a bounded summary
+MEMORY_RECENT_TURNS = 3
+MEMORY_SUMMARY_MAX_CHARS = 1200
+# Products and topics mentioned by the customer appended to the retrieval query
+MEMORY_MAX_ENTITIES = 4
+# Summarize with the LLM (one extra call per folded turn); False keeps an extractive summary
+MEMORY_LLM_SUMMARY = False
+
 # Define error messages
 ERROR_MESSAGES = {
     'csv_error': 'Error al procesar los datos del catálogo.',
@@ -0,0 +1,184 @@
+"""
+Evalúa la recuperación de search_knowledge_base con consultas etiquetadas de FAQs.csv y catalogo.csv.
+
+Cada FAQ aporta su pregunta original, paráfrasis reales, una variante sin tildes ni signos y otra con
+un error de tipeo; cada producto aporta preguntas de precio y medidas, también sin tildes y con error
+de tipeo. El documento esperado es el que se genera desde la misma fila del CSV. Reporta recall@k y MRR
+por grupo y percentiles de latencia por etapa de la búsqueda, en JSON, para comparar cambios de
+recuperación o de índice contra datos y no contra impresiones.
+"""
+import re
+import json
+import logging
+import argparse
+from typing import List, Dict, Any, Optional, Set
+
+import numpy as np
+
+import main as chatbot
+from indexer import source_key
+from prepare_knowledge_base import iter_csv_documents
+from utils import metrics
+from utils.bm25 import fold_accents
+from utils.faq_index import CALIBRATION_PARAPHRASES, typo_variant
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SOURCE_PATTERN = re.compile(r"\[Fuente: (.*)\]\s*$")
+
+PRODUCT_TEMPLATES = ["¿Cuánto cuesta el {name}?", "¿Qué medidas tiene el {name}?"]
+
+
+def build_cases() -> List[Dict[str, Any]]:
+    """
+    Arma las consultas etiquetadas a partir de los documentos que se indexan desde los CSV.
+    
+    Returns:
+        List[Dict[str, Any]]: Casos con 'query', 'group' ("faq/typo", "producto/original", ...)
+        y 'targets' (claves de fuente aceptadas como acierto)
+    """
+    faqs = []
+    products = []
+    for doc in iter_csv_documents():
+        if doc.metadata.get("tipo") == "faq":
+            faqs.append(doc)
+        elif doc.metadata.get("tipo") == "producto":
+            products.append(doc)
+    
+    # Las FAQs duplicadas en el CSV comparten respuesta: cualquiera de ellas es un acierto
+    answers = [fold_accents(doc.page_content.split("\n\n")[1]) for doc in faqs]
+    sources_by_answer: Dict[str, Set[str]] = {}
+    for doc, answer in zip(faqs, answers):
+        sources_by_answer.setdefault(answer, set()).add(source_key(doc.metadata["source"]))
+    
+    cases = []
+    for doc, answer in zip(faqs, answers):
+        question = doc.metadata["pregunta"]
+        targets = sources_by_answer[answer]
+        variants = {"original": [question], "paraphrase": CALIBRATION_PARAPHRASES.get(question, []),
+                    "folded": [fold_accents(question.strip("¿? "))]}
+        typo = typo_variant(fold_accents(question.strip("¿? ")))
+        variants["typo"] = [typo] if typo else []
+        cases.extend(case("faq", kind, query, targets) for kind, queries in variants.items() for query in queries)
+    
+    for doc in products:
+        name = doc.metadata["producto"]
+        targets = {source_key(doc.metadata["source"])}
+        typo = typo_variant(name)
+        for template in PRODUCT_TEMPLATES:
+            query = template.format(name=name)
+            cases.append(case("producto", "original", query, targets))
+            cases.append(case("producto", "folded", fold_accents(query.strip("¿? ")), targets))
+            if typo:
+                cases.append(case("producto", "typo", template.format(name=typo), targets))
+    
+    return cases
+
+
+def case(source_type: str, kind: str, query: str, targets: Set[str]) -> Dict[str, Any]:
+    """Arma un caso etiquetado."""
+    return {"query": query, "group": f"{source_type}/{kind}", "targets": targets}
+
+
+def first_hit_rank(contexts: List[str], targets: Set[str]) -> Optional[int]:
+    """
+    Posición (desde 1) del primer contexto que proviene de un documento esperado.
+    
+    Args:
+        contexts (List[str]): Contextos devueltos por search_knowledge_base, con su línea [Fuente: ...]
+        targets (Set[str]): Claves de fuente aceptadas
+    
+    Returns:
+        Optional[int]: Posición del primer acierto, o None si no hay ninguno
+    """
+    for rank, context in enumerate(contexts, start=1):
+        match = SOURCE_PATTERN.search(context)
+        if match and source_key(match.group(1)) in targets:
+            return rank
+    return None
+
+
+def summarize_latencies(latencies: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    """Percentiles p50/p90/p99 en milisegundos y cantidad de llamadas por etapa."""
+    return {
+        stage: {
+            "calls": len(values),
+            **{f"p{p}_ms": round(float(np.percentile(values, p)) * 1000, 3) for p in (50, 90, 99)},
+        }
+        for stage, values in latencies.items()
+    }
+
+
+def retrieval_metrics(ranks: List[Optional[int]], ks: List[int]) -> Dict[str, float]:
+    """recall@k y MRR de una lista de posiciones del primer acierto."""
+    metrics = {"cases": len(ranks)}
+    for k in ks:
+        metrics[f"recall@{k}"] = round(float(np.mean([rank is not None and rank <= k for rank in ranks])), 4)
+    metrics["mrr"] = round(float(np.mean([1.0 / rank if rank else 0.0 for rank in ranks])), 4)
+    return metrics
+
+
+def run_evaluation(ks: List[int], max_misses: int) -> Dict[str, Any]:
+    """
+    Ejecuta todas las consultas etiquetadas contra search_knowledge_base.
+    
+    Args:
+        ks (List[int]): Valores de k para recall@k; el mayor es el k pedido a la búsqueda
+        max_misses (int): Cantidad máxima de consultas fallidas a incluir en el reporte
+    
+    Returns:
+        Dict[str, Any]: Métricas globales, por grupo, latencias por etapa y ejemplos de fallos
+    """
+    cases = build_cases()
+    logger.info(f"Casos de evaluación: {len(cases)}")
+    
+    embeddings = chatbot.load_embeddings()
+    vector_db = chatbot.load_vector_db(embeddings)
+    
+    # Las etapas se miden con los spans de utils.metrics (entity_lookup, expand_query, embedding, ...)
+    metrics.configure(True)
+    latencies: Dict[str, List[float]] = {}
+    ranks: List[Optional[int]] = []
+    for item in cases:
+        with metrics.turn("eval") as record:
+            contexts = chatbot.search_knowledge_base(item["query"], vector_db, k=max(ks))
+        for stage in record["spans"]:
+            latencies.setdefault(stage["stage"], []).append(stage["ms"] / 1000)
+        latencies.setdefault("total", []).append(record["ms"] / 1000)
+        ranks.append(first_hit_rank(contexts, item["targets"]))
+    
+    by_group: Dict[str, List[Optional[int]]] = {}
+    for item, rank in zip(cases, ranks):
+        by_group.setdefault(item["group"], []).append(rank)
+    
+    return {
+        "k": ks,
+        "overall": retrieval_metrics(ranks, ks),
+        "groups": {group: retrieval_metrics(group_ranks, ks) for group, group_ranks in sorted(by_group.items())},
+        "latency": summarize_latencies(latencies),
+        "misses": [
+            {"query": item["query"], "group": item["group"], "targets": sorted(item["targets"])}
+            for item, rank in zip(cases, ranks) if rank is None
+        ][:max_misses],
+    }
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Evalúa la recuperación con consultas etiquetadas de los CSV")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5], help="Valores de k para recall@k")
+    parser.add_argument("--misses", type=int, default=20, help="Consultas fallidas a listar en el reporte")
+    parser.add_argument("--output", help="Archivo donde guardar además el reporte JSON")
+    args = parser.parse_args()
+    
+    report = json.dumps(run_evaluation(sorted(args.k), args.misses), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,48 @@ Script para indexar la base de conocimientos de CASA DEL MUEBLE en un índice FA
 Vectoriza documentos para la búsqueda semántica de información sobre muebles de hierro.
 """
 import os
+import re
+import json
+import time
 import logging
+import argparse
+from contextlib import nullcontext
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 
-from langchain_community.document_loaders.directory import DirectoryLoader
+import numpy as np
+import pandas as pd
 from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores.faiss import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-from config import KNOWLEDGE_DIR, INDEX_DIR, EMBEDDING_MODEL_NAME
+from config import (
+    KNOWLEDGE_DIR, INDEX_DIR, CATALOGO_PATH, FAQS_PATH, KNOWLEDGE_MANIFEST_PATH, EMBEDDING_MODEL_NAME, MODELS_CACHE_DIR,
+    EMBEDDING_BACKEND, EMBEDDING_ONNX_INT8_FILE,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DISK_PATH, EMBEDDING_STORE_DIR,
+    FAQ_CALIBRATION_MIN_PRECISION,
+    INDEX_SOURCE, INDEX_DOCUMENTS_PER_BATCH, INDEX_LOADER_THREADS, INDEX_SPLIT_PROCESSES,
+    EMBEDDING_BATCH_SIZE, EMBEDDING_MULTI_PROCESS,
+    FAISS_INDEX_FACTORY, FAISS_TRAIN_SAMPLE_SIZE, FAISS_NPROBE, FAISS_HNSW_EF_SEARCH,
+    METRICS_ENABLED, METRICS_JSONL_PATH,
+    PROFILE_ENV_VAR, PROFILE_DIR, PROFILE_TOP, PROFILE_TRACEMALLOC_FRAMES
+)
+from utils import metrics
+from utils.embedding_backends import create_embedding_model, embedding_model_key
+from utils.embedding_cache import CachedEmbeddings
+from utils.embedding_store import EmbeddingStore
+from utils.entity_index import EntityIndex
+from utils.faiss_factory import create_vector_store, needs_training, supports_removal
+from utils.faq_index import FAQ_INDEX_FILE, FAQIndex, read_faqs
+from utils.bm25 import BM25Index
 from utils.error_handlers import error_handler
+from prepare_knowledge_base import FAQS_DIR, GENERATED_FILE_PATTERN, iter_csv_documents
+from utils.index_store import load_index as load_stored_index, save_native_index
+from utils.profiling import requested_profiler
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -44,31 +74,114 @@ def validate_directories() -> bool:
         return False
 
 
-def load_documents() -> List[Dict[str, Any]]:
+def list_knowledge_files() -> List[str]:
     """
-    Carga los documentos desde el directorio de conocimientos.
+    Lista los archivos markdown de la base de conocimientos en orden estable.
     
     Returns:
-        List[Dict[str, Any]]: Lista de documentos cargados
+        List[str]: Rutas de los archivos .md
     """
-    logger.info(f"Cargando documentos desde: {KNOWLEDGE_DIR}")
+    return sorted(str(path) for path in Path(KNOWLEDGE_DIR).glob("**/*.md"))
+
+
+def read_markdown(path: str) -> List[Document]:
+    """Lee un archivo markdown como documento."""
+    return TextLoader(path, encoding="utf-8").load()
+
+
+def list_source_markdown_files() -> List[str]:
+    """
+    Archivos markdown que hay que leer de disco según INDEX_SOURCE.
     
-    try:
-        loader = DirectoryLoader(
-            KNOWLEDGE_DIR,
-            glob="**/*.md",
-            loader_cls=TextLoader,
-            show_progress=True
-        )
+    Con INDEX_SOURCE = 'csv' los archivos exportados por prepare_knowledge_base se omiten
+    (sus documentos salen directo de los CSV); solo se leen los agregados a mano.
+    
+    Returns:
+        List[str]: Rutas de los archivos .md a indexar
+    """
+    return [path for path in list_knowledge_files() if not is_csv_generated(path)]
+
+
+def is_csv_generated(path: str) -> bool:
+    """Indica si el archivo es un markdown exportado desde los CSV y el índice se arma directo de los CSV."""
+    return INDEX_SOURCE == "csv" and bool(GENERATED_FILE_PATTERN.match(os.path.basename(path)))
+
+
+def iter_markdown_documents(paths: List[str], loader: Executor,
+                            batch_size: int = INDEX_DOCUMENTS_PER_BATCH) -> Iterator[Document]:
+    """
+    Lee los archivos por lotes; mientras se consume un lote, el siguiente ya se está leyendo.
+    
+    Args:
+        paths (List[str]): Archivos a leer
+        loader (Executor): Pool de hilos para la lectura
+        batch_size (int, optional): Archivos por lote
+        
+    Yields:
+        Document: Un documento por archivo, en el orden de paths
+    """
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    pending = [loader.submit(read_markdown, path) for path in batches[0]] if batches else []
+    
+    for next_batch in batches[1:] + [None]:
+        documents = [doc for future in pending for doc in future.result()]
+        pending = [loader.submit(read_markdown, path) for path in next_batch] if next_batch else []
+        yield from documents
+
+
+def iter_source_documents(loader: Executor) -> Iterator[Document]:
+    """
+    Genera todos los documentos a indexar: los de los CSV en memoria (si INDEX_SOURCE = 'csv') y los markdown.
+    
+    Args:
+        loader (Executor): Pool de hilos para leer los markdown
         
-        documents = loader.load()
-        logger.info(f"Se cargaron {len(documents)} documentos")
+    Yields:
+        Document: Documentos de la base de conocimientos
+    """
+    if INDEX_SOURCE == "csv":
+        yield from iter_csv_documents()
+    yield from iter_markdown_documents(list_source_markdown_files(), loader)
+
+
+def make_text_splitter() -> RecursiveCharacterTextSplitter:
+    """Divisor de texto usado tanto en la indexación completa como en la incremental."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        length_function=len,
+    )
+
+
+def split_batch(documents: List[Document]) -> List[Document]:
+    """Divide un grupo de documentos en chunks; se ejecuta dentro del pool de procesos."""
+    return make_text_splitter().split_documents(documents)
+
+
+def split_in_pool(documents: List[Document], pool: Optional[Executor]) -> List[Document]:
+    """
+    Divide los documentos de un lote repartiéndolos entre los procesos del pool.
+    
+    Args:
+        documents (List[Document]): Documentos del lote
+        pool (Optional[Executor]): Pool de procesos, o None para dividir en este proceso
         
-        return documents
+    Returns:
+        List[Document]: Chunks en el orden de los documentos
+    """
+    if pool is None or len(documents) < 2:
+        return split_batch(documents)
     
-    except Exception as e:
-        logger.error(f"Error al cargar documentos: {str(e)}")
-        raise
+    parts = min(INDEX_SPLIT_PROCESSES, len(documents))
+    groups = [documents[i::parts] for i in range(parts)]
+    chunks_by_group = list(pool.map(split_batch, groups))
+    
+    # Recuperar el orden original de los documentos (los grupos se repartieron de forma intercalada)
+    by_source: Dict[str, List[Document]] = {}
+    for chunks in chunks_by_group:
+        for chunk in chunks:
+            by_source.setdefault(chunk.metadata.get("source", ""), []).append(chunk)
+    return [chunk for doc in documents for chunk in by_source.pop(doc.metadata.get("source", ""), [])]
 
 
 def split_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -84,13 +197,7 @@ def split_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     logger.info("Dividiendo documentos en chunks")
     
     try:
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
-        
-        split_docs = text_splitter.split_documents(documents)
+        split_docs = make_text_splitter().split_documents(documents)
         logger.info(f"Documentos divididos en {len(split_docs)} chunks")
         
         return split_docs
@@ -100,58 +207,322 @@ def split_documents(documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         raise
 
 
-def load_embeddings() -> HuggingFaceEmbeddings:
+def load_embeddings() -> CachedEmbeddings:
     """
-    Carga el modelo de embeddings.
+    Carga el modelo de embeddings envuelto en una caché LRU.
     
     Returns:
-        HuggingFaceEmbeddings: Modelo de embeddings cargado
+        CachedEmbeddings: Modelo de embeddings cargado con caché
     """
     logger.info(f"Cargando modelo de embeddings: {EMBEDDING_MODEL_NAME}")
     
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME,
-            cache_folder=os.path.join(os.path.dirname(INDEX_DIR), "models_cache")
+        embeddings = create_embedding_model(
+            EMBEDDING_MODEL_NAME,
+            MODELS_CACHE_DIR,
+            backend=EMBEDDING_BACKEND,
+            onnx_int8_file=EMBEDDING_ONNX_INT8_FILE,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            multi_process=EMBEDDING_MULTI_PROCESS
         )
         
-        return embeddings
+        return CachedEmbeddings(
+            embeddings,
+            embedding_model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND),
+            max_size=EMBEDDING_CACHE_SIZE,
+            disk_path=EMBEDDING_CACHE_DISK_PATH
+        )
     
     except Exception as e:
         logger.error(f"Error al cargar modelo de embeddings: {str(e)}")
         raise
 
 
-def create_index(documents: List[Dict[str, Any]], embeddings: HuggingFaceEmbeddings) -> Optional[FAISS]:
+def load_embedding_store() -> Optional[EmbeddingStore]:
+    """
+    Abre el almacén persistente de embeddings si está configurado.
+    
+    Returns:
+        Optional[EmbeddingStore]: Almacén abierto o None si está deshabilitado
+    """
+    if not EMBEDDING_STORE_DIR:
+        return None
+    
+    return EmbeddingStore(EMBEDDING_STORE_DIR, embedding_model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND))
+
+
+def embed_chunks(documents: List[Dict[str, Any]], embeddings: Embeddings,
+                 store: Optional[EmbeddingStore] = None) -> List[List[float]]:
+    """
+    Vectoriza los chunks consultando primero el almacén persistente.
+    
+    Args:
+        documents (List[Dict[str, Any]]): Chunks a vectorizar
+        embeddings (Embeddings): Modelo de embeddings
+        store (Optional[EmbeddingStore], optional): Almacén de embeddings ya calculados
+        
+    Returns:
+        List[List[float]]: Un vector por chunk
+    """
+    texts = [doc.page_content for doc in documents]
+    if store is None:
+        return embeddings.embed_documents(texts)
+    
+    return store.embed(texts, embeddings)
+
+
+def build_index(documents: Iterable[Document], embeddings: Embeddings,
+                store: Optional[EmbeddingStore] = None) -> Optional[FAISS]:
     """
-    Crea un índice FAISS a partir de los documentos y embeddings.
+    Construye el índice FAISS por lotes: división en procesos y vectorización por lotes.
+    
+    Los documentos se consumen de a INDEX_DOCUMENTS_PER_BATCH y cada lote se agrega al índice
+    antes de pedir el siguiente, así nunca se tienen en memoria todos los chunks y sus vectores a la vez.
     
     Args:
-        documents (List[Dict[str, Any]]): Lista de documentos procesados
-        embeddings (HuggingFaceEmbeddings): Modelo de embeddings
+        documents (Iterable[Document]): Documentos a indexar (ver iter_source_documents)
+        embeddings (Embeddings): Modelo de embeddings
+        store (Optional[EmbeddingStore], optional): Almacén para reutilizar vectores de chunks sin cambios
         
     Returns:
-        Optional[FAISS]: Índice FAISS creado o None si hay un error
+        Optional[FAISS]: Índice FAISS creado, o None si no hay chunks
     """
-    logger.info("Creando índice FAISS")
+    logger.info(f"Creando índice FAISS en lotes de {INDEX_DOCUMENTS_PER_BATCH} documentos (origen: {INDEX_SOURCE})")
+    
+    db = None
+    # Lotes retenidos hasta juntar la muestra de entrenamiento (solo para índices que se entrenan)
+    pending: List[Tuple[List[Document], List[List[float]]]] = []
+    pending_vectors = 0
+    total_documents = total_chunks = total_bytes = 0
+    start = time.perf_counter()
+    split_pool = ProcessPoolExecutor(max_workers=INDEX_SPLIT_PROCESSES) if INDEX_SPLIT_PROCESSES > 1 else None
+    documents = iter(documents)
+    batches = iter(lambda: list(islice(documents, INDEX_DOCUMENTS_PER_BATCH)), [])
     
     try:
-        db = FAISS.from_documents(documents, embeddings)
-        logger.info("Índice FAISS creado exitosamente")
+        for batch_number, batch in enumerate(batches, start=1):
+            chunks = split_in_pool(batch, split_pool)
+            if chunks:
+                vectors = embed_chunks(chunks, embeddings, store)
+                if db is not None:
+                    add_chunks(db, chunks, vectors)
+                else:
+                    pending.append((chunks, vectors))
+                    pending_vectors += len(vectors)
+                    if (pending_vectors >= FAISS_TRAIN_SAMPLE_SIZE
+                            or not needs_training(FAISS_INDEX_FACTORY, len(vectors[0]))):
+                        db = create_store_from_pending(pending, embeddings)
+                        pending = []
+            
+            total_documents += len(batch)
+            total_chunks += len(chunks)
+            total_bytes += sum(len(doc.page_content.encode("utf-8")) for doc in batch)
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            logger.info(
+                f"Lote {batch_number}: {total_documents} documentos, {total_chunks} chunks "
+                f"({total_chunks / elapsed:.1f} chunks/s, {total_bytes / elapsed / 1e6:.2f} MB/s)"
+            )
+    finally:
+        if split_pool is not None:
+            split_pool.shutdown()
+    
+    # Si la base completa no llegó al tamaño de muestra, se entrena con todo lo que hay
+    if db is None and pending:
+        db = create_store_from_pending(pending, embeddings)
+    
+    logger.info(f"Índice FAISS ({FAISS_INDEX_FACTORY}) creado: {total_chunks} chunks en {time.perf_counter() - start:.2f} s")
+    return db
+
+
+def add_chunks(db: FAISS, chunks: List[Document], vectors: List[List[float]]) -> List[str]:
+    """Agrega al índice los chunks con sus vectores ya calculados y devuelve sus ids de docstore."""
+    return db.add_embeddings(
+        [(chunk.page_content, vector) for chunk, vector in zip(chunks, vectors)],
+        metadatas=[chunk.metadata for chunk in chunks]
+    )
+
+
+def create_store_from_pending(pending: List[Tuple[List[Document], List[List[float]]]],
+                              embeddings: Embeddings) -> FAISS:
+    """
+    Crea la base vectorial del tipo configurado, entrenándola con los lotes retenidos, y les agrega esos lotes.
+    
+    Args:
+        pending (List[Tuple[List[Document], List[List[float]]]]): Chunks y vectores retenidos
+        embeddings (Embeddings): Modelo de embeddings
         
-        return db
+    Returns:
+        FAISS: Base vectorial con los lotes agregados
+    """
+    sample = np.asarray([vector for _, vectors in pending for vector in vectors], dtype=np.float32)
+    db = create_vector_store(FAISS_INDEX_FACTORY, embeddings, sample[:FAISS_TRAIN_SAMPLE_SIZE],
+                             nprobe=FAISS_NPROBE, ef_search=FAISS_HNSW_EF_SEARCH)
+    for chunks, vectors in pending:
+        add_chunks(db, chunks, vectors)
+    return db
+
+
+def build_lexical_index(db: FAISS) -> BM25Index:
+    """
+    Construye el índice BM25 con los mismos chunks del índice FAISS.
     
-    except Exception as e:
-        logger.error(f"Error al crear índice FAISS: {str(e)}")
-        raise
+    Args:
+        db (FAISS): Índice FAISS
+        
+    Returns:
+        BM25Index: Índice léxico identificado por los ids de docstore
+    """
+    ids = [db.index_to_docstore_id[position] for position in range(db.index.ntotal)]
+    texts = [db.docstore.search(docstore_id).page_content for docstore_id in ids]
+    
+    return BM25Index.build(ids, texts)
+
+
+def load_catalog_product_names() -> List[str]:
+    """
+    Lee los nombres de producto de catalogo.csv.
+    
+    Returns:
+        List[str]: Nombres de producto en el orden del catálogo
+    """
+    df = pd.read_csv(CATALOGO_PATH)
+    columns = df.columns.tolist()
+    producto_col = next((col for col in columns if 'producto' in col.lower() or 'nombre' in col.lower()), columns[0])
+    
+    return [str(name).strip() for name in df[producto_col].dropna() if str(name).strip()]
+
+
+def chunk_ids_by_product(db: FAISS, docstore_ids: List[str], product_names: List[str]) -> Dict[str, List[str]]:
+    """
+    Agrupa chunks del índice por producto del catálogo.
+    
+    Los chunks se asocian a cada producto por su metadato 'producto' (documentos generados
+    desde el CSV) o por el nombre de archivo que genera prepare_knowledge_base (producto_<n>_<nombre>.md).
+    
+    Args:
+        db (FAISS): Índice FAISS
+        docstore_ids (List[str]): Ids de docstore de los chunks a agrupar
+        product_names (List[str]): Nombres de producto de catalogo.csv
+        
+    Returns:
+        Dict[str, List[str]]: Ids de docstore de los chunks de cada producto
+    """
+    names_by_slug = {name.lower().replace(' ', '_').replace('/', '_'): name for name in product_names}
+    
+    chunk_ids: Dict[str, List[str]] = {}
+    for docstore_id in docstore_ids:
+        doc = db.docstore.search(docstore_id)
+        name = doc.metadata.get("producto")
+        if name is None:
+            match = re.match(r"producto_\d+_(.+)\.md$", os.path.basename(source_key(doc.metadata.get("source", ""))))
+            name = names_by_slug.get(match.group(1)) if match else None
+        if name in product_names:
+            chunk_ids.setdefault(name, []).append(docstore_id)
+    
+    return chunk_ids
+
+
+def build_entity_index(db: FAISS) -> EntityIndex:
+    """
+    Construye el índice de entidades de producto con los ids de sus chunks.
+    
+    Args:
+        db (FAISS): Índice FAISS
+        
+    Returns:
+        EntityIndex: Índice de entidades listo para guardar
+    """
+    product_names = load_catalog_product_names()
+    docstore_ids = [db.index_to_docstore_id[position] for position in range(db.index.ntotal)]
+    
+    return EntityIndex.build(product_names, chunk_ids_by_product(db, docstore_ids, product_names))
+
+
+def build_faq_index(db: FAISS) -> Optional[FAQIndex]:
+    """
+    Vectoriza las preguntas de FAQs.csv y calibra el umbral del atajo de FAQs.
+    
+    Las consultas de precio y medidas de cada producto del catálogo se usan como negativos:
+    nunca deben responderse con una FAQ.
+    
+    Args:
+        db (FAISS): Índice FAISS, del que se toma el modelo de embeddings
+        
+    Returns:
+        Optional[FAQIndex]: Índice de FAQs, o None si no existe FAQs.csv
+    """
+    if not os.path.exists(FAQS_PATH):
+        return None
+    
+    negatives = []
+    if os.path.exists(CATALOGO_PATH):
+        for name in load_catalog_product_names():
+            negatives.extend([f"¿Cuánto cuesta el {name}?", f"¿Qué medidas tiene el {name}?"])
+    
+    return FAQIndex.build(
+        read_faqs(FAQS_PATH),
+        db.embedding_function,
+        embedding_model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND),
+        negatives=negatives,
+        min_precision=FAQ_CALIBRATION_MIN_PRECISION
+    )
 
 
-def save_index(db: FAISS) -> bool:
+def is_faq_source(key: str) -> bool:
+    """Indica si una clave de fuente (ver source_key) corresponde a una FAQ."""
+    return key.startswith(f"{os.path.basename(FAQS_DIR)}/")
+
+
+def update_auxiliary_indexes(db: FAISS, changes: Dict[str, List[str]]) -> None:
     """
-    Guarda el índice FAISS en el directorio especificado.
+    Aplica a los índices auxiliares guardados solo los chunks que cambiaron en una sincronización.
+    
+    BM25 y entidades se actualizan con los chunks quitados y agregados; el de FAQs se vuelve a
+    vectorizar solo si cambió alguna FAQ o el catálogo renombró productos. Los índices que faltan
+    o son de otra versión se reconstruyen completos.
+    
+    Args:
+        db (FAISS): Índice FAISS ya actualizado
+        changes (Dict[str, List[str]]): 'removed' y 'added' (ids de docstore) y 'sources' (claves de fuente)
+    """
+    added_texts = [db.docstore.search(docstore_id).page_content for docstore_id in changes["added"]]
+    
+    with metrics.span("build_lexical_index"):
+        lexical_index = BM25Index.load(INDEX_DIR)
+        if lexical_index is None:
+            lexical_index = build_lexical_index(db)
+        else:
+            lexical_index = lexical_index.updated(changes["removed"], changes["added"], added_texts)
+        lexical_index.save(INDEX_DIR)
+    
+    product_names = load_catalog_product_names()
+    with metrics.span("build_entity_index"):
+        entity_index = EntityIndex.load(INDEX_DIR)
+        products_changed = entity_index is None or entity_index.names() != product_names
+        if products_changed:
+            entity_index = build_entity_index(db)
+        else:
+            entity_index.update_chunks(changes["removed"], chunk_ids_by_product(db, changes["added"], product_names))
+        entity_index.save(INDEX_DIR)
+    
+    faqs_changed = any(is_faq_source(key) for key in changes["sources"])
+    if faqs_changed or products_changed or not os.path.exists(os.path.join(INDEX_DIR, FAQ_INDEX_FILE)):
+        with metrics.span("build_faq_index"):
+            faq_index = build_faq_index(db)
+            if faq_index is not None:
+                faq_index.save(INDEX_DIR)
+    else:
+        logger.info("Sin cambios en las FAQs: se conserva el índice de preguntas frecuentes")
+
+
+def save_index(db: FAISS, changes: Optional[Dict[str, List[str]]] = None) -> bool:
+    """
+    Guarda el índice FAISS y los índices auxiliares (BM25, entidades y FAQs) en el directorio especificado.
     
     Args:
         db (FAISS): Índice FAISS a guardar
+        changes (Optional[Dict[str, List[str]]], optional): Cambios de una sincronización incremental
+            (ver update_auxiliary_indexes); si no se indican, los índices auxiliares se reconstruyen completos
         
     Returns:
         bool: True si el guardado es exitoso, False en caso contrario
@@ -159,7 +530,19 @@ def save_index(db: FAISS) -> bool:
     logger.info(f"Guardando índice FAISS en: {INDEX_DIR}")
     
     try:
-        db.save_local(INDEX_DIR)
+        with metrics.span("save_native_index"):
+            save_native_index(db, INDEX_DIR)
+        if changes is not None:
+            update_auxiliary_indexes(db, changes)
+        else:
+            with metrics.span("build_lexical_index"):
+                build_lexical_index(db).save(INDEX_DIR)
+            with metrics.span("build_entity_index"):
+                build_entity_index(db).save(INDEX_DIR)
+            with metrics.span("build_faq_index"):
+                faq_index = build_faq_index(db)
+                if faq_index is not None:
+                    faq_index.save(INDEX_DIR)
         logger.info(f"Índice guardado exitosamente en: {INDEX_DIR}")
         
         return True
@@ -169,33 +552,293 @@ def save_index(db: FAISS) -> bool:
         return False
 
 
+def source_key(source: str) -> str:
+    """
+    Normaliza la ruta de un documento a una clave relativa a la base de conocimientos.
+    
+    Las rutas guardadas en el índice pueden venir de otra máquina (por ejemplo, Windows),
+    por eso se comparan a partir de la carpeta knowledge_base.
+    
+    Args:
+        source (str): Ruta del archivo tal como figura en la metadata 'source'
+        
+    Returns:
+        str: Ruta relativa con separadores '/'
+    """
+    normalized = source.replace("\\", "/")
+    marker = f"{os.path.basename(KNOWLEDGE_DIR)}/"
+    if marker in normalized:
+        return normalized.split(marker, 1)[1]
+    return os.path.basename(normalized)
+
+
+def load_index(embeddings: Embeddings) -> Optional[FAISS]:
+    """
+    Carga el índice FAISS existente para modificarlo de forma incremental.
+    
+    Args:
+        embeddings (Embeddings): Modelo de embeddings
+        
+    Returns:
+        Optional[FAISS]: Índice cargado o None si todavía no existe
+    """
+    # Sin memory-map: los vectores mapeados son de solo lectura. Se verifican los checksums
+    # completos para no modificar un índice dañado
+    return load_stored_index(INDEX_DIR, embeddings, use_mmap=False, verify=True)
+
+
+def indexed_chunks_by_source(db: FAISS) -> Dict[str, Dict[str, str]]:
+    """
+    Agrupa los chunks indexados por archivo de origen.
+    
+    Args:
+        db (FAISS): Índice FAISS cargado
+        
+    Returns:
+        Dict[str, Dict[str, str]]: Para cada clave de archivo, sus ids de docstore y textos
+    """
+    by_source: Dict[str, Dict[str, str]] = {}
+    for docstore_id in db.index_to_docstore_id.values():
+        doc = db.docstore.search(docstore_id)
+        if isinstance(doc, str):
+            continue
+        key = source_key(doc.metadata.get("source", ""))
+        by_source.setdefault(key, {})[docstore_id] = doc.page_content
+    
+    return by_source
+
+
+def sync_files(paths: List[str], embeddings: Optional[Embeddings] = None, db: Optional[FAISS] = None) -> Dict[str, Any]:
+    """
+    Actualiza el índice solo para los archivos indicados.
+    
+    Los archivos que ya no existen se quitan del índice. Con INDEX_SOURCE = 'csv', los markdown
+    exportados por prepare_knowledge_base no son fuentes del índice: sus chunks se vuelven a armar
+    desde la fila del CSV, que sigue mandando aunque el archivo se haya editado o borrado.
+    
+    Args:
+        paths (List[str]): Rutas de los archivos agregados, modificados o eliminados
+        embeddings (Optional[Embeddings], optional): Modelo de embeddings ya cargado
+        db (Optional[FAISS], optional): Índice ya cargado; si no se indica, se lee de disco
+        
+    Returns:
+        Dict[str, Any]: Resultado de la sincronización (ver sync_documents)
+    """
+    csv_documents: Dict[str, List[Document]] = {}
+    if any(is_csv_generated(path) for path in paths):
+        logger.warning("Con INDEX_SOURCE = 'csv' los archivos faq_*.md y producto_*.md se indexan desde los CSV")
+        for doc in iter_csv_documents():
+            csv_documents.setdefault(source_key(doc.metadata["source"]), []).append(doc)
+    
+    documents = {}
+    for path in paths:
+        key = source_key(path)
+        if is_csv_generated(path):
+            documents[key] = csv_documents.get(key, [])
+        else:
+            documents[key] = read_markdown(path) if os.path.exists(path) else []
+    return sync_documents(documents, embeddings, db)
+
+
+def rebuild_full_index(reason: str) -> Dict[str, Any]:
+    """
+    Reconstruye el índice completo cuando no se puede actualizar de forma incremental.
+    
+    Args:
+        reason (str): Motivo de la reconstrucción, para el log
+        
+    Returns:
+        Dict[str, Any]: {'rebuilt': True, 'chunks': total de chunks del índice nuevo}
+        
+    Raises:
+        RuntimeError: Si la reconstrucción falla
+    """
+    logger.info(reason)
+    chunks = main()
+    if chunks is None:
+        raise RuntimeError("Falló la reconstrucción completa del índice")
+    
+    return {"rebuilt": True, "chunks": chunks}
+
+
+def sync_documents(documents: Dict[str, List[Document]], embeddings: Optional[Embeddings] = None,
+                   db: Optional[FAISS] = None) -> Dict[str, Any]:
+    """
+    Actualiza el índice solo para las fuentes indicadas.
+    
+    Los documentos de cada fuente se vuelven a dividir en chunks; se eliminan los vectores de
+    chunks que ya no están y se vectorizan únicamente los chunks nuevos o modificados.
+    
+    Args:
+        documents (Dict[str, List[Document]]): Documentos actuales por clave de fuente (ver source_key);
+            una lista vacía quita la fuente del índice
+        embeddings (Optional[Embeddings], optional): Modelo de embeddings ya cargado
+        db (Optional[FAISS], optional): Índice ya cargado; si no se indica, se lee de disco
+        
+    Returns:
+        Dict[str, Any]: Con 'rebuilt' = False, la cantidad de chunks agregados, eliminados y sin cambios;
+        con 'rebuilt' = True (no había índice o el tipo de índice no admite borrar), el total de
+        chunks del índice reconstruido en 'chunks'
+        
+    Raises:
+        RuntimeError: Si la reconstrucción completa falla
+    """
+    if embeddings is None:
+        embeddings = load_embeddings()
+    
+    if db is None:
+        db = load_index(embeddings)
+    if db is None:
+        return rebuild_full_index("No existe un índice previo, se construye completo")
+    
+    indexed = indexed_chunks_by_source(db)
+    stale_ids: List[str] = []
+    new_chunks = []
+    changed_sources: List[str] = []
+    unchanged = 0
+    
+    for key, source_documents in documents.items():
+        old_chunks = indexed.get(key, {})
+        chunks = split_documents(source_documents) if source_documents else []
+        
+        new_texts = {chunk.page_content for chunk in chunks}
+        old_texts = set(old_chunks.values())
+        stale = [docstore_id for docstore_id, text in old_chunks.items() if text not in new_texts]
+        fresh = [chunk for chunk in chunks if chunk.page_content not in old_texts]
+        stale_ids.extend(stale)
+        new_chunks.extend(fresh)
+        if stale or fresh:
+            changed_sources.append(key)
+        unchanged += len(new_texts & old_texts)
+    
+    if stale_ids and not supports_removal(db.index):
+        # HNSW no permite borrar e IVF no renumera las filas: se reconstruye
+        # (los vectores sin cambios salen del almacén)
+        return rebuild_full_index(f"El índice {type(db.index).__name__} no admite borrar vectores, se reconstruye completo")
+    
+    added_ids: List[str] = []
+    if stale_ids:
+        db.delete(stale_ids)
+    if new_chunks:
+        store = load_embedding_store()
+        added_ids = add_chunks(db, new_chunks, embed_chunks(new_chunks, embeddings, store))
+        if store is not None:
+            store.flush()
+    
+    if stale_ids or new_chunks:
+        save_index(db, {"removed": stale_ids, "added": added_ids, "sources": changed_sources})
+    
+    result = {"rebuilt": False, "added": len(new_chunks), "removed": len(stale_ids), "unchanged": unchanged}
+    logger.info(f"Sincronización incremental del índice: {result}")
+    
+    return result
+
+
+def sync_knowledge_base(embeddings: Optional[Embeddings] = None) -> Dict[str, Any]:
+    """
+    Sincroniza el índice con toda la base de conocimientos (CSV y/o markdown según INDEX_SOURCE).
+    
+    Incluye las fuentes que siguen indexadas pero ya no existen.
+    
+    Args:
+        embeddings (Optional[Embeddings], optional): Modelo de embeddings ya cargado
+        
+    Returns:
+        Dict[str, Any]: Resultado de la sincronización (ver sync_documents)
+    """
+    if embeddings is None:
+        embeddings = load_embeddings()
+    
+    documents: Dict[str, List[Document]] = {}
+    if INDEX_SOURCE == "csv":
+        for doc in iter_csv_documents():
+            documents.setdefault(source_key(doc.metadata["source"]), []).append(doc)
+    with ThreadPoolExecutor(max_workers=INDEX_LOADER_THREADS) as loader:
+        for doc in iter_markdown_documents(list_source_markdown_files(), loader):
+            documents.setdefault(source_key(doc.metadata["source"]), []).append(doc)
+    
+    db = load_index(embeddings)
+    if db is not None:
+        for key in indexed_chunks_by_source(db):
+            documents.setdefault(key, [])
+    
+    return sync_documents(documents, embeddings, db)
+
+
+def sync_from_manifest(embeddings: Optional[Embeddings] = None) -> Dict[str, Any]:
+    """
+    Aplica al índice solo los archivos que prepare_knowledge_base modificó o eliminó en su última corrida.
+    
+    Si no hay manifiesto, o si el índice se arma directo desde los CSV (INDEX_SOURCE = 'csv'),
+    sincroniza toda la base de conocimientos.
+    
+    Args:
+        embeddings (Optional[Embeddings], optional): Modelo de embeddings ya cargado
+        
+    Returns:
+        Dict[str, Any]: Resultado de la sincronización (ver sync_documents)
+    """
+    if INDEX_SOURCE == "csv" or not os.path.exists(KNOWLEDGE_MANIFEST_PATH):
+        return sync_knowledge_base(embeddings)
+    
+    with open(KNOWLEDGE_MANIFEST_PATH, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    
+    keys = manifest.get("changed", []) + manifest.get("deleted", [])
+    if not keys:
+        logger.info("El manifiesto no registra archivos modificados; el índice ya está al día")
+        return {"rebuilt": False, "added": 0, "removed": 0, "unchanged": 0}
+    
+    return sync_files([os.path.join(KNOWLEDGE_DIR, *key.split("/")) for key in keys], embeddings)
+
+
 @error_handler
-def main() -> None:
-    """Función principal para indexar la base de conocimientos."""
+def main() -> Optional[int]:
+    """
+    Función principal para indexar la base de conocimientos.
+    
+    Returns:
+        Optional[int]: Cantidad de chunks del índice guardado, o None si la indexación falló
+    """
     logger.info("Iniciando indexación de la base de conocimientos")
 
     # Validar directorios
     if not validate_directories():
         logger.error("Falló la validación de directorios")
-        return
-
-    # Cargar documentos
-    documents = load_documents()
-
-    # Dividir documentos
-    split_docs = split_documents(documents)
+        return None
 
     # Cargar embeddings
     embeddings = load_embeddings()
 
-    # Crear índice
-    db = create_index(split_docs, embeddings)
+    # Leer, dividir y vectorizar por lotes, reutilizando los vectores de chunks ya conocidos
+    store = load_embedding_store()
+    with ThreadPoolExecutor(max_workers=INDEX_LOADER_THREADS) as loader, metrics.span("build_index"):
+        db = build_index(iter_source_documents(loader), embeddings, store)
+    logger.info(f"Caché de embeddings: {embeddings.stats()}")
+    if store is not None:
+        store.flush()
+        report = store.report()
+        logger.info(
+            f"Almacén de embeddings: {report['hits']}/{report['hits'] + report['misses']} aciertos "
+            f"({report['hit_rate']:.1%}), ~{report['saved_seconds_estimate']} s ahorrados"
+        )
 
     # Guardar índice
     if db and save_index(db):
         logger.info("Indexación completada exitosamente")
-    else:
-        logger.error("Error en el proceso de indexación")
+        return db.index.ntotal
+    
+    logger.error("Error en el proceso de indexación")
+    return None
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Indexa la base de conocimientos en FAISS")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Perfilar CPU y memoria (también con {PROFILE_ENV_VAR}=1); se guarda en {PROFILE_DIR}")
+    args = parser.parse_args()
+    
+    metrics.configure(METRICS_ENABLED, METRICS_JSONL_PATH)
+    profiler = requested_profiler("indexer", args.profile, PROFILE_ENV_VAR, PROFILE_DIR, PROFILE_TOP,
+                                  PROFILE_TRACEMALLOC_FRAMES)
+    with profiler or nullcontext():
+        main()
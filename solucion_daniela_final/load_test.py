@@ -0,0 +1,351 @@
+"""
+Prueba de carga de punta a punta con un LLM simulado, sin llamadas externas.
+
+Lanza muchas sesiones concurrentes que reproducen conversaciones (del log de conversaciones si se
+indica, o sintéticas a partir de FAQs.csv y catalogo.csv) contra aprocess_query en el mismo proceso,
+o contra el servicio HTTP con --url. El LLM es StubLLM, con latencia al primer token y ritmo de tokens
+configurables, así lo que se satura es la parte de recuperación. Para cada nivel de concurrencia
+reporta en JSON el throughput, los percentiles de latencia y la evolución de CPU y RSS, lo que
+permite ubicar el punto de saturación de un nodo.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from aiohttp import ClientSession
+
+from config import FAQS_PATH, SERVER_RETRIEVAL_WORKERS
+from main import (
+    aprocess_query, create_answer_cache, create_conversation_memory, load_embeddings, load_vector_db,
+    read_catalog_product_names
+)
+from utils.faq_index import read_faqs
+from utils.stub_llm import StubLLM
+
+# Configurar logging
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Preguntas de seguimiento que dependen del historial, como en una conversación real
+FOLLOW_UPS = ["¿Y cuánto cuesta?", "¿Qué medidas tiene?", "¿Viene en otro color?", "¿Hacen envíos de ese producto?"]
+CATALOG_QUESTIONS = ["¿Qué tienen por menos de 200 mil?", "¿Cuál es el producto más barato?",
+                     "¿Qué fogoneros tienen?", "Busco un sillón de hierro con almohadón"]
+
+
+def read_conversation_log(path: str) -> List[List[str]]:
+    """
+    Lee los mensajes del cliente de cada conversación guardada por save_conversation_log.
+    
+    Args:
+        path (str): Ruta del log de conversaciones
+    
+    Returns:
+        List[List[str]]: Mensajes del cliente de cada conversación, en orden
+    """
+    conversations = []
+    current: Optional[List[str]] = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if line.startswith("=== Nueva conversación"):
+                current = []
+            elif line.startswith("=== Fin de la conversación"):
+                if current:
+                    conversations.append(current)
+                current = None
+            elif current is not None and line.startswith("Usuario: "):
+                current.append(line[len("Usuario: "):].strip())
+    
+    return conversations
+
+
+def synthetic_conversations(count: int, turns: int, seed: int) -> List[List[str]]:
+    """
+    Arma conversaciones con preguntas de FAQs.csv, productos del catálogo y seguimientos.
+    
+    Args:
+        count (int): Cantidad de conversaciones
+        turns (int): Mensajes por conversación
+        seed (int): Semilla, para que dos corridas usen las mismas conversaciones
+    
+    Returns:
+        List[List[str]]: Mensajes del cliente de cada conversación
+    """
+    rng = random.Random(seed)
+    questions = [faq["question"] for faq in read_faqs(FAQS_PATH)]
+    products = read_catalog_product_names()
+    
+    conversations = []
+    for _ in range(count):
+        messages = [f"Hola, ¿qué características tiene el {rng.choice(products)}?"]
+        while len(messages) < turns:
+            kind = rng.random()
+            if kind < 0.4:
+                messages.append(rng.choice(FOLLOW_UPS))
+            elif kind < 0.7:
+                messages.append(rng.choice(questions))
+            elif kind < 0.85:
+                messages.append(rng.choice(CATALOG_QUESTIONS))
+            else:
+                messages.append(f"¿Cuánto cuesta el {rng.choice(products)}?")
+        conversations.append(messages[:turns])
+    
+    return conversations
+
+
+def read_process_usage(pid: Optional[int] = None) -> Tuple[float, float]:
+    """
+    Segundos de CPU consumidos y RSS actual (en MB) de un proceso.
+    
+    Args:
+        pid (Optional[int], optional): Proceso a medir; None mide este proceso
+    
+    Returns:
+        Tuple[float, float]: Segundos de CPU (usuario + sistema) y RSS en MB (0 si no se puede medir)
+    """
+    proc = f"/proc/{pid or 'self'}"
+    if os.path.exists(proc):
+        with open(f"{proc}/stat", "r") as f:
+            # Los campos 14 y 15 (utime, stime) vienen después del nombre entre paréntesis
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"{proc}/statm", "r") as f:
+            rss_pages = int(f.read().split()[1])
+        ticks = os.sysconf("SC_CLK_TCK")
+        return (int(fields[11]) + int(fields[12])) / ticks, rss_pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    
+    # Sin /proc solo se puede medir este proceso, y del RSS solo el pico (resource no existe en Windows)
+    try:
+        import resource
+    except ImportError:
+        times = os.times()
+        return times.user + times.system, 0.0
+    
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss / (2 ** 20 if sys.platform == "darwin" else 1024)
+
+
+async def sample_resources(samples: List[Dict[str, float]], completed: List[float], interval: float,
+                           pid: Optional[int] = None) -> None:
+    """
+    Registra cada 'interval' segundos el uso de CPU, el RSS y las respuestas completadas.
+    
+    Args:
+        samples (List[Dict[str, float]]): Muestras, se completan en el lugar
+        completed (List[float]): Latencias de las respuestas terminadas hasta el momento
+        interval (float): Segundos entre muestras
+        pid (Optional[int], optional): Proceso a medir; None mide este proceso
+    """
+    start = last_time = time.perf_counter()
+    last_cpu, _ = read_process_usage(pid)
+    last_completed = 0
+    while True:
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        cpu, rss_mb = read_process_usage(pid)
+        samples.append({
+            "t_s": round(now - start, 2),
+            "cpu_percent": round((cpu - last_cpu) / (now - last_time) * 100, 1),
+            "rss_mb": round(rss_mb, 1),
+            "requests_per_s": round((len(completed) - last_completed) / (now - last_time), 2),
+        })
+        last_time, last_cpu, last_completed = now, cpu, len(completed)
+
+
+class InProcessTarget:
+    """Envía los mensajes a aprocess_query, con la misma memoria de conversación que el servicio."""
+
+    def __init__(self, vector_db, llm, answer_cache, workers: int):
+        self.vector_db = vector_db
+        self.llm = llm
+        self.answer_cache = answer_cache
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+
+    async def send(self, session: Dict[str, Any], message: str) -> str:
+        memory = session.get("memory")
+        if memory is None:
+            memory = session["memory"] = create_conversation_memory(self.vector_db, self.llm)
+        memory.add("user", message)
+        response = await aprocess_query(
+            message, self.vector_db, self.llm, memory.history(), self.answer_cache, self.executor,
+            retrieval_context=memory.retrieval_context()
+        )
+        memory.add("assistant", response)
+        return response
+
+    async def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+class HTTPTarget:
+    """Envía los mensajes al endpoint POST /chat de server.py."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/") + "/chat"
+        self.client = ClientSession()
+
+    async def send(self, session: Dict[str, Any], message: str) -> str:
+        payload = {"message": message, "session_id": session.get("session_id")}
+        async with self.client.post(self.url, json=payload) as response:
+            response.raise_for_status()
+            body = await response.json()
+        session["session_id"] = body["session_id"]
+        return body["response"]
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+async def run_level(target, conversations: List[List[str]], concurrency: int, sessions: int,
+                    think_time: float, sample_interval: float, pid: Optional[int]) -> Dict[str, Any]:
+    """
+    Ejecuta 'sessions' conversaciones con 'concurrency' sesiones activas a la vez.
+    
+    Args:
+        target: InProcessTarget o HTTPTarget
+        conversations (List[List[str]]): Conversaciones a reproducir (se recorren en ciclo)
+        concurrency (int): Sesiones simultáneas
+        sessions (int): Total de sesiones del nivel
+        think_time (float): Segundos de espera del cliente entre mensajes
+        sample_interval (float): Segundos entre muestras de CPU y RSS
+        pid (Optional[int]): Proceso a medir; None mide este proceso
+    
+    Returns:
+        Dict[str, Any]: Throughput, percentiles de latencia, errores y muestras de recursos
+    """
+    latencies: List[float] = []
+    errors = 0
+    samples: List[Dict[str, float]] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for number in range(sessions):
+        queue.put_nowait(conversations[number % len(conversations)])
+    
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            messages = queue.get_nowait()
+            session: Dict[str, Any] = {}
+            for message in messages:
+                start = time.perf_counter()
+                try:
+                    await target.send(session, message)
+                    latencies.append(time.perf_counter() - start)
+                except Exception as e:
+                    logger.warning(f"Error en la consulta '{message}': {str(e)}")
+                    errors += 1
+                if think_time:
+                    await asyncio.sleep(think_time)
+    
+    sampler = asyncio.create_task(sample_resources(samples, latencies, sample_interval, pid))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+    
+    result: Dict[str, Any] = {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+    if latencies:
+        result["latency_ms"] = {
+            f"p{p}": round(float(np.percentile(latencies, p)) * 1000, 1) for p in (50, 90, 95, 99)
+        }
+        result["latency_ms"]["max"] = round(max(latencies) * 1000, 1)
+    if samples:
+        result["cpu_percent_avg"] = round(float(np.mean([s["cpu_percent"] for s in samples])), 1)
+        result["rss_mb_peak"] = max(s["rss_mb"] for s in samples)
+    result["timeline"] = samples
+    
+    return result
+
+
+async def run_load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Carga los componentes (o se conecta al servicio) y recorre los niveles de concurrencia.
+    
+    Args:
+        args (argparse.Namespace): Opciones de la línea de comandos
+    
+    Returns:
+        Dict[str, Any]: Configuración de la corrida y resultados por nivel
+    """
+    if args.conversations:
+        conversations = read_conversation_log(args.conversations)
+        source = args.conversations
+    else:
+        conversations = synthetic_conversations(args.sessions, args.turns, args.seed)
+        source = "sintéticas"
+    if not conversations:
+        raise ValueError("No hay conversaciones para reproducir")
+    
+    if args.url:
+        target = HTTPTarget(args.url)
+    else:
+        embeddings = load_embeddings()
+        vector_db = load_vector_db(embeddings)
+        llm = StubLLM(latency=args.stub_latency, tokens_per_second=args.stub_tokens_per_second,
+                      output_tokens=args.stub_output_tokens)
+        answer_cache = create_answer_cache() if args.answer_cache else None
+        target = InProcessTarget(vector_db, llm, answer_cache, args.workers)
+    
+    report: Dict[str, Any] = {
+        "target": args.url or "in-process",
+        "conversations": {"source": source, "count": len(conversations)},
+        "stub_llm": {"latency_s": args.stub_latency, "tokens_per_second": args.stub_tokens_per_second,
+                     "output_tokens": args.stub_output_tokens} if not args.url else None,
+        "levels": [],
+    }
+    try:
+        for concurrency in args.concurrency:
+            logger.warning(f"Nivel de concurrencia: {concurrency}")
+            level = await run_level(target, conversations, concurrency, args.sessions, args.think_time,
+                                    args.sample_interval, args.pid)
+            report["levels"].append(level)
+    finally:
+        await target.close()
+    
+    return report
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Prueba de carga del asistente con un LLM simulado")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                        help="Niveles de sesiones simultáneas a recorrer")
+    parser.add_argument("--sessions", type=int, default=32, help="Sesiones por nivel")
+    parser.add_argument("--turns", type=int, default=4, help="Mensajes por conversación sintética")
+    parser.add_argument("--conversations", help="Log de conversaciones (conversation_log.txt) a reproducir")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Segundos entre mensajes de una sesión")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de las conversaciones sintéticas")
+    parser.add_argument("--workers", type=int, default=SERVER_RETRIEVAL_WORKERS, help="Hilos para la búsqueda")
+    parser.add_argument("--answer-cache", action="store_true", help="Usar la caché semántica de respuestas")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="Segundos hasta el primer token simulado")
+    parser.add_argument("--stub-tokens-per-second", type=float, default=50.0, help="Ritmo de tokens simulado")
+    parser.add_argument("--stub-output-tokens", type=int, default=120, help="Largo en tokens de la respuesta")
+    parser.add_argument("--url", help="URL del servicio (server.py) en lugar de llamar a aprocess_query")
+    parser.add_argument("--pid", type=int, help="Proceso cuyo CPU y RSS se miden (por defecto, este)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Segundos entre muestras de recursos")
+    parser.add_argument("--output", help="Archivo donde guardar además el reporte JSON")
+    args = parser.parse_args()
+    
+    report = json.dumps(asyncio.run(run_load_test(args)), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,19 +6,56 @@ y servicios de Casa Mueble.
 """
 import os
 import sys
+import csv
+import time
+import asyncio
+import argparse
+import functools
+import contextvars
 import logging
+import threading
 import re
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional, Tuple
 from dotenv import load_dotenv
 
+import faiss
+import numpy as np
 from langchain_community.vectorstores.faiss import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI  # For fallback to OpenAI
-from langchain_community.llms import HuggingFaceHub  # For local LLM
 
-from config import KNOWLEDGE_DIR, INDEX_DIR, EMBEDDING_MODEL_NAME
+from config import (
+    KNOWLEDGE_DIR, INDEX_DIR, CATALOGO_PATH, EMBEDDING_MODEL_NAME, MODELS_CACHE_DIR,
+    EMBEDDING_BACKEND, EMBEDDING_ONNX_INT8_FILE,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DISK_PATH,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_SIMILARITY_THRESHOLD, ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_HISTORY_TURNS,
+    INDEX_USE_MMAP, INDEX_VERIFY_CHECKSUM, HYBRID_SEARCH_ENABLED, BM25_TOP_K, RRF_K,
+    ENTITY_DIRECT_LOOKUP, ENTITY_DIRECT_MAX_PRODUCTS, CATALOG_ENGINE_ENABLED, CATALOG_CACHE_PATH,
+    FAQ_FAST_PATH_ENABLED, FAQ_FAST_PATH_THRESHOLD, FAISS_NPROBE, FAISS_HNSW_EF_SEARCH,
+    METRICS_ENABLED, METRICS_JSONL_PATH,
+    MEMORY_RECENT_TURNS, MEMORY_SUMMARY_MAX_CHARS, MEMORY_MAX_ENTITIES, MEMORY_LLM_SUMMARY,
+    CONTEXT_TOKEN_BUDGET, TOKENIZER_ENCODING, CONTEXT_MIN_SIMILARITY, CONTEXT_MAX_OVERLAP_CHARS,
+    PROFILE_ENV_VAR, PROFILE_DIR, PROFILE_EVERY_TURNS, PROFILE_TOP, PROFILE_TRACEMALLOC_FRAMES
+)
+from utils import metrics
+from utils.answer_cache import AnswerCache
+from utils.bm25 import BM25Index, fold_accents, reciprocal_rank_fusion
+from utils.catalog_engine import CatalogEngine, format_catalog_answer
+from utils.context_budget import TokenCounter, pack_contexts, similarity_from_distance
+from utils.conversation_memory import ConversationMemory
+from utils.embedding_backends import create_embedding_model, embedding_model_key
+from utils.embedding_cache import CachedEmbeddings
+from utils.entity_index import EntityIndex
+from utils.faiss_factory import configure_search
+from utils.faq_index import FAQIndex
+from utils.index_store import load_index
+from utils.model_cache import enable_offline_if_cached
+from utils.profiling import Profiler, requested_profiler
 
 
 # Cargar variables de entorno desde .env si existe
@@ -28,13 +65,14 @@ load_dotenv(override=True)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Prompt template para el chatbot
-SYSTEM_TEMPLATE = """
-Eres un asistente virtual de Casa Mueble, una empresa especializada en muebles de alta calidad. Tu objetivo es ayudar a los clientes a encontrar productos, resolver dudas sobre la empresa y brindar una experiencia personalizada.
+# Prompt del chatbot. El mensaje de sistema es fijo (la lista de productos solo cambia al reindexar) y va
+# primero, así el prefijo del prompt es idéntico entre pedidos y aprovecha la caché de prefijos del proveedor.
+# Lo variable va en el mensaje del cliente: historial (crece al final durante la sesión), contexto y pregunta.
+SYSTEM_PROMPT = """Eres un asistente virtual de Casa Mueble, una empresa especializada en muebles de alta calidad. Tu objetivo es ayudar a los clientes a encontrar productos, resolver dudas sobre la empresa y brindar una experiencia personalizada.
 
 INSTRUCCIONES CRÍTICAS SOBRE ALUCINACIONES:
 - NUNCA, BAJO NINGUNA CIRCUNSTANCIA, debes inventar o fabricar información que no esté explícitamente en el contexto proporcionado.
-- SOLO menciona productos que existan explícitamente en el contexto. La lista completa de productos es: Camastro Leonor, Camastro Clara, Camastro Delfina, Sillón Clemente, Kit Barral Simple Completo, Kit Barral Doble Completo, Fogonero Perikles, Fogonero Efesto, Fogonero con Media Parrilla, Media Parrilla, Estaca Asador, Mesa Brisa 100x50 cm, Juego de Mesas Nido Redondas.
+- SOLO menciona productos que existan explícitamente en el contexto y en la lista completa de productos del final.
 - NUNCA menciones productos genéricos como "Mesa de Comedor Extensible" si no están explícitamente en el contexto.
 - NUNCA inventes precios. Si un precio no está explícitamente en el contexto, simplemente di que no tienes esa información.
 - Si encuentras una pregunta que requiere información no disponible en el contexto, simplemente admite que no tienes esa información específica.
@@ -49,49 +87,92 @@ INSTRUCCIONES GENERALES:
 7. Evita repetir información que ya has proporcionado anteriormente.
 8. Si te piden un precio específico y no está en el contexto, NUNCA inventes un precio. En su lugar, di: "Lo siento, no tengo información sobre el precio de este producto en particular. Para obtener el precio actualizado, te recomiendo contactar directamente con Casa Mueble a través de su página web o número de atención al cliente."
 9. Si tras una búsqueda cuidadosa no encuentras información sobre un producto específico, NO INVENTES que el producto existe o tiene ciertas características. Di claramente que no tienes información sobre ese producto.
+10. Tu respuesta debe ser útil, relevante y amigable, mostrando primero las opciones concretas de productos o información relevante, y solo después, si es necesario, hacer preguntas para personalizar la atención.
 
-CONTEXTO RELEVANTE (Esta es tu única fuente de información para responder):
-{context}
+El mensaje del cliente incluye el historial de la conversación, el CONTEXTO RELEVANTE (tu única fuente de información para responder) y su pregunta actual.
 
-HISTORIAL DE CONVERSACIÓN:
-{chat_history}
+LISTA COMPLETA DE PRODUCTOS: {product_list}"""
 
-PREGUNTA ACTUAL DEL CLIENTE:
-{question}
+HISTORY_SECTION = """HISTORIAL DE CONVERSACIÓN:
+{chat_history}"""
 
-Tu respuesta debe ser útil, relevante y amigable, mostrando primero las opciones concretas de productos o información relevante, y solo después, si es necesario, hacer preguntas para personalizar la atención.
-"""
+CONTEXT_SECTION = """CONTEXTO RELEVANTE (Esta es tu única fuente de información para responder):
+{context}"""
+
+QUESTION_SECTION = """PREGUNTA ACTUAL DEL CLIENTE:
+{question}"""
+
+USER_TEMPLATE = "\n\n".join([HISTORY_SECTION, CONTEXT_SECTION, QUESTION_SECTION])
+
+CHAT_PROMPT = ChatPromptTemplate.from_messages([("system", SYSTEM_PROMPT), ("human", USER_TEMPLATE)])
+
+# Prompt para plegar turnos viejos en el resumen de la conversación (MEMORY_LLM_SUMMARY)
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Resumes conversaciones entre un cliente y el asistente de Casa Mueble. Integra los mensajes "
+               "nuevos al resumen actual en pocas líneas: qué busca el cliente, productos, precios y medidas "
+               "mencionados y qué quedó pendiente. No agregues datos que no estén en los mensajes."),
+    ("human", "RESUMEN ACTUAL:\n{summary}\n\nMENSAJES NUEVOS:\n{messages}"),
+])
+
+# Cadenas compiladas por LLM y prompt ((id, id) -> (llm, cadena)); se guarda el LLM para no confundir ids reutilizados
+_CHAINS: Dict[Tuple[int, int], Tuple[Any, Any]] = {}
+_CHAINS_LOCK = threading.Lock()
 
-def load_embeddings() -> HuggingFaceEmbeddings:
+# Tokenizador del LLM (gpt-3.5-turbo) para el presupuesto de contexto y el conteo del prompt
+TOKEN_COUNTER = TokenCounter(TOKENIZER_ENCODING)
+
+def load_embedding_model() -> Embeddings:
     """
-    Carga el modelo de embeddings.
+    Carga el modelo de embeddings con el backend configurado en EMBEDDING_BACKEND.
+    
+    Si el modelo ya está en models_cache se fuerza la resolución offline para no
+    consultar el hub en cada arranque. La importación es diferida por el mismo motivo.
     
     Returns:
-        HuggingFaceEmbeddings: Modelo de embeddings cargado
+        Embeddings: Modelo de embeddings sin caché
+    """
+    if enable_offline_if_cached(MODELS_CACHE_DIR, EMBEDDING_MODEL_NAME):
+        logger.info("Modelo de embeddings encontrado en models_cache, carga offline")
+    
+    return create_embedding_model(
+        EMBEDDING_MODEL_NAME,
+        MODELS_CACHE_DIR,
+        backend=EMBEDDING_BACKEND,
+        onnx_int8_file=EMBEDDING_ONNX_INT8_FILE
+    )
+
+def load_embeddings() -> CachedEmbeddings:
+    """
+    Carga el modelo de embeddings envuelto en una caché LRU.
+    
+    Returns:
+        CachedEmbeddings: Modelo de embeddings cargado con caché
     """
     logger.info(f"Cargando modelo de embeddings: {EMBEDDING_MODEL_NAME}")
     
     try:
-        embeddings = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL_NAME,
-            cache_folder=os.path.join(os.path.dirname(INDEX_DIR), "models_cache")
+        return CachedEmbeddings(
+            load_embedding_model(),
+            embedding_model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND),
+            max_size=EMBEDDING_CACHE_SIZE,
+            disk_path=EMBEDDING_CACHE_DISK_PATH
         )
-        
-        return embeddings
     
     except Exception as e:
         logger.error(f"Error al cargar modelo de embeddings: {str(e)}")
         sys.exit(1)
 
-def load_vector_db(embeddings: HuggingFaceEmbeddings) -> FAISS:
+def load_vector_db(embeddings: Embeddings) -> FAISS:
     """
     Carga la base de datos vectorial FAISS.
     
     Args:
-        embeddings (HuggingFaceEmbeddings): Modelo de embeddings
+        embeddings (Embeddings): Modelo de embeddings
         
     Returns:
-        FAISS: Base de datos vectorial cargada
+        FAISS: Base de datos vectorial cargada, con el índice BM25 en lexical_index,
+        el índice de entidades de producto en entity_index, el motor de catálogo en catalog_engine
+        y el índice de preguntas frecuentes en faq_index
     """
     logger.info(f"Cargando índice FAISS desde: {INDEX_DIR}")
     
@@ -101,8 +182,27 @@ def load_vector_db(embeddings: HuggingFaceEmbeddings) -> FAISS:
             logger.info("Ejecuta 'python manage_knowledge_base.py rebuild' para crear el índice")
             sys.exit(1)
             
-        vector_db = FAISS.load_local(INDEX_DIR, embeddings, allow_dangerous_deserialization=True)
-        logger.info("Índice FAISS cargado exitosamente")
+        vector_db = load_index(INDEX_DIR, embeddings, use_mmap=INDEX_USE_MMAP, verify=INDEX_VERIFY_CHECKSUM)
+        configure_search(vector_db.index, FAISS_NPROBE, FAISS_HNSW_EF_SEARCH)
+        logger.info(f"Índice FAISS cargado exitosamente ({type(vector_db.index).__name__})")
+        
+        # Los índices auxiliares viajan con la base vectorial para que search_knowledge_base los encuentre
+        vector_db.entity_index = EntityIndex.load(INDEX_DIR)
+        if vector_db.entity_index is None:
+            logger.warning("No se encontró el índice de entidades; los productos se buscan sin lookup directo. "
+                           "Ejecuta 'python manage_knowledge_base.py rebuild' para crearlo")
+        vector_db.lexical_index = BM25Index.load(INDEX_DIR) if HYBRID_SEARCH_ENABLED else None
+        if HYBRID_SEARCH_ENABLED and vector_db.lexical_index is None:
+            logger.warning("No se encontró índice BM25; se usa solo la búsqueda vectorial. "
+                           "Ejecuta 'python manage_knowledge_base.py rebuild' para crearlo")
+        vector_db.catalog_engine = load_catalog_engine()
+        vector_db.faq_index = (
+            FAQIndex.load(INDEX_DIR, embedding_model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND))
+            if FAQ_FAST_PATH_ENABLED else None
+        )
+        if FAQ_FAST_PATH_ENABLED and vector_db.faq_index is None:
+            logger.warning("No se encontró el índice de preguntas frecuentes; el atajo de FAQs queda deshabilitado. "
+                           "Ejecuta 'python manage_knowledge_base.py rebuild' para crearlo")
         
         return vector_db
     
@@ -110,6 +210,44 @@ def load_vector_db(embeddings: HuggingFaceEmbeddings) -> FAISS:
         logger.error(f"Error al cargar índice FAISS: {str(e)}")
         sys.exit(1)
 
+def load_catalog_engine() -> Optional[CatalogEngine]:
+    """
+    Carga el motor de consultas estructuradas sobre catalogo.csv.
+    
+    Returns:
+        Optional[CatalogEngine]: Motor del catálogo, o None si está deshabilitado o no hay catálogo
+    """
+    if not CATALOG_ENGINE_ENABLED or not os.path.exists(CATALOGO_PATH):
+        return None
+    
+    try:
+        return CatalogEngine.load(CATALOGO_PATH, CATALOG_CACHE_PATH)
+    except Exception as e:
+        logger.warning(f"No se pudo cargar el motor del catálogo: {str(e)}")
+        return None
+
+def get_product_names(vector_db: FAISS) -> List[str]:
+    """
+    Devuelve los nombres de producto del catálogo.
+    
+    Args:
+        vector_db (FAISS): Base de datos vectorial con el índice de entidades en entity_index
+        
+    Returns:
+        List[str]: Nombres de producto, del índice de entidades o, si no existe, de catalogo.csv
+    """
+    entity_index = getattr(vector_db, "entity_index", None)
+    if entity_index is not None:
+        return entity_index.names()
+    return read_catalog_product_names()
+
+
+@functools.lru_cache(maxsize=1)
+def read_catalog_product_names() -> List[str]:
+    """Lee los nombres de producto directamente de catalogo.csv."""
+    with open(CATALOGO_PATH, "r", encoding="utf-8") as f:
+        return [row[0].strip() for row in list(csv.reader(f))[1:] if row and row[0].strip()]
+
 def load_llm():
     """
     Carga el modelo de lenguaje a utilizar.
@@ -117,10 +255,14 @@ def load_llm():
     Returns:
         El modelo de lenguaje cargado o None si ocurre un error
     """
-    logger.info("Cargando modelo de lenguaje")    # Primera opción: probar con OpenAI si hay API key disponible
+    logger.info("Cargando modelo de lenguaje")
+    
+    # Los backends se importan solo si se van a usar
+    # Primera opción: probar con OpenAI si hay API key disponible
     if os.environ.get("OPENAI_API_KEY"):
         try:
             logger.info("Usando OpenAI como modelo de lenguaje")
+            from langchain_openai import ChatOpenAI
             return ChatOpenAI(temperature=0.1, model_name="gpt-3.5-turbo")
         except Exception as e:
             logger.warning(f"Error al cargar OpenAI: {str(e)}")
@@ -129,6 +271,7 @@ def load_llm():
     if os.environ.get("HUGGINGFACEHUB_API_TOKEN"):
         try:
             logger.info("Usando HuggingFace Hub como modelo de lenguaje")
+            from langchain_community.llms import HuggingFaceHub
             return HuggingFaceHub(
                 repo_id="google/flan-t5-base",
                 model_kwargs={"temperature": 0.1, "max_length": 512}
@@ -140,21 +283,110 @@ def load_llm():
     logger.warning("No se pudo cargar ningún modelo de lenguaje. El sistema funcionará con formato de plantilla simple.")
     return None
 
-def expand_query(query: str, chat_history: List[Dict[str, str]] = None) -> str:
+def load_components() -> Tuple[CachedEmbeddings, FAISS, Any, Dict[str, float]]:
+    """
+    Carga el modelo de embeddings, el índice FAISS y el LLM en paralelo.
+    
+    El modelo de embeddings se precalienta con una primera consulta para que la
+    primera pregunta del cliente no pague la inicialización.
+    
+    Returns:
+        Tuple[CachedEmbeddings, FAISS, Any, Dict[str, float]]: Embeddings, índice, LLM
+        (o None) y segundos de cada etapa
+    """
+    timings: Dict[str, float] = {}
+    
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        timings[stage] = time.perf_counter() - start
+        return result
+    
+    def warm_embedding_model():
+        logger.info(f"Cargando modelo de embeddings: {EMBEDDING_MODEL_NAME}")
+        try:
+            model = load_embedding_model()
+            model.embed_query("calentamiento")
+            return model
+        except Exception as e:
+            logger.error(f"Error al cargar modelo de embeddings: {str(e)}")
+            sys.exit(1)
+    
+    def safe_load_llm():
+        try:
+            llm = load_llm()
+            if llm is not None:
+                get_chain(llm)  # Compilar la cadena al arrancar y no en el primer turno
+            logger.info("Modelo de lenguaje cargado correctamente")
+            return llm
+        except Exception as e:
+            logger.error(f"Error al cargar el modelo de lenguaje: {str(e)}")
+            return None
+    
+    start = time.perf_counter()
+    
+    # El índice se abre con la caché de embeddings vacía; el modelo se asigna al terminar de cargarse
+    embeddings = CachedEmbeddings(
+        None,
+        embedding_model_key(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND),
+        max_size=EMBEDDING_CACHE_SIZE,
+        disk_path=EMBEDDING_CACHE_DISK_PATH
+    )
+    
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        model_future = pool.submit(timed, "embeddings", warm_embedding_model)
+        index_future = pool.submit(timed, "indice_faiss", load_vector_db, embeddings)
+        llm_future = pool.submit(timed, "llm", safe_load_llm)
+        embeddings.embeddings = model_future.result()
+        vector_db = index_future.result()
+        llm = llm_future.result()
+    
+    timings["total"] = time.perf_counter() - start
+    
+    return embeddings, vector_db, llm, timings
+
+def create_answer_cache() -> Optional[AnswerCache]:
+    """
+    Crea la caché semántica de respuestas según la configuración.
+    
+    Returns:
+        Optional[AnswerCache]: Caché lista para usar o None si está deshabilitada
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    
+    return AnswerCache(
+        INDEX_DIR,
+        threshold=ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        history_turns=ANSWER_CACHE_HISTORY_TURNS
+    )
+
+def expand_query(query: str, chat_history: List[Dict[str, str]] = None, retrieval_context: Optional[str] = None,
+                 entity_index: Optional[EntityIndex] = None) -> str:
     """
     Expande la consulta del usuario para mejorar la búsqueda vectorial.
     
     Args:
         query (str): Consulta original del usuario
         chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        retrieval_context (Optional[str], optional): Productos y temas de la conversación (ConversationMemory);
+            si se pasa, reemplaza a los últimos mensajes del historial
+        entity_index (Optional[EntityIndex], optional): Índice de productos del catálogo, para reforzar
+            los productos que nombra la consulta
         
     Returns:
         str: Consulta expandida y mejorada
     """
     expanded_query = query
     
+    # Con memoria de conversación se suman solo los productos y temas mencionados, no los mensajes
+    if retrieval_context is not None:
+        if retrieval_context:
+            expanded_query = f"{query}. Contexto adicional de la conversación: {retrieval_context}"
     # Añadir contexto del historial de chat si está disponible
-    if chat_history and len(chat_history) > 0:
+    elif chat_history and len(chat_history) > 0:
         # Tomar las últimas 2 interacciones para contexto
         recent_context = chat_history[-4:] if len(chat_history) > 4 else chat_history
         context = " ".join([entry["content"] for entry in recent_context])
@@ -164,25 +396,28 @@ def expand_query(query: str, chat_history: List[Dict[str, str]] = None) -> str:
     
     # Expandir nombres de productos específicos
     product_specific_mappings = {
-        "camastro": ["camastro", "tumbona", "reposera", "sillón reclinable", "leonor", "clara", "delfina"],
-        "sillón": ["sillón", "sillon", "sofá", "sofa", "butaca", "clemente"],
-        "fogonero": ["fogonero", "brasero", "parrilla", "asador", "perikles", "efesto"],
-        "mesa": ["mesa", "escritorio", "mueble", "mesita", "brisa"],
+        "camastro": ["camastro", "tumbona", "reposera", "sillón reclinable"],
+        "sillón": ["sillón", "sillon", "sofá", "sofa", "butaca"],
+        "fogonero": ["fogonero", "brasero", "parrilla", "asador"],
+        "mesa": ["mesa", "escritorio", "mueble", "mesita"],
         "kit": ["kit", "conjunto", "set", "barral"]
     }
     
-    # Comprobar si la consulta contiene palabras clave de productos específicos
+    # Los productos nombrados (aun por su nombre solo, con errores de tipeo o sin tildes) los
+    # resuelve el índice de entidades; su nombre completo también aporta la categoría
+    mentioned = [entity["name"] for entity in entity_index.match(query)] if entity_index is not None else []
+    
+    # Comprobar si la consulta contiene palabras clave de productos específicos (sin distinguir tildes)
+    folded_query = fold_accents(" ".join([query] + mentioned))
     for product_type, synonyms in product_specific_mappings.items():
-        if any(term.lower() in query.lower() for term in synonyms):
+        if any(fold_accents(term) in folded_query for term in synonyms):
             # Si se encuentra un tipo de producto, añadir todos sus sinónimos a la consulta expandida
             additional_terms = " ".join([term for term in synonyms if term.lower() not in expanded_query.lower()])
             expanded_query = f"{expanded_query} {additional_terms}"
-            
-            # Si la consulta menciona un nombre específico, reforzarlo
-            for potential_name in ["leonor", "clara", "delfina", "clemente", "perikles", "efesto", "brisa"]:
-                if potential_name.lower() in query.lower():
-                    expanded_query = f"{expanded_query} producto {potential_name} específico"
-                    break
+    
+    # Reforzar los productos que la consulta nombra
+    for name in mentioned:
+        expanded_query = f"{expanded_query} producto {name} específico"
     
     # Añadir términos específicos para mejorar la búsqueda
     product_keywords = [
@@ -209,7 +444,266 @@ def expand_query(query: str, chat_history: List[Dict[str, str]] = None) -> str:
     
     return expanded_query
 
-def search_knowledge_base(query: str, vector_db: FAISS, k: int = 3, chat_history: List[Dict[str, str]] = None) -> List[str]:
+# Palabras que no aportan a la búsqueda por término exacto
+QUERY_STOPWORDS = ["que", "cual", "como", "donde", "quien", "tiene", "para"]
+
+# Palabras clave que indican una consulta sobre un producto específico
+PRODUCT_QUERY_KEYWORDS = ["camastro", "sillón", "fogonero", "mesa", "parrilla", "kit", "barral", "estaca"]
+
+
+def plan_retrieval_queries(query: str, k: int = 3, chat_history: List[Dict[str, str]] = None,
+                           keyword_variants: bool = True,
+                           retrieval_context: Optional[str] = None,
+                           entity_index: Optional[EntityIndex] = None) -> Tuple[List[Tuple[str, int]], bool]:
+    """
+    Reúne de antemano todas las variantes de la consulta que se van a buscar.
+    
+    Args:
+        query (str): Consulta original del usuario
+        k (int, optional): Número de documentos a recuperar. Default es 3.
+        chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        keyword_variants (bool, optional): Sumar una búsqueda densa por cada palabra relevante.
+            Solo hace falta si no hay índice BM25 para cubrir los términos exactos.
+        retrieval_context (Optional[str], optional): Productos y temas de la conversación para la búsqueda
+        entity_index (Optional[EntityIndex], optional): Índice de productos del catálogo (ver expand_query)
+        
+    Returns:
+        Tuple[List[Tuple[str, int]], bool]: Lista de pares (variante, k) sin repetir y
+        un indicador de si la consulta es sobre un producto específico
+    """
+    # Detectar si la consulta es sobre un producto específico
+    product_specific = any(fold_accents(keyword) in fold_accents(query) for keyword in PRODUCT_QUERY_KEYWORDS)
+    
+    # Ajustar k si la consulta es sobre un producto específico
+    if product_specific:
+        k = 5  # Aumentar el número de resultados para consultas de productos específicos
+    
+    # Expandir la consulta una sola vez para mejorar la búsqueda
+    with metrics.span("expand_query"):
+        expanded_query = expand_query(query, chat_history, retrieval_context, entity_index)
+    logger.info(f"Consulta original: '{query}' -> Expandida: '{expanded_query}'")
+    
+    # La consulta expandida y la original siempre se buscan
+    variants = [(expanded_query, k), (query, k)]
+    
+    # Para productos específicos, sumar cada palabra relevante como búsqueda exacta
+    if product_specific and keyword_variants:
+        for word in query.lower().split():
+            if len(word) > 3 and word not in QUERY_STOPWORDS:
+                variants.append((word, 3))
+    
+    # Eliminar variantes repetidas conservando el orden
+    planned = []
+    seen = set()
+    for text, variant_k in variants:
+        if text not in seen:
+            planned.append((text, variant_k))
+            seen.add(text)
+    
+    return planned, product_specific
+
+
+def batched_similarity_search(vector_db: FAISS, queries: List[Tuple[str, int]]) -> List[Tuple[str, Document, float]]:
+    """
+    Busca todas las variantes con un único embedding por lotes y una única búsqueda matricial.
+    
+    Args:
+        vector_db (FAISS): Base de datos vectorial
+        queries (List[Tuple[str, int]]): Pares (variante, k) a buscar
+        
+    Returns:
+        List[Tuple[str, Document, float]]: Id de docstore, documento y mejor puntaje, del más al menos relevante
+    """
+    if not queries or vector_db.index.ntotal == 0:
+        return []
+    
+    texts = [text for text, _ in queries]
+    
+    # Un solo pase del modelo para todas las variantes
+    with metrics.span("embedding"):
+        if isinstance(vector_db.embedding_function, Embeddings):
+            vectors = vector_db.embedding_function.embed_documents(texts)
+        else:
+            vectors = [vector_db.embedding_function(text) for text in texts]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vector_db._normalize_L2:
+            faiss.normalize_L2(vectors)
+    
+    # Una sola búsqueda matricial en FAISS
+    max_k = min(max(variant_k for _, variant_k in queries), vector_db.index.ntotal)
+    with metrics.span("faiss_search"):
+        scores, indices = vector_db.index.search(vectors, max_k)
+    metrics.count("faiss_searches")
+    metrics.count("faiss_queries", len(queries))
+    
+    # En distancia euclidiana un puntaje menor es mejor; en producto interno, mayor
+    lower_is_better = vector_db.distance_strategy == DistanceStrategy.EUCLIDEAN_DISTANCE
+    
+    # Combinar por id de vector quedándose con el mejor puntaje
+    best_scores = {}
+    for row, (_, variant_k) in enumerate(queries):
+        for score, vector_id in zip(scores[row][:variant_k], indices[row][:variant_k]):
+            if vector_id == -1:
+                continue
+            vector_id = int(vector_id)
+            score = float(score)
+            previous = best_scores.get(vector_id)
+            if previous is None or (score < previous if lower_is_better else score > previous):
+                best_scores[vector_id] = score
+    
+    ranked_ids = sorted(best_scores, key=best_scores.get, reverse=not lower_is_better)
+    
+    results = []
+    for vector_id in ranked_ids:
+        docstore_id = vector_db.index_to_docstore_id[vector_id]
+        doc = vector_db.docstore.search(docstore_id)
+        if isinstance(doc, Document):
+            results.append((docstore_id, doc, best_scores[vector_id]))
+    
+    return results
+
+
+def format_contexts(docs: List[Any], max_results: int, similarities: Optional[Dict[str, float]] = None) -> List[str]:
+    """
+    Elimina documentos repetidos, les agrega la fuente y los recorta al presupuesto de tokens.
+    
+    Args:
+        docs (List[Any]): Documentos ordenados por relevancia (se ignoran los que no son Document)
+        max_results (int): Cantidad máxima de resultados
+        similarities (Optional[Dict[str, float]], optional): Similitud coseno por contenido de los
+            resultados densos; los demás no pasan por el corte de similitud
+        
+    Returns:
+        List[str]: Contenidos formateados con su fuente
+    """
+    similarities = similarities or {}
+    results = [(doc, similarities.get(doc.page_content)) for doc in docs if isinstance(doc, Document)]
+    contexts, stats = pack_contexts(
+        results, CONTEXT_TOKEN_BUDGET, TOKEN_COUNTER, min_similarity=CONTEXT_MIN_SIMILARITY,
+        max_results=max_results, max_overlap=CONTEXT_MAX_OVERLAP_CHARS
+    )
+    
+    logger.info(f"Contexto: {len(contexts)} documentos, {stats['tokens']} tokens "
+                f"(bajo el umbral: {stats['below_cutoff']}, fuera del presupuesto: {stats['over_budget']}, "
+                f"solapamiento quitado: {stats['overlap_chars']} caracteres)")
+    metrics.observe("context_tokens", stats["tokens"], metrics.TOKENS_BUCKETS)
+    metrics.count("context_below_cutoff", stats["below_cutoff"])
+    metrics.count("context_over_budget", stats["over_budget"])
+    return contexts
+
+
+def find_entity_documents(query: str, vector_db: FAISS) -> List[Document]:
+    """
+    Recupera por id los chunks de los productos nombrados en la consulta.
+    
+    Args:
+        query (str): Consulta del usuario
+        vector_db (FAISS): Base de datos vectorial con el índice de entidades en entity_index
+        
+    Returns:
+        List[Document]: Chunks de los productos detectados, o lista vacía si no hay una coincidencia confiable
+    """
+    entity_index = getattr(vector_db, "entity_index", None)
+    if entity_index is None or not ENTITY_DIRECT_LOOKUP:
+        return []
+    
+    entities = entity_index.match(query)
+    if not entities or len(entities) > ENTITY_DIRECT_MAX_PRODUCTS:
+        return []
+    
+    chunk_ids = [docstore_id for entity in entities for docstore_id in entity["chunk_ids"]]
+    if not chunk_ids:
+        return []
+    
+    logger.info(f"Productos detectados: {[entity['name'] for entity in entities]}")
+    docs = [vector_db.docstore.search(docstore_id) for docstore_id in chunk_ids]
+    return [doc for doc in docs if isinstance(doc, Document)]
+
+
+def answer_catalog_query(query: str, vector_db: FAISS) -> Optional[str]:
+    """
+    Resuelve con el motor de catálogo las preguntas de precio (rangos, más barato, comparaciones).
+    
+    Args:
+        query (str): Consulta del usuario
+        vector_db (FAISS): Base de datos vectorial con el motor de catálogo en catalog_engine
+        
+    Returns:
+        Optional[str]: Resultado exacto formateado, o None si la consulta no es estructurada
+    """
+    catalog_engine = getattr(vector_db, "catalog_engine", None)
+    if catalog_engine is None:
+        return None
+    
+    entity_index = getattr(vector_db, "entity_index", None)
+    product_names = [entity["name"] for entity in entity_index.match(query)] if entity_index is not None else None
+    result = catalog_engine.answer(query, product_names)
+    if result is None:
+        return None
+    
+    logger.info(f"Consulta estructurada: {result['description']} ({len(result['products'])} productos)")
+    return format_catalog_answer(result)
+
+
+def answer_from_faqs(query: str, vector_db: FAISS) -> Optional[str]:
+    """
+    Devuelve la respuesta curada de FAQs.csv si la consulta es casi igual a una pregunta frecuente.
+    
+    Args:
+        query (str): Consulta del usuario
+        vector_db (FAISS): Base de datos vectorial con el índice de preguntas frecuentes en faq_index
+        
+    Returns:
+        Optional[str]: Respuesta optimizada de la FAQ, o None si ninguna supera el umbral
+    """
+    faq_index = getattr(vector_db, "faq_index", None)
+    if faq_index is None:
+        return None
+    
+    match = faq_index.match(vector_db.embedding_function.embed_query(query), FAQ_FAST_PATH_THRESHOLD)
+    if match is None:
+        return None
+    
+    logger.info(f"Respuesta directa de FAQ: '{match['question']}' (similitud {match['score']:.3f})")
+    return match["answer"]
+
+
+# Marcas de una pregunta de seguimiento que se apoya en lo anterior ("¿y ese tiene envío?")
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\W*y\b|\b(?:ese|esa|esos|esas|este|estos|estas|eso|esto|aquel|aquella|mismo|misma)\b"
+)
+
+
+def refers_to_context(query: str, vector_db: FAISS, chat_history: List[Dict[str, str]] = None,
+                      retrieval_context: Optional[str] = None) -> bool:
+    """
+    Indica si la consulta es un seguimiento sobre un producto o tema de la conversación.
+    
+    Esas consultas no pasan por el atajo de FAQs: "¿y ese tiene envío?" se parece a la FAQ de envíos,
+    pero la respuesta tiene que considerar el producto del que se venía hablando.
+    
+    Args:
+        query (str): Consulta del usuario
+        vector_db (FAISS): Base de datos vectorial (con el índice de entidades en entity_index, si existe)
+        chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        retrieval_context (Optional[str], optional): Productos y temas de la conversación (ConversationMemory)
+        
+    Returns:
+        bool: True si la consulta no nombra productos ni temas, tiene marcas de seguimiento y
+        la conversación previa sí nombró alguno
+    """
+    if not FOLLOW_UP_PATTERN.search(fold_accents(query)) or mentioned_entities(query, vector_db):
+        return False
+    
+    if retrieval_context is not None:
+        return bool(retrieval_context)
+    
+    recent_questions = [entry["content"] for entry in (chat_history or [])[-4:] if entry.get("role") == "user"]
+    return bool(mentioned_entities(" ".join(recent_questions), vector_db))
+
+
+def search_knowledge_base(query: str, vector_db: FAISS, k: int = 3, chat_history: List[Dict[str, str]] = None,
+                          retrieval_context: Optional[str] = None) -> List[str]:
     """
     Busca en la base de conocimientos utilizando la consulta del usuario.
     
@@ -218,65 +712,55 @@ def search_knowledge_base(query: str, vector_db: FAISS, k: int = 3, chat_history
         vector_db (FAISS): Base de datos vectorial
         k (int, optional): Número de documentos a recuperar. Default es 3.
         chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        retrieval_context (Optional[str], optional): Productos y temas de la conversación para la búsqueda
         
     Returns:
         List[str]: Documentos relevantes encontrados
     """
     try:
-        # Detectar si la consulta es sobre un producto específico
-        product_specific = False
-        product_keywords = ["camastro", "sillón", "fogonero", "mesa", "parrilla", "kit", "barral", "estaca"]
-        for keyword in product_keywords:
-            if keyword.lower() in query.lower():
-                product_specific = True
-                break
-        
-        # Ajustar k si la consulta es sobre un producto específico
-        if product_specific:
-            k = 5  # Aumentar el número de resultados para consultas de productos específicos
+        # Si la consulta nombra productos concretos, sus chunks se recuperan directo por id
+        with metrics.span("entity_lookup"):
+            entity_docs = find_entity_documents(query, vector_db)
+        if entity_docs:
+            metrics.count("entity_lookup_hits")
+            # Si solo pide los datos del producto alcanzan sus chunks; si pregunta algo más
+            # (envío, garantía) se suman a la búsqueda normal
+            if vector_db.entity_index.is_product_lookup(query):
+                logger.info("Consulta de producto: se omite la búsqueda vectorial")
+                return format_contexts(entity_docs, len(entity_docs))
         
-        # Expand query to improve search
-        expanded_query = expand_query(query, chat_history)
-        logger.info(f"Consulta original: '{query}' -> Expandida: '{expanded_query}'")
+        # Con índice BM25 los términos exactos se cubren con una búsqueda léxica en vez de una densa por palabra
+        lexical_index = getattr(vector_db, "lexical_index", None) if HYBRID_SEARCH_ENABLED else None
         
-        # Realizar la búsqueda de similitud con la consulta expandida
-        documents = vector_db.similarity_search(expanded_query, k=k)
+        # Planificar todas las variantes y buscarlas en una sola pasada
+        planned_queries, product_specific = plan_retrieval_queries(
+            query, k, chat_history, keyword_variants=lexical_index is None, retrieval_context=retrieval_context,
+            entity_index=getattr(vector_db, "entity_index", None)
+        )
+        if product_specific:
+            k = 5
+        scored_docs = batched_similarity_search(vector_db, planned_queries)
+        ranked_docs = [doc for _, doc, _ in scored_docs]
+        lower_is_better = vector_db.distance_strategy == DistanceStrategy.EUCLIDEAN_DISTANCE
+        similarities = {doc.page_content: similarity_from_distance(score, lower_is_better)
+                        for _, doc, score in scored_docs}
         
-        # Búsqueda adicional con la consulta original para no perder resultados directos
-        original_documents = vector_db.similarity_search(query, k=k)
+        # Combinar ranking denso y léxico con Reciprocal Rank Fusion
+        if lexical_index is not None:
+            docs_by_id = {docstore_id: doc for docstore_id, doc, _ in scored_docs}
+            with metrics.span("bm25_search"):
+                lexical_ids = [docstore_id for docstore_id, _ in lexical_index.search(query, BM25_TOP_K)]
+            metrics.count("bm25_searches")
+            fused_ids = reciprocal_rank_fusion([list(docs_by_id), lexical_ids], RRF_K)
+            ranked_docs = [docs_by_id.get(docstore_id) or vector_db.docstore.search(docstore_id)
+                           for docstore_id in fused_ids]
         
-        # Para productos específicos, realizar una búsqueda adicional con palabras clave exactas
-        if product_specific:
-            # Extraer posibles nombres de productos de la consulta
-            words = query.lower().split()
-            for word in words:
-                if len(word) > 3 and word not in ["que", "cual", "como", "donde", "quien", "tiene", "para"]:
-                    # Buscar documentos que contengan exactamente esa palabra
-                    exact_documents = vector_db.similarity_search(word, k=3)
-                    original_documents.extend(exact_documents)
-        
-        # Combinar resultados y eliminar duplicados
-        all_docs = []
-        doc_contents = set()
-        
-        for doc_list in [documents, original_documents]:
-            for doc in doc_list:
-                if doc.page_content not in doc_contents:
-                    all_docs.append(doc)
-                    doc_contents.add(doc.page_content)
-        
-        # Formatear resultados con fuentes
-        contexts = []
         max_results = k + 2 if product_specific else k  # Más resultados para productos específicos
-        for doc in all_docs[:max_results]:  # Limitar a max_results después de combinar
-            # Extraer metadata o nombre de archivo como fuente
-            source = doc.metadata.get('source', 'Unknown source') if hasattr(doc, 'metadata') else 'Unknown source'
-            
-            # Formatear el contenido con la fuente
-            formatted_content = f"{doc.page_content}\n[Fuente: {source}]"
-            contexts.append(formatted_content)
         
-        return contexts
+        # Los chunks de los productos nombrados van primero y no pasan por el corte de similitud
+        for doc in entity_docs:
+            similarities.pop(doc.page_content, None)
+        return format_contexts(entity_docs + ranked_docs, max_results + len(entity_docs), similarities)
     
     except Exception as e:
         logger.error(f"Error al buscar en la base de conocimientos: {str(e)}")
@@ -297,72 +781,420 @@ def format_chat_history(history: List[Dict[str, str]]) -> str:
         
     formatted_history = ""
     for message in history:
+        # El resumen de los turnos anteriores (ConversationMemory) va antes de los mensajes textuales
+        if message["role"] == "summary":
+            formatted_history += f"Resumen de la conversación anterior:\n{message['content']}\n\n"
+            continue
         role = "Cliente" if message["role"] == "user" else "Asistente"
         formatted_history += f"{role}: {message['content']}\n\n"
         
     return formatted_history.strip()
 
-def process_query(user_input: str, vector_db: FAISS, llm=None, chat_history: List[Dict[str, str]] = None) -> str:
-    """
-    Procesa la consulta del usuario y genera una respuesta utilizando solo la base vectorial y el LLM.
-    Si no hay información relevante, genera un fallback contextualizado con sugerencia de web y URL personalizada.
-    """
-    if chat_history is None:
-        chat_history = []
-
-    # 1. Expandir la consulta usando historial y sinónimos
-    expanded_query = expand_query(user_input, chat_history)
+# Respuesta predeterminada cuando no hay LLM disponible, para evitar hallucinations
+NO_LLM_RESPONSE = (
+    "Lo siento, no tengo información específica sobre tu consulta en mi base de datos. "
+    "Para obtener información actualizada y precisa, te recomiendo visitar la página web oficial "
+    "de Casa Mueble en https://casamueble.com.ar o contactar directamente con el servicio de atención al cliente."
+)
 
-    # 2. Buscar en la base vectorial
-    knowledge_base_info = search_knowledge_base(expanded_query, vector_db, k=3, chat_history=chat_history)
 
-    # 3. Si hay resultados, armar contexto y generar respuesta con LLM
-    if knowledge_base_info:
-        context = "\n\n".join(knowledge_base_info)
-        formatted_history = format_chat_history(chat_history)
-        prompt = ChatPromptTemplate.from_template(SYSTEM_TEMPLATE)
-        output_parser = StrOutputParser()
-        chain = prompt | llm | output_parser
-        response = chain.invoke({
-            "context": context,
-            "question": user_input,
-            "chat_history": formatted_history
-        })
-        return response    # 4. Si no hay resultados, fallback contextualizado    formatted_history = format_chat_history(chat_history)
+def build_fallback_context(user_input: str, product_names: List[str]) -> str:
+    """
+    Arma el contexto de fallback cuando no se encontró información relevante.
+    
+    Args:
+        user_input (str): Consulta original del usuario
+        product_names (List[str]): Nombres de los productos del catálogo
+        
+    Returns:
+        str: Contexto con instrucciones para no inventar y sugerencia de la web oficial
+    """
     fallback_context = (
         "No se encontró información relevante sobre esta consulta en nuestra base de datos. "
         "IMPORTANTE: Debes indicar claramente al cliente que no dispones de información específica sobre su consulta. "
         "NO inventes productos, características, precios, o cualquier otra información. "
-        "La lista completa de productos en nuestra base de conocimientos es: Camastro Leonor, Camastro Clara, Camastro Delfina, Sillón Clemente, "
-        "Kit Barral Simple Completo, Kit Barral Doble Completo, Fogonero Perikles, Fogonero Efesto, Fogonero con Media Parrilla, Media Parrilla, "
-        "Estaca Asador, Mesa Brisa 100x50 cm, Juego de Mesas Nido Redondas. "
+        f"La lista completa de productos en nuestra base de conocimientos es: {', '.join(product_names)}. "
         "Recomienda al cliente visitar la web oficial: https://casamueble.com.ar"
     )
     # Si la consulta es sobre producto, armar URL personalizada
     product_keywords = ["producto", "mueble", "mesa", "silla", "fogonero", "camastro"]
     if any(word in user_input.lower() for word in product_keywords):
         fallback_context += f"\nTambién podés sugerir que busque aquí: https://casamueble.com.ar/search/?q={user_input.replace(' ', '+')}"
+    
+    return fallback_context
+
 
-    prompt = ChatPromptTemplate.from_template(SYSTEM_TEMPLATE)
-    output_parser = StrOutputParser()
+def log_prompt_tokens(inputs: Dict[str, str]) -> int:
+    """
+    Cuenta los tokens del prompt armado y los registra por componente.
     
-    # Si estamos usando LLM, utilizar la cadena normal
-    if llm:
-        chain = prompt | llm | output_parser
-        response = chain.invoke({
-            "context": fallback_context,
-            "question": user_input,
-            "chat_history": formatted_history
-        })
-    else:
-        # Si no hay LLM disponible, usar una respuesta predeterminada para evitar hallucinations
-        response = (
-            "Lo siento, no tengo información específica sobre tu consulta en mi base de datos. "
-            "Para obtener información actualizada y precisa, te recomiendo visitar la página web oficial "
-            "de Casa Mueble en https://casamueble.com.ar o contactar directamente con el servicio de atención al cliente."
+    Args:
+        inputs (Dict[str, str]): Variables del prompt
+        
+    Returns:
+        int: Tokens del prompt completo
+    """
+    total = TOKEN_COUNTER.count(CHAT_PROMPT.format(**inputs))
+    parts = {name: TOKEN_COUNTER.count(inputs[name]) for name in ("context", "chat_history", "product_list")}
+    logger.info(f"Tokens del prompt: {total} (contexto {parts['context']}, historial {parts['chat_history']}, "
+                f"productos {parts['product_list']})")
+    metrics.observe("prompt_tokens", total, metrics.TOKENS_BUCKETS)
+    return total
+
+
+def prepare_query(user_input: str, vector_db: FAISS, llm=None, chat_history: List[Dict[str, str]] = None,
+                  answer_cache: Optional[AnswerCache] = None, retrieval_context: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Ejecuta la parte de la consulta que no depende del LLM: búsqueda, caché y variables del prompt.
+    
+    Es la parte intensiva en CPU del turno; el servicio HTTP la corre en un pool de hilos.
+    
+    Args:
+        user_input (str): Consulta original del usuario
+        vector_db (FAISS): Base de datos vectorial
+        llm: Modelo de lenguaje o None
+        chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        answer_cache (Optional[AnswerCache], optional): Caché semántica de respuestas
+        retrieval_context (Optional[str], optional): Productos y temas de la conversación para la búsqueda
+        
+    Returns:
+        Dict[str, Any]: 'response' si ya hay respuesta final (caché, FAQ o sin LLM), 'inputs' con las
+        variables del prompt y 'cache_entry' con lo necesario para guardar la respuesta en caché
+    """
+    if chat_history is None:
+        chat_history = []
+    
+    turn = {"response": None, "inputs": None, "cache_entry": None}
+
+    # 1. Las preguntas de precio se responden con datos exactos del catálogo; el LLM solo las redacta
+    with metrics.span("catalog_engine"):
+        catalog_answer = answer_catalog_query(user_input, vector_db)
+    if catalog_answer is not None:
+        metrics.count("turns", path="catalog")
+        if not llm:
+            turn["response"] = catalog_answer
+            return turn
+        with metrics.span("prompt_format"):
+            turn["inputs"] = {
+                "product_list": ", ".join(get_product_names(vector_db)),
+                "context": catalog_answer,
+                "question": user_input,
+                "chat_history": format_chat_history(chat_history)
+            }
+        log_prompt_tokens(turn["inputs"])
+        return turn
+
+    # 2. Las preguntas frecuentes se responden con la respuesta curada, sin llamar al LLM,
+    # salvo que la consulta siga hablando de un producto de la conversación
+    with metrics.span("faq_fast_path"):
+        faq_answer = None
+        if not refers_to_context(user_input, vector_db, chat_history, retrieval_context):
+            faq_answer = answer_from_faqs(user_input, vector_db)
+    if faq_answer is not None:
+        metrics.count("turns", path="faq")
+        turn["response"] = faq_answer
+        return turn
+
+    # 3. Buscar en la base vectorial (la expansión con historial y sinónimos se hace una sola vez dentro)
+    with metrics.span("search_knowledge_base"):
+        knowledge_base_info = search_knowledge_base(
+            user_input, vector_db, k=3, chat_history=chat_history, retrieval_context=retrieval_context
         )
+    metrics.count("documents_retrieved", len(knowledge_base_info))
+    metrics.observe("context_documents", len(knowledge_base_info), metrics.SIZE_BUCKETS)
+
+    # 4. Si hay resultados, reutilizar una respuesta equivalente o armar el contexto para el LLM
+    if knowledge_base_info:
+        if answer_cache is not None:
+            with metrics.span("answer_cache"):
+                query_vector = vector_db.embedding_function.embed_query(user_input)
+                cached_response = answer_cache.get(query_vector, knowledge_base_info, chat_history, user_input)
+            if cached_response is not None:
+                metrics.count("turns", path="answer_cache")
+                turn["response"] = cached_response
+                return turn
+            turn["cache_entry"] = (query_vector, knowledge_base_info)
+        context = "\n\n".join(knowledge_base_info)
+    # 5. Si no hay resultados, fallback contextualizado
+    else:
+        context = build_fallback_context(user_input, get_product_names(vector_db))
+    metrics.observe("context_chars", len(context), metrics.CHARS_BUCKETS)
+    
+    # Si no hay LLM disponible, usar una respuesta predeterminada para evitar hallucinations
+    if not llm:
+        metrics.count("turns", path="no_llm")
+        turn["response"] = NO_LLM_RESPONSE
+        turn["cache_entry"] = None
+        return turn
+    
+    metrics.count("turns", path="llm")
+    with metrics.span("prompt_format"):
+        turn["inputs"] = {
+            "product_list": ", ".join(get_product_names(vector_db)),
+            "context": context,
+            "question": user_input,
+            "chat_history": format_chat_history(chat_history)
+        }
+    log_prompt_tokens(turn["inputs"])
+    return turn
+
+
+def finish_query(turn: Dict[str, Any], response: str, user_input: str, chat_history: List[Dict[str, str]] = None,
+                 answer_cache: Optional[AnswerCache] = None) -> str:
+    """
+    Guarda en la caché la respuesta generada por el LLM, si corresponde.
+    
+    Args:
+        turn (Dict[str, Any]): Resultado de prepare_query
+        response (str): Respuesta generada por el LLM
+        user_input (str): Consulta original del usuario
+        chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        answer_cache (Optional[AnswerCache], optional): Caché semántica de respuestas
+        
+    Returns:
+        str: La misma respuesta
+    """
+    if answer_cache is not None and turn["cache_entry"] is not None:
+        query_vector, knowledge_base_info = turn["cache_entry"]
+        answer_cache.put(query_vector, knowledge_base_info, chat_history or [], user_input, response)
     return response
 
+
+def build_chain(llm, prompt: ChatPromptTemplate = CHAT_PROMPT):
+    """
+    Arma la cadena prompt | llm | parser.
+    
+    Args:
+        llm: Modelo de lenguaje
+        prompt (ChatPromptTemplate, optional): Prompt de la cadena. Default es CHAT_PROMPT.
+        
+    Returns:
+        Runnable: Cadena lista para invoke/ainvoke
+    """
+    return prompt | llm | StrOutputParser()
+
+
+def get_chain(llm, prompt: ChatPromptTemplate = CHAT_PROMPT):
+    """
+    Devuelve la cadena compilada para el LLM; la arma solo la primera vez y la reutiliza en cada turno.
+    
+    Args:
+        llm: Modelo de lenguaje
+        prompt (ChatPromptTemplate, optional): Prompt de la cadena. Default es CHAT_PROMPT.
+        
+    Returns:
+        Runnable: Cadena lista para invoke/ainvoke/stream/astream
+    """
+    key = (id(llm), id(prompt))
+    entry = _CHAINS.get(key)
+    if entry is None or entry[0] is not llm:
+        with _CHAINS_LOCK:
+            entry = _CHAINS.get(key)
+            if entry is None or entry[0] is not llm:
+                entry = _CHAINS[key] = (llm, build_chain(llm, prompt))
+    return entry[1]
+
+
+def process_query(user_input: str, vector_db: FAISS, llm=None, chat_history: List[Dict[str, str]] = None,
+                  answer_cache: Optional[AnswerCache] = None, retrieval_context: Optional[str] = None) -> str:
+    """
+    Procesa la consulta del usuario y genera una respuesta utilizando solo la base vectorial y el LLM.
+    Si no hay información relevante, genera un fallback contextualizado con sugerencia de web y URL personalizada.
+    Si se pasa una caché de respuestas, reutiliza la respuesta de una consulta casi idéntica con el mismo contexto.
+    """
+    with metrics.turn("query"):
+        turn = prepare_query(user_input, vector_db, llm, chat_history, answer_cache, retrieval_context)
+        if turn["response"] is not None:
+            return turn["response"]
+        
+        with metrics.span("llm"):
+            response = get_chain(llm).invoke(turn["inputs"])
+        return finish_query(turn, response, user_input, chat_history, answer_cache)
+
+
+async def aprocess_query(user_input: str, vector_db: FAISS, llm=None, chat_history: List[Dict[str, str]] = None,
+                         answer_cache: Optional[AnswerCache] = None, executor=None,
+                         retrieval_context: Optional[str] = None) -> str:
+    """
+    Versión asíncrona de process_query.
+    
+    La búsqueda (CPU) corre en el executor indicado y el LLM se llama con ainvoke,
+    así un mismo proceso atiende muchas conversaciones a la vez.
+    
+    Args:
+        user_input (str): Consulta original del usuario
+        vector_db (FAISS): Base de datos vectorial
+        llm: Modelo de lenguaje o None
+        chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        answer_cache (Optional[AnswerCache], optional): Caché semántica de respuestas
+        executor (optional): Pool de hilos para la búsqueda; None usa el del event loop
+        retrieval_context (Optional[str], optional): Productos y temas de la conversación para la búsqueda
+        
+    Returns:
+        str: Respuesta generada
+    """
+    loop = asyncio.get_running_loop()
+    with metrics.turn("query"):
+        # El contexto se copia para que los spans del hilo de búsqueda se sumen a este turno
+        turn = await loop.run_in_executor(executor, functools.partial(
+            contextvars.copy_context().run, prepare_query, user_input, vector_db, llm, chat_history, answer_cache,
+            retrieval_context
+        ))
+        if turn["response"] is not None:
+            return turn["response"]
+        
+        with metrics.span("llm"):
+            response = await get_chain(llm).ainvoke(turn["inputs"])
+        return finish_query(turn, response, user_input, chat_history, answer_cache)
+
+def stream_query(user_input: str, vector_db: FAISS, llm=None, chat_history: List[Dict[str, str]] = None,
+                 answer_cache: Optional[AnswerCache] = None, timings: Optional[Dict[str, float]] = None,
+                 retrieval_context: Optional[str] = None) -> Iterator[str]:
+    """
+    Variante de process_query que entrega la respuesta token a token con chain.stream.
+    
+    Args:
+        user_input (str): Consulta original del usuario
+        vector_db (FAISS): Base de datos vectorial
+        llm: Modelo de lenguaje o None
+        chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        answer_cache (Optional[AnswerCache], optional): Caché semántica de respuestas
+        timings (Optional[Dict[str, float]], optional): Si se pasa, se completa con
+            'ttft_seconds' (tiempo al primer token) y 'total_seconds'
+        retrieval_context (Optional[str], optional): Productos y temas de la conversación para la búsqueda
+        
+    Yields:
+        str: Fragmentos de la respuesta en el orden en que se generan
+    """
+    start = time.perf_counter()
+    timings = timings if timings is not None else {}
+    
+    # El turno cubre la preparación y el stream del LLM (span "llm"), como en process_query;
+    # además se registran los histogramas llm_ttft y llm_stream
+    with metrics.turn("stream"):
+        turn = prepare_query(user_input, vector_db, llm, chat_history, answer_cache, retrieval_context)
+        if turn["response"] is not None:
+            timings["ttft_seconds"] = timings["total_seconds"] = time.perf_counter() - start
+            yield turn["response"]
+            return
+        
+        parts = []
+        with metrics.span("llm"):
+            for token in get_chain(llm).stream(turn["inputs"]):
+                if not parts:
+                    timings["ttft_seconds"] = time.perf_counter() - start
+                parts.append(token)
+                yield token
+        
+        timings["total_seconds"] = time.perf_counter() - start
+        timings.setdefault("ttft_seconds", timings["total_seconds"])
+        metrics.observe("llm_ttft_seconds", timings["ttft_seconds"])
+        metrics.observe("llm_stream_seconds", timings["total_seconds"])
+        logger.info(f"Latencia: primer token {timings['ttft_seconds']:.2f} s, total {timings['total_seconds']:.2f} s")
+        finish_query(turn, "".join(parts), user_input, chat_history, answer_cache)
+
+
+async def astream_query(user_input: str, vector_db: FAISS, llm=None, chat_history: List[Dict[str, str]] = None,
+                        answer_cache: Optional[AnswerCache] = None, executor=None,
+                        timings: Optional[Dict[str, float]] = None,
+                        retrieval_context: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Versión asíncrona de stream_query: búsqueda en el executor y tokens con chain.astream.
+    
+    Args:
+        user_input (str): Consulta original del usuario
+        vector_db (FAISS): Base de datos vectorial
+        llm: Modelo de lenguaje o None
+        chat_history (List[Dict[str, str]], optional): Historial de la conversación
+        answer_cache (Optional[AnswerCache], optional): Caché semántica de respuestas
+        executor (optional): Pool de hilos para la búsqueda; None usa el del event loop
+        timings (Optional[Dict[str, float]], optional): Se completa con 'ttft_seconds' y 'total_seconds'
+        retrieval_context (Optional[str], optional): Productos y temas de la conversación para la búsqueda
+        
+    Yields:
+        str: Fragmentos de la respuesta en el orden en que se generan
+    """
+    start = time.perf_counter()
+    timings = timings if timings is not None else {}
+    
+    loop = asyncio.get_running_loop()
+    with metrics.turn("stream"):
+        turn = await loop.run_in_executor(executor, functools.partial(
+            contextvars.copy_context().run, prepare_query, user_input, vector_db, llm, chat_history, answer_cache,
+            retrieval_context
+        ))
+        if turn["response"] is not None:
+            timings["ttft_seconds"] = timings["total_seconds"] = time.perf_counter() - start
+            yield turn["response"]
+            return
+        
+        parts = []
+        with metrics.span("llm"):
+            async for token in get_chain(llm).astream(turn["inputs"]):
+                if not parts:
+                    timings["ttft_seconds"] = time.perf_counter() - start
+                parts.append(token)
+                yield token
+        
+        timings["total_seconds"] = time.perf_counter() - start
+        timings.setdefault("ttft_seconds", timings["total_seconds"])
+        metrics.observe("llm_ttft_seconds", timings["ttft_seconds"])
+        metrics.observe("llm_stream_seconds", timings["total_seconds"])
+        logger.info(f"Latencia: primer token {timings['ttft_seconds']:.2f} s, total {timings['total_seconds']:.2f} s")
+        finish_query(turn, "".join(parts), user_input, chat_history, answer_cache)
+
+def mentioned_entities(text: str, vector_db: FAISS) -> List[str]:
+    """
+    Productos y tipos de producto nombrados en un mensaje del cliente.
+    
+    Args:
+        text (str): Mensaje del cliente
+        vector_db (FAISS): Base de datos vectorial (con el índice de entidades en entity_index, si existe)
+        
+    Returns:
+        List[str]: Nombres de producto y luego tipos de producto (camastro, fogonero, ...), sin repetir
+    """
+    folded_text = fold_accents(text)
+    entity_index = getattr(vector_db, "entity_index", None)
+    if entity_index is not None:
+        products = [entity["name"] for entity in entity_index.match(text)]
+    else:
+        products = [name for name in get_product_names(vector_db) if fold_accents(name) in folded_text]
+    topics = [keyword for keyword in PRODUCT_QUERY_KEYWORDS if fold_accents(keyword) in folded_text]
+    return products + [topic for topic in topics if topic not in products]
+
+
+def create_conversation_memory(vector_db: FAISS, llm=None) -> ConversationMemory:
+    """
+    Crea la memoria de una conversación según la configuración.
+    
+    Args:
+        vector_db (FAISS): Base de datos vectorial, para reconocer los productos mencionados
+        llm: Modelo de lenguaje; con MEMORY_LLM_SUMMARY resume los turnos viejos, si no el resumen es extractivo
+        
+    Returns:
+        ConversationMemory: Memoria vacía
+    """
+    if llm is not None and MEMORY_LLM_SUMMARY:
+        chain = get_chain(llm, SUMMARY_PROMPT)
+        
+        def summarize_with_llm(summary: str, messages: List[Dict[str, str]]) -> str:
+            return chain.invoke({"summary": summary or "Sin resumen previo.",
+                                 "messages": format_chat_history(messages)})
+        
+        summarizer = summarize_with_llm
+    else:
+        summarizer = None  # ConversationMemory usa el resumen extractivo
+    
+    return ConversationMemory(
+        recent_turns=MEMORY_RECENT_TURNS,
+        max_summary_chars=MEMORY_SUMMARY_MAX_CHARS,
+        max_entities=MEMORY_MAX_ENTITIES,
+        entity_extractor=lambda text: mentioned_entities(text, vector_db),
+        summarizer=summarizer,
+    )
+
+
 def save_conversation_log(chat_history, filename="conversation_log.txt"):
     """
     Guarda el historial de la conversación en un archivo de texto.
@@ -389,26 +1221,30 @@ def save_conversation_log(chat_history, filename="conversation_log.txt"):
         logger.error(f"Error al guardar el log: {str(e)}")
         print(f"\n[Error al guardar el log: {str(e)}]")
 
-def main():
-    """Función principal para ejecutar el chatbot."""
+def run_chat(profiler: Optional[Profiler] = None):
+    """
+    Ejecuta la conversación en consola hasta que el usuario sale.
+    
+    Args:
+        profiler (Optional[Profiler], optional): Perfilador activo; se le avisa al terminar cada turno
+    """
     print("\n===== Bienvenido al Asistente Virtual de Casa Mueble =====")
     print("Escribe 'salir' o 'exit' para terminar la conversación.")
     print("¿En qué puedo ayudarte hoy?\n")
+    metrics.configure(METRICS_ENABLED, METRICS_JSONL_PATH)
     
-    # Cargar embeddings, base de datos vectorial y modelo de lenguaje
-    embeddings = load_embeddings()
-    vector_db = load_vector_db(embeddings)
+    # Cargar embeddings, base de datos vectorial y modelo de lenguaje en paralelo, una sola vez
+    embeddings, vector_db, llm, timings = load_components()
+    print(
+        f"[Inicio] embeddings: {timings['embeddings']:.2f} s | índice FAISS: {timings['indice_faiss']:.2f} s | "
+        f"LLM: {timings['llm']:.2f} s | total: {timings['total']:.2f} s"
+    )
     
-    # Cargar el modelo de lenguaje una sola vez
-    try:
-        llm = load_llm()
-        logger.info("Modelo de lenguaje cargado correctamente")
-    except Exception as e:
-        logger.error(f"Error al cargar el modelo de lenguaje: {str(e)}")
-        llm = None
+    # Caché semántica de respuestas, invalidada si se reconstruye el índice
+    answer_cache = create_answer_cache()
         
-    # Inicializar historial de conversación
-    chat_history = []
+    # Memoria de la conversación: últimos turnos textuales y resumen de los anteriores
+    memory = create_conversation_memory(vector_db, llm)
     hubo_conversacion = False
     while True:
         # Obtener entrada del usuario
@@ -418,33 +1254,63 @@ def main():
         if user_input.lower() in ["salir", "exit", "quit"]:
             print("\n🤖 Asistente: ¡Gracias por utilizar nuestro asistente virtual! ¡Hasta pronto!")
             # Guardar log solo si hubo al menos un intercambio exitoso
-            if hubo_conversacion and len(chat_history) > 1:
-                save_conversation_log(chat_history)
+            if hubo_conversacion and len(memory.transcript()) > 1:
+                save_conversation_log(memory.transcript())
                 print("\n[Conversación registrada en conversation_log.txt]")
+            logger.info(f"Caché de embeddings: {embeddings.stats()}")
+            if answer_cache is not None:
+                logger.info(f"Caché de respuestas: {answer_cache.stats()}")
             break
         
         # Agregar entrada del usuario al historial
-        chat_history.append({"role": "user", "content": user_input})
-        
-        # Limitar tamaño del historial (último par de intercambios)
-        if len(chat_history) > 10:
-            chat_history = chat_history[-10:]
+        memory.add("user", user_input)
         
         # Procesar la consulta y generar respuesta
         try:
-            response = process_query(user_input, vector_db, llm, chat_history)
-            print(f"\n🤖 Asistente: {response}")
+            # Mostrar la respuesta a medida que se genera
+            print("\n🤖 Asistente: ", end="", flush=True)
+            tokens = []
+            for token in stream_query(user_input, vector_db, llm, memory.history(), answer_cache,
+                                      retrieval_context=memory.retrieval_context()):
+                print(token, end="", flush=True)
+                tokens.append(token)
+            print()
+            response = "".join(tokens)
             
-            # Agregar respuesta al historial
-            chat_history.append({"role": "assistant", "content": response})
+            # Agregar respuesta completa al historial
+            memory.add("assistant", response)
             hubo_conversacion = True
+            if profiler is not None:
+                profiler.turn_finished()
         except Exception as e:
             logger.error(f"Error al procesar la consulta: {str(e)}")
             error_msg = "Lo siento, ha ocurrido un error al procesar tu consulta. Por favor, intenta de nuevo."
             print(f"\n🤖 Asistente: {error_msg}")
             
             # También agregar mensaje de error al historial
-            chat_history.append({"role": "assistant", "content": error_msg})
+            memory.add("assistant", error_msg)
+
+
+def main():
+    """Función principal para ejecutar el chatbot."""
+    parser = argparse.ArgumentParser(description="Asistente virtual de Casa Mueble en consola")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Perfilar CPU y memoria (también con {PROFILE_ENV_VAR}=1); se guarda en {PROFILE_DIR}")
+    parser.add_argument("--profile-every", type=int, default=PROFILE_EVERY_TURNS,
+                        help="Guardar un perfil cada N turnos (0: uno al terminar la sesión)")
+    args = parser.parse_args()
+    
+    profiler = requested_profiler("main", args.profile, PROFILE_ENV_VAR, PROFILE_DIR, PROFILE_TOP,
+                                  PROFILE_TRACEMALLOC_FRAMES, args.profile_every)
+    if profiler is None:
+        run_chat()
+        return
+    
+    profiler.start()
+    try:
+        run_chat(profiler)
+    finally:
+        profiler.stop()
 
 if __name__ == "__main__":
     main()
@@ -7,8 +7,15 @@ import sys
 import shutil
 import logging
 import argparse
+from contextlib import nullcontext
 from pathlib import Path
 
+from config import (
+    METRICS_ENABLED, METRICS_JSONL_PATH, PROFILE_ENV_VAR, PROFILE_DIR, PROFILE_TOP, PROFILE_TRACEMALLOC_FRAMES
+)
+from utils import metrics
+from utils.profiling import requested_profiler
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -37,24 +44,103 @@ def list_knowledge_files():
             logger.info(f"  - {file}")
 
 
+def find_knowledge_file(filename):
+    """Devuelve la ruta de un archivo de la base de conocimientos o None si no existe."""
+    for directory in [FAQS_DIR, PRODUCTOS_DIR]:
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def generated_from_csv(filename):
+    """
+    Indica si el archivo es un markdown exportado desde los CSV con el índice armado desde los CSV.
+    
+    Con INDEX_SOURCE = 'csv' esos archivos no se indexan: editarlos o borrarlos no cambia el índice,
+    y la próxima sincronización vuelve a tomar la fila del CSV. Se avisa cómo hacer el cambio.
+    """
+    from config import INDEX_SOURCE
+    from prepare_knowledge_base import GENERATED_FILE_PATTERN
+    if INDEX_SOURCE != "csv" or not GENERATED_FILE_PATTERN.match(os.path.basename(filename)):
+        return False
+    
+    logger.error(
+        f"{os.path.basename(filename)} se genera desde FAQs.csv o catalogo.csv y el índice se arma directo de "
+        f"los CSV (INDEX_SOURCE = 'csv'): modificá la fila del CSV y usá 'update-csv', o agregá el contenido "
+        f"con otro nombre de archivo"
+    )
+    return True
+
+
 def delete_knowledge_file(filename):
-    """Elimina un archivo de la base de conocimientos."""
-    # Buscar en directorio de FAQs
-    faq_path = os.path.join(FAQS_DIR, filename)
-    if os.path.exists(faq_path):
-        os.remove(faq_path)
-        logger.info(f"Archivo eliminado: {faq_path}")
-        return True
-        
-    # Buscar en directorio de productos
-    product_path = os.path.join(PRODUCTOS_DIR, filename)
-    if os.path.exists(product_path):
-        os.remove(product_path)
-        logger.info(f"Archivo eliminado: {product_path}")
+    """Elimina un archivo de la base de conocimientos y sus vectores del índice."""
+    path = find_knowledge_file(filename)
+    if path is None:
+        logger.error(f"No se encontró el archivo: {filename}")
+        return False
+    if generated_from_csv(filename):
+        return False
+    
+    os.remove(path)
+    logger.info(f"Archivo eliminado: {path}")
+    return update_index_incremental([path])
+
+
+def add_knowledge_file(file_path, file_type):
+    """Copia un archivo markdown a la base de conocimientos y lo indexa sin reconstruir."""
+    if not os.path.exists(file_path):
+        logger.error(f"Archivo de origen no encontrado: {file_path}")
+        return False
+    if generated_from_csv(file_path):
+        return False
+    
+    target_dir = FAQS_DIR if file_type == "faqs" else PRODUCTOS_DIR
+    target_path = os.path.join(target_dir, os.path.basename(file_path))
+    if os.path.abspath(file_path) != os.path.abspath(target_path):
+        shutil.copy2(file_path, target_path)
+        logger.info(f"Archivo agregado: {target_path}")
+    
+    return update_index_incremental([target_path])
+
+
+def update_knowledge_file(filename):
+    """Vuelve a indexar un archivo editado, vectorizando solo sus chunks modificados."""
+    path = find_knowledge_file(filename)
+    if path is None:
+        logger.error(f"No se encontró el archivo: {filename}")
+        return False
+    if generated_from_csv(filename):
+        return False
+    
+    return update_index_incremental([path])
+
+
+def report_sync(result):
+    """Informa lo que hizo la sincronización: una actualización incremental o una reconstrucción completa."""
+    if result.get("rebuilt"):
+        logger.info(f"El índice no se pudo actualizar de forma incremental y se reconstruyó completo "
+                    f"({result['chunks']} chunks)")
+    else:
+        logger.info(f"Índice actualizado: {result['added']} chunks agregados, {result['removed']} eliminados, "
+                    f"{result['unchanged']} sin cambios")
+
+
+def update_index_incremental(paths):
+    """Aplica al índice FAISS solo los cambios de los archivos indicados."""
+    try:
+        import indexer
+        report_sync(indexer.sync_files(paths))
         return True
-        
-    logger.error(f"No se encontró el archivo: {filename}")
-    return False
+    except Exception as e:
+        logger.error(f"Error al actualizar el índice: {str(e)}")
+        return False
+
+
+def markdown_export_enabled():
+    """Indica si hay que exportar los CSV a markdown: siempre que el índice se arme desde los markdown."""
+    from config import INDEX_SOURCE, KNOWLEDGE_MARKDOWN_EXPORT
+    return KNOWLEDGE_MARKDOWN_EXPORT or INDEX_SOURCE != "csv"
 
 
 def rebuild_index():
@@ -63,8 +149,8 @@ def rebuild_index():
     
     # Importar indexer y ejecutar main
     try:
-        # Primero ejecutamos prepare_knowledge_base si existe
-        if os.path.exists(os.path.join(BASE_DIR, "prepare_knowledge_base.py")):
+        # Primero exportamos los markdown con prepare_knowledge_base si hacen falta
+        if markdown_export_enabled() and os.path.exists(os.path.join(BASE_DIR, "prepare_knowledge_base.py")):
             logger.info("Ejecutando prepare_knowledge_base.py...")
             import prepare_knowledge_base
             prepare_knowledge_base.main()
@@ -72,13 +158,25 @@ def rebuild_index():
         # Luego reconstruimos el índice
         logger.info("Ejecutando indexer.py...")
         import indexer
-        indexer.main()
-        return True
+        return indexer.main() is not None
     except Exception as e:
         logger.error(f"Error al reconstruir el índice: {str(e)}")
         return False
 
 
+def migrate_index():
+    """Convierte el índice del formato pickle anterior al formato nativo, sin volver a vectorizar."""
+    try:
+        import indexer
+        from config import INDEX_DIR
+        from utils.index_store import migrate_legacy_index
+        migrate_legacy_index(INDEX_DIR, indexer.load_embeddings())
+        return True
+    except Exception as e:
+        logger.error(f"Error al migrar el índice: {str(e)}")
+        return False
+
+
 def update_csv_file(csv_type, file_path=None):
     """Actualiza un archivo CSV de origen y regenera los archivos markdown."""
     if csv_type not in ["faqs", "catalogo"]:
@@ -99,8 +197,17 @@ def update_csv_file(csv_type, file_path=None):
         shutil.copy2(file_path, target_path)
         logger.info(f"Archivo actualizado: {target_path}")
         
-        # Regenerar base de conocimiento
-        return rebuild_index()
+        # Regenerar los markdown (si se exportan) y aplicar al índice solo los chunks que cambiaron
+        try:
+            import prepare_knowledge_base
+            import indexer
+            if markdown_export_enabled():
+                prepare_knowledge_base.main()
+            report_sync(indexer.sync_from_manifest())
+            return True
+        except Exception as e:
+            logger.error(f"Error al actualizar la base de conocimientos: {str(e)}")
+            return False
     else:
         logger.error(f"Archivo de origen no encontrado: {file_path}")
         return False
@@ -109,6 +216,8 @@ def update_csv_file(csv_type, file_path=None):
 def main():
     """Función principal."""
     parser = argparse.ArgumentParser(description="Gestor de la base de conocimientos")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Perfilar CPU y memoria (también con {PROFILE_ENV_VAR}=1); se guarda en {PROFILE_DIR}")
     
     # Definir comandos
     subparsers = parser.add_subparsers(dest="command", help="Comando a ejecutar")
@@ -116,6 +225,15 @@ def main():
     # Comando list
     subparsers.add_parser("list", help="Lista todos los archivos en la base de conocimientos")
     
+    # Comando add
+    add_parser = subparsers.add_parser("add", help="Agrega un archivo markdown y lo indexa de forma incremental")
+    add_parser.add_argument("type", choices=["faqs", "productos"], help="Carpeta de destino")
+    add_parser.add_argument("file_path", help="Ruta del archivo markdown a agregar")
+    
+    # Comando update
+    update_file_parser = subparsers.add_parser("update", help="Reindexa un archivo editado de forma incremental")
+    update_file_parser.add_argument("filename", help="Nombre del archivo modificado")
+    
     # Comando delete
     delete_parser = subparsers.add_parser("delete", help="Elimina un archivo de la base de conocimientos")
     delete_parser.add_argument("filename", help="Nombre del archivo a eliminar")
@@ -128,22 +246,35 @@ def main():
     # Comando rebuild
     subparsers.add_parser("rebuild", help="Reconstruye el índice de la base de conocimientos")
     
+    # Comando migrate-index
+    subparsers.add_parser("migrate-index", help="Convierte un índice pickle (index.pkl) al formato nativo")
+    
     # Parsear argumentos
     args = parser.parse_args()
+    metrics.configure(METRICS_ENABLED, METRICS_JSONL_PATH)
+    profiler = None
+    if args.command:
+        profiler = requested_profiler(f"manage-{args.command}", args.profile, PROFILE_ENV_VAR, PROFILE_DIR,
+                                      PROFILE_TOP, PROFILE_TRACEMALLOC_FRAMES)
     
     # Ejecutar comando correspondiente
-    if args.command == "list":
-        list_knowledge_files()
-    elif args.command == "delete":
-        success = delete_knowledge_file(args.filename)
-        if success:
+    with profiler or nullcontext():
+        if args.command == "list":
+            list_knowledge_files()
+        elif args.command == "add":
+            add_knowledge_file(args.file_path, args.type)
+        elif args.command == "update":
+            update_knowledge_file(args.filename)
+        elif args.command == "delete":
+            delete_knowledge_file(args.filename)
+        elif args.command == "update-csv":
+            update_csv_file(args.type, args.file_path)
+        elif args.command == "rebuild":
             rebuild_index()
-    elif args.command == "update-csv":
-        update_csv_file(args.type, args.file_path)
-    elif args.command == "rebuild":
-        rebuild_index()
-    else:
-        parser.print_help()
+        elif args.command == "migrate-index":
+            migrate_index()
+        else:
+            parser.print_help()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,22 @@
 """
 Script para preparar la base de conocimientos a partir de archivos CSV.
-Convierte los datos de productos y FAQs en documentos Markdown para vectorización.
+Convierte los datos de productos y FAQs en documentos para vectorización: el indexador los
+toma en memoria (iter_csv_documents) y este script los exporta también como archivos Markdown.
 """
 import os
+import re
+import json
+import hashlib
 import pandas as pd
 import logging
+from typing import List, Dict, Any, Iterator, Optional
 import requests
 from bs4 import BeautifulSoup
 from markdownify import markdownify as md
+from langchain_core.documents import Document
 
-from config import KNOWLEDGE_DIR, CATALOGO_PATH, FAQS_PATH
+from config import KNOWLEDGE_DIR, CATALOGO_PATH, FAQS_PATH, KNOWLEDGE_MANIFEST_PATH
+from utils.faq_index import read_faq_rows
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +26,9 @@ logger = logging.getLogger(__name__)
 FAQS_DIR = os.path.join(KNOWLEDGE_DIR, "faqs")
 PRODUCTOS_DIR = os.path.join(KNOWLEDGE_DIR, "productos")
 
+# Nombres de los archivos que genera este script (el resto de los .md se agregan a mano)
+GENERATED_FILE_PATTERN = re.compile(r"^(faq|producto|categoria)_.+\.md$")
+
 
 def ensure_directories():
     """Crea los directorios necesarios si no existen."""
@@ -27,104 +37,97 @@ def ensure_directories():
     logger.info(f"Directorios creados: {FAQS_DIR}, {PRODUCTOS_DIR}")
 
 
-def process_faqs():
-    """Procesa el archivo CSV de FAQs y crea documentos markdown individuales."""
+def read_faqs_frame() -> pd.DataFrame:
+    """
+    Lee FAQs.csv probando primero con pandas y luego con el lector tolerante a comas sin comillas.
+    
+    Returns:
+        pd.DataFrame: Preguntas frecuentes
+    """
+    # Leer el CSV con manejo especial para texto con comas
     try:
-        logger.info(f"Procesando FAQs desde {FAQS_PATH}")
-        
-        # Leer el CSV con manejo especial para texto con comas
+        # Intentar primero leer con comillas dobles para campos con comas
+        df = pd.read_csv(FAQS_PATH, quotechar='"', escapechar='\\')
+    except Exception as e:
+        logger.warning(f"Error con primer método de lectura: {str(e)}")
         try:
-            # Intentar primero leer con comillas dobles para campos con comas
-            df = pd.read_csv(FAQS_PATH, quotechar='"', escapechar='\\')
-        except Exception as e:
-            logger.warning(f"Error con primer método de lectura: {str(e)}")
-            try:
-                # Segundo intento con parámetros más permisivos
-                df = pd.read_csv(FAQS_PATH, sep=',', quotechar='"', doublequote=True, 
-                                 escapechar='\\', engine='python')
-            except Exception as e2:
-                logger.warning(f"Error con segundo método de lectura: {str(e2)}")
-                # Último intento: abrir el archivo manualmente y procesarlo línea por línea
-                with open(FAQS_PATH, 'r', encoding='utf-8') as file:
-                    lines = file.readlines()
-                
-                # Obtener encabezados de la primera línea
-                headers = lines[0].strip().split(',')
-                data = []
-                
-                # Procesar cada línea manualmente
-                for line in lines[1:]:
-                    # Dividir cada línea en sus campos, respetando comillas
-                    fields = []
-                    field = ""
-                    in_quotes = False
-                    
-                    for char in line:
-                        if char == '"':
-                            in_quotes = not in_quotes
-                            field += char
-                        elif char == ',' and not in_quotes:
-                            fields.append(field.strip())
-                            field = ""
-                        else:
-                            field += char
-                    
-                    # Añadir el último campo
-                    if field:
-                        fields.append(field.strip())
-                    
-                    # Asegurarse de que hay al menos 2 campos (pregunta y respuesta)
-                    if len(fields) >= 2:
-                        row_data = {}
-                        for i, header in enumerate(headers[:min(len(headers), len(fields))]):
-                            row_data[header] = fields[i]
-                        data.append(row_data)
-                
-                # Crear DataFrame desde los datos procesados manualmente
-                df = pd.DataFrame(data)
-        
-        # Verificar las columnas disponibles en el CSV
-        columns = df.columns.tolist()
-        logger.info(f"Columnas detectadas en el CSV de FAQs: {columns}")
-        
-        # Identificar las columnas principales
-        pregunta_col = [col for col in columns if 'pregunta' in col.lower()][0] if any('pregunta' in col.lower() for col in columns) else columns[0]
-        respuesta_col = [col for col in columns if 'respuesta' in col.lower()][0] if any('respuesta' in col.lower() for col in columns) else columns[1]
-        
-        # Columnas opcionales
-        categoria_col = next((col for col in columns if 'categor' in col.lower()), None)
-        etapa_col = next((col for col in columns if 'etapa' in col.lower()), None)
-        objetivo_col = next((col for col in columns if 'objetivo' in col.lower()), None)
-        siguiente_paso_col = next((col for col in columns if 'siguiente' in col.lower() or 'paso' in col.lower()), None)
-        
-        for idx, row in df.iterrows():
-            # Crear un documento por cada FAQ
-            categoria = row[categoria_col] if categoria_col and pd.notna(row[categoria_col]) else "General"
-            filename = f"faq_{idx:03d}_{categoria.lower().replace(' ', '_')}.md"
-            filepath = os.path.join(FAQS_DIR, filename)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"# {row[pregunta_col]}\n\n")
-                f.write(f"{row[respuesta_col]}\n\n")
-                
-                # Agregar información adicional si está disponible
-                if categoria_col and pd.notna(row[categoria_col]):
-                    f.write(f"**Categoría:** {row[categoria_col]}\n")
-                
-                if etapa_col and pd.notna(row[etapa_col]):
-                    f.write(f"**Etapa:** {row[etapa_col]}\n")
-                
-                if objetivo_col and pd.notna(row[objetivo_col]):
-                    f.write(f"\n**Objetivo:** {row[objetivo_col]}\n")
-                
-                if siguiente_paso_col and pd.notna(row[siguiente_paso_col]):
-                    f.write(f"\n**Siguiente paso sugerido:** {row[siguiente_paso_col]}\n")
-            
-        logger.info(f"Se procesaron {len(df)} FAQs")
+            # Segundo intento con parámetros más permisivos
+            df = pd.read_csv(FAQS_PATH, sep=',', quotechar='"', doublequote=True, 
+                             escapechar='\\', engine='python')
+        except Exception as e2:
+            logger.warning(f"Error con segundo método de lectura: {str(e2)}")
+            # Último intento: leer con csv uniendo en la última columna las comas sin comillas
+            headers, rows = read_faq_rows(FAQS_PATH)
+            df = pd.DataFrame(rows, columns=headers)
+    
+    return df
+
+
+def faq_documents() -> Iterator[Document]:
+    """
+    Genera un documento por pregunta de FAQs.csv, con el mismo texto que su archivo markdown.
+    
+    Yields:
+        Document: FAQ con metadatos 'source' (ruta del markdown equivalente), 'tipo', 'faq_id',
+        'pregunta' y 'categoria'
+    """
+    logger.info(f"Procesando FAQs desde {FAQS_PATH}")
+    df = read_faqs_frame()
+    
+    # Verificar las columnas disponibles en el CSV
+    columns = df.columns.tolist()
+    logger.info(f"Columnas detectadas en el CSV de FAQs: {columns}")
+    
+    # Identificar las columnas principales
+    pregunta_col = [col for col in columns if 'pregunta' in col.lower()][0] if any('pregunta' in col.lower() for col in columns) else columns[0]
+    respuesta_col = [col for col in columns if 'respuesta' in col.lower()][0] if any('respuesta' in col.lower() for col in columns) else columns[1]
+    
+    # Columnas opcionales
+    categoria_col = next((col for col in columns if 'categor' in col.lower()), None)
+    etapa_col = next((col for col in columns if 'etapa' in col.lower()), None)
+    objetivo_col = next((col for col in columns if 'objetivo' in col.lower()), None)
+    siguiente_paso_col = next((col for col in columns if 'siguiente' in col.lower() or 'paso' in col.lower()), None)
+    
+    # Armar todos los documentos con operaciones por columna, sin recorrer fila por fila
+    categorias = (df[categoria_col].where(df[categoria_col].notna(), "General").astype(str)
+                  if categoria_col else pd.Series("General", index=df.index))
+    filenames = ("faq_" + df.index.to_series().map("{:03d}".format) + "_"
+                 + categorias.str.lower().str.replace(' ', '_', regex=False) + ".md")
+    contents = (
+        "# " + df[pregunta_col].astype(str) + "\n\n" + df[respuesta_col].astype(str) + "\n\n"
+        + optional_field(df, categoria_col, "**Categoría:** ", "\n")
+        + optional_field(df, etapa_col, "**Etapa:** ", "\n")
+        + optional_field(df, objetivo_col, "\n**Objetivo:** ", "\n")
+        + optional_field(df, siguiente_paso_col, "\n**Siguiente paso sugerido:** ", "\n")
+    )
+    
+    for idx, filename, content, pregunta, categoria in zip(df.index, filenames, contents,
+                                                         df[pregunta_col].astype(str), categorias):
+        yield Document(page_content=content, metadata={
+            "source": os.path.join(FAQS_DIR, filename),
+            "tipo": "faq",
+            "faq_id": int(idx),
+            "pregunta": pregunta,
+            "categoria": categoria,
+        })
+    
+    logger.info(f"Se procesaron {len(df)} FAQs")
+
+
+def process_faqs() -> Optional[Dict[str, str]]:
+    """
+    Procesa el archivo CSV de FAQs y arma un documento markdown por pregunta.
+    
+    Returns:
+        Optional[Dict[str, str]]: Contenido de cada archivo por ruta, o None si no se pudo leer el CSV
+    """
+    try:
+        return {doc.metadata["source"]: doc.page_content for doc in faq_documents()}
     
     except Exception as e:
         logger.error(f"Error al procesar FAQs: {str(e)}")
         logger.exception(e)
+        return None
 
 
 def clean_value(value):
@@ -134,151 +137,274 @@ def clean_value(value):
     return str(value).strip()
 
 
-def process_catalogo():
-    """Procesa el archivo CSV del catálogo y crea documentos por categorías y productos."""
-    try:
-        logger.info(f"Procesando catálogo desde {CATALOGO_PATH}")
-        
-        # Leer el archivo CSV con manejo especial para delimitadores y comillas
-        try:
-            # Intentar primero con parámetros para manejar campos con comas
-            df = pd.read_csv(CATALOGO_PATH, quotechar='"', escapechar='\\')
-        except Exception as e:
-            logger.warning(f"Error con primer método de lectura: {str(e)}")
-            try:
-                # Segundo intento con parámetros más permisivos
-                df = pd.read_csv(CATALOGO_PATH, sep=',', quotechar='"', doublequote=True, 
-                                 escapechar='\\', engine='python')
-            except Exception as e2:
-                logger.warning(f"Error con segundo método de lectura: {str(e2)}")
-                # Último intento: abrir el archivo manualmente y procesarlo línea por línea
-                with open(CATALOGO_PATH, 'r', encoding='utf-8') as file:
-                    lines = file.readlines()
-                
-                # Obtener encabezados de la primera línea
-                headers = lines[0].strip().split(',')
-                data = []
-                
-                # Procesar cada línea manualmente
-                for line in lines[1:]:
-                    # Dividir cada línea en sus campos, respetando comillas
-                    fields = []
-                    field = ""
-                    in_quotes = False
-                    
-                    for char in line:
-                        if char == '"':
-                            in_quotes = not in_quotes
-                            field += char
-                        elif char == ',' and not in_quotes:
-                            fields.append(field.strip())
-                            field = ""
-                        else:
-                            field += char
-                    
-                    # Añadir el último campo
-                    if field:
-                        fields.append(field.strip())
-                    
-                    # Crear un diccionario con encabezados y valores
-                    if fields:
-                        row_data = {}
-                        for i, header in enumerate(headers[:min(len(headers), len(fields))]):
-                            row_data[header] = fields[i]
-                        data.append(row_data)
-                
-                # Crear DataFrame desde los datos procesados manualmente
-                df = pd.DataFrame(data)
-        
-        # Verificar las columnas disponibles
-        columns = df.columns.tolist()
-        logger.info(f"Columnas detectadas en el CSV de catálogo: {columns}")
+def clean_column(column: pd.Series) -> pd.Series:
+    """Versión por columna de clean_value."""
+    return column.astype(str).str.strip().where(column.notna(), "")
+
+
+def optional_field(df: pd.DataFrame, col: Optional[str], prefix: str, suffix: str) -> pd.Series:
+    """
+    Arma una sección de texto por fila para una columna opcional.
+    
+    Args:
+        df (pd.DataFrame): Datos del CSV
+        col (Optional[str]): Columna a usar, o None si el CSV no la tiene
+        prefix (str): Texto antes del valor
+        suffix (str): Texto después del valor
         
-        # Identificar columnas principales
-        producto_col = next((col for col in columns if 'producto' in col.lower() or 'nombre' in col.lower()), columns[0])
-        descripcion_col = next((col for col in columns if 'descrip' in col.lower()), columns[1] if len(columns) > 1 else None)
-        precio_col = next((col for col in columns if 'precio' in col.lower()), columns[2] if len(columns) > 2 else None)
-        categoria_col = next((col for col in columns if 'categor' in col.lower()), None)
+    Returns:
+        pd.Series: prefix + valor + suffix en las filas con valor, cadena vacía en el resto
+    """
+    if not col:
+        return pd.Series("", index=df.index)
+    return (prefix + clean_column(df[col]) + suffix).where(df[col].notna(), "")
+
+
+def content_hash(content: str) -> str:
+    """Hash SHA-256 del contenido de un archivo generado."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def write_atomic(path: str, content: str) -> None:
+    """Escribe un archivo en uno temporal y lo renombra, para no dejarlo nunca a medio escribir."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def relative_path(path: str) -> str:
+    """Ruta relativa a la base de conocimientos con separador '/'."""
+    return os.path.relpath(path, KNOWLEDGE_DIR).replace(os.sep, "/")
+
+
+def sync_generated_files(rendered: Dict[str, str], managed_dirs: List[str]) -> Dict[str, Any]:
+    """
+    Escribe solo los archivos cuyo contenido cambió y elimina los generados por filas que ya no existen.
+    
+    Los archivos agregados a mano no se tocan: solo se eliminan los que figuran en el manifiesto
+    anterior (o, si no hay manifiesto, los que siguen el patrón de nombres generado).
+    
+    Args:
+        rendered (Dict[str, str]): Contenido de cada archivo generado por ruta
+        managed_dirs (List[str]): Directorios cuyos archivos generados se pueden eliminar
         
-        # Crear un archivo por producto 
-        for idx, row in df.iterrows():
-            producto = clean_value(row[producto_col])
-            if not producto:
-                continue  # Saltamos filas sin nombre de producto
-                
-            # Generar nombre de archivo seguro
-            filename = f"producto_{idx:03d}_{producto.lower().replace(' ', '_').replace('/', '_')}.md"
-            filepath = os.path.join(PRODUCTOS_DIR, filename)
+    Returns:
+        Dict[str, Any]: Manifiesto con el hash de cada archivo y las rutas modificadas ('changed')
+        y eliminadas ('deleted'), relativas a la base de conocimientos
+    """
+    previous_files = {}
+    if os.path.exists(KNOWLEDGE_MANIFEST_PATH):
+        with open(KNOWLEDGE_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            previous_files = json.load(f).get("files", {})
+    
+    managed = {relative_path(directory) for directory in managed_dirs}
+    
+    def in_managed_dir(key: str) -> bool:
+        return key.rsplit("/", 1)[0] in managed
+    
+    # Los archivos de directorios no procesados en esta corrida se conservan en el manifiesto
+    files = {key: digest for key, digest in previous_files.items() if not in_managed_dir(key)}
+    changed = []
+    for path, content in rendered.items():
+        key = relative_path(path)
+        digest = content_hash(content)
+        files[key] = digest
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                if content_hash(f.read()) == digest:
+                    continue
+        write_atomic(path, content)
+        changed.append(key)
+    
+    if previous_files:
+        candidates = {key for key in previous_files if in_managed_dir(key)}
+    else:
+        candidates = {
+            relative_path(os.path.join(directory, name))
+            for directory in managed_dirs if os.path.isdir(directory)
+            for name in os.listdir(directory) if GENERATED_FILE_PATTERN.match(name)
+        }
+    deleted = []
+    for key in sorted(candidates - set(files)):
+        path = os.path.join(KNOWLEDGE_DIR, *key.split("/"))
+        if os.path.exists(path):
+            os.remove(path)
+            deleted.append(key)
+    
+    manifest = {"files": files, "changed": changed, "deleted": deleted}
+    write_atomic(KNOWLEDGE_MANIFEST_PATH, json.dumps(manifest, ensure_ascii=False, indent=2))
+    logger.info(f"Archivos generados: {len(changed)} modificados, {len(deleted)} eliminados, "
+                f"{len(rendered) - len(changed)} sin cambios")
+    
+    return manifest
+
+
+def read_catalog_frame() -> pd.DataFrame:
+    """
+    Lee catalogo.csv probando primero con pandas y luego línea por línea.
+    
+    Returns:
+        pd.DataFrame: Productos del catálogo
+    """
+    # Leer el archivo CSV con manejo especial para delimitadores y comillas
+    try:
+        # Intentar primero con parámetros para manejar campos con comas
+        df = pd.read_csv(CATALOGO_PATH, quotechar='"', escapechar='\\')
+    except Exception as e:
+        logger.warning(f"Error con primer método de lectura: {str(e)}")
+        try:
+            # Segundo intento con parámetros más permisivos
+            df = pd.read_csv(CATALOGO_PATH, sep=',', quotechar='"', doublequote=True, 
+                             escapechar='\\', engine='python')
+        except Exception as e2:
+            logger.warning(f"Error con segundo método de lectura: {str(e2)}")
+            # Último intento: abrir el archivo manualmente y procesarlo línea por línea
+            with open(CATALOGO_PATH, 'r', encoding='utf-8') as file:
+                lines = file.readlines()
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                # Título y detalles principales
-                f.write(f"# {producto}\n\n")
-                
-                # Categoría si existe
-                if categoria_col and pd.notna(row[categoria_col]):
-                    categoria = clean_value(row[categoria_col])
-                    f.write(f"**Categoría:** {categoria}\n\n")
+            # Obtener encabezados de la primera línea
+            headers = lines[0].strip().split(',')
+            data = []
+            
+            # Procesar cada línea manualmente
+            for line in lines[1:]:
+                # Dividir cada línea en sus campos, respetando comillas
+                fields = []
+                field = ""
+                in_quotes = False
                 
-                # Descripción
-                if descripcion_col and pd.notna(row[descripcion_col]):
-                    descripcion = clean_value(row[descripcion_col])
-                    f.write(f"## Descripción\n\n{descripcion}\n\n")
+                for char in line:
+                    if char == '"':
+                        in_quotes = not in_quotes
+                        field += char
+                    elif char == ',' and not in_quotes:
+                        fields.append(field.strip())
+                        field = ""
+                    else:
+                        field += char
                 
-                # Precio
-                if precio_col and pd.notna(row[precio_col]):
-                    precio = clean_value(row[precio_col])
-                    f.write(f"## Precio\n\n**Precio:** ${precio}\n\n")
+                # Añadir el último campo
+                if field:
+                    fields.append(field.strip())
                 
-                # Otras características si existen (columnas adicionales)
-                f.write("## Características\n\n")
-                for col in columns:
-                    if col not in [producto_col, descripcion_col, precio_col, categoria_col] and pd.notna(row[col]):
-                        f.write(f"**{col}:** {clean_value(row[col])}\n\n")
-        
-        # También crear archivos por categoría si existe la columna de categoría
-        if categoria_col:
-            categorias = {}
-            for idx, row in df.iterrows():
-                if pd.notna(row[categoria_col]):
-                    categoria = clean_value(row[categoria_col])
-                    if categoria not in categorias:
-                        categorias[categoria] = []
-                    
-                    producto_info = {
-                        "nombre": clean_value(row[producto_col]),
-                        "descripcion": clean_value(row[descripcion_col]) if descripcion_col and pd.notna(row[descripcion_col]) else "",
-                        "precio": clean_value(row[precio_col]) if precio_col and pd.notna(row[precio_col]) else ""
-                    }
-                    
-                    categorias[categoria].append(producto_info)
+                # Crear un diccionario con encabezados y valores
+                if fields:
+                    row_data = {}
+                    for i, header in enumerate(headers[:min(len(headers), len(fields))]):
+                        row_data[header] = fields[i]
+                    data.append(row_data)
             
-            # Crear un archivo por categoría
-            for categoria, productos in categorias.items():
-                if not categoria or not productos:
-                    continue
-                    
-                filename = f"categoria_{categoria.lower().replace(' ', '_').replace('/', '_')}.md"
-                filepath = os.path.join(PRODUCTOS_DIR, filename)
-                
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    f.write(f"# Categoría: {categoria}\n\n")
-                    
-                    for producto in productos:
-                        f.write(f"## {producto['nombre']}\n\n")
-                        
-                        if producto['descripcion']:
-                            f.write(f"{producto['descripcion']}\n\n")
-                        
-                        if producto['precio']:
-                            f.write(f"**Precio:** ${producto['precio']}\n\n")
-                        
-                        f.write("---\n\n")
-        
-        logger.info(f"Se procesaron {len(df)} productos en {len(categorias) if 'categorias' in locals() else 0} categorías")
+            # Crear DataFrame desde los datos procesados manualmente
+            df = pd.DataFrame(data)
+    
+    return df
+
+
+def catalog_documents() -> Iterator[Document]:
+    """
+    Genera un documento por producto (y por categoría, si el CSV la tiene) con el mismo texto que su markdown.
+    
+    Yields:
+        Document: Producto con metadatos 'source' (ruta del markdown equivalente), 'tipo', 'producto',
+        'precio' y 'categoria'; o categoría con 'source', 'tipo' y 'categoria'
+    """
+    logger.info(f"Procesando catálogo desde {CATALOGO_PATH}")
+    df = read_catalog_frame()
+    
+    # Verificar las columnas disponibles
+    columns = df.columns.tolist()
+    logger.info(f"Columnas detectadas en el CSV de catálogo: {columns}")
+    
+    # Identificar columnas principales
+    producto_col = next((col for col in columns if 'producto' in col.lower() or 'nombre' in col.lower()), columns[0])
+    descripcion_col = next((col for col in columns if 'descrip' in col.lower()), columns[1] if len(columns) > 1 else None)
+    precio_col = next((col for col in columns if 'precio' in col.lower()), columns[2] if len(columns) > 2 else None)
+    categoria_col = next((col for col in columns if 'categor' in col.lower()), None)
+    
+    # Armar los documentos por producto con operaciones por columna, sin recorrer fila por fila
+    df = df.assign(**{producto_col: clean_column(df[producto_col])})
+    df = df[df[producto_col] != ""]  # Saltamos filas sin nombre de producto
+    
+    filenames = ("producto_" + df.index.to_series().map("{:03d}".format) + "_"
+                 + df[producto_col].str.lower().str.replace(' ', '_', regex=False).str.replace('/', '_', regex=False)
+                 + ".md")
+    contents = (
+        "# " + df[producto_col] + "\n\n"
+        + optional_field(df, categoria_col, "**Categoría:** ", "\n\n")
+        + optional_field(df, descripcion_col, "## Descripción\n\n", "\n\n")
+        + optional_field(df, precio_col, "## Precio\n\n**Precio:** $", "\n\n")
+        + "## Características\n\n"
+    )
+    # Otras características si existen (columnas adicionales)
+    for col in columns:
+        if col not in [producto_col, descripcion_col, precio_col, categoria_col]:
+            contents = contents + optional_field(df, col, f"**{col}:** ", "\n\n")
+    
+    precios = (pd.to_numeric(df[precio_col], errors="coerce") if precio_col
+               else pd.Series(float("nan"), index=df.index))
+    categorias_producto = clean_column(df[categoria_col]) if categoria_col else pd.Series("", index=df.index)
+    for filename, content, producto, precio, categoria in zip(filenames, contents, df[producto_col],
+                                                            precios, categorias_producto):
+        yield Document(page_content=content, metadata={
+            "source": os.path.join(PRODUCTOS_DIR, filename),
+            "tipo": "producto",
+            "producto": producto,
+            "precio": None if pd.isna(precio) else float(precio),
+            "categoria": categoria or None,
+        })
+    
+    # También crear archivos por categoría si existe la columna de categoría (un solo recorrido con groupby)
+    categorias = 0
+    if categoria_col:
+        con_categoria = df[df[categoria_col].notna()]
+        secciones = (
+            "## " + con_categoria[producto_col] + "\n\n"
+            + optional_field(con_categoria, descripcion_col, "", "\n\n")
+            + optional_field(con_categoria, precio_col, "**Precio:** $", "\n\n")
+            + "---\n\n"
+        )
+        for categoria, grupo in secciones.groupby(clean_column(con_categoria[categoria_col]), sort=False):
+            if not categoria:
+                continue
+            filename = f"categoria_{categoria.lower().replace(' ', '_').replace('/', '_')}.md"
+            categorias += 1
+            yield Document(page_content=f"# Categoría: {categoria}\n\n" + "".join(grupo), metadata={
+                "source": os.path.join(PRODUCTOS_DIR, filename),
+                "tipo": "categoria",
+                "categoria": categoria,
+            })
+    
+    logger.info(f"Se procesaron {len(df)} productos en {categorias} categorías")
+
+
+def process_catalogo() -> Optional[Dict[str, str]]:
+    """
+    Procesa el archivo CSV del catálogo y arma documentos por producto y por categoría.
+    
+    Returns:
+        Optional[Dict[str, str]]: Contenido de cada archivo por ruta, o None si no se pudo leer el CSV
+    """
+    try:
+        return {doc.metadata["source"]: doc.page_content for doc in catalog_documents()}
     
     except Exception as e:
         logger.error(f"Error al procesar catálogo: {str(e)}")
         logger.exception(e)
+        return None
+
+
+def iter_csv_documents() -> Iterator[Document]:
+    """
+    Genera en memoria los documentos de FAQs.csv y catalogo.csv, sin pasar por los archivos markdown.
+    
+    Yields:
+        Document: Documentos de FAQs, productos y categorías
+    """
+    if os.path.exists(FAQS_PATH):
+        yield from faq_documents()
+    if os.path.exists(CATALOGO_PATH):
+        yield from catalog_documents()
 
 
 def process_web_to_markdown(url, output_path):
@@ -304,8 +430,13 @@ def process_web_to_markdown(url, output_path):
         logger.error(f"Error al procesar web {url}: {str(e)}")
 
 
-def main():
-    """Función principal."""
+def main() -> Dict[str, Any]:
+    """
+    Función principal.
+    
+    Returns:
+        Dict[str, Any]: Manifiesto con las rutas modificadas y eliminadas (ver sync_generated_files)
+    """
     logger.info("Iniciando preparación de la base de conocimientos")
     ensure_directories()
 
@@ -324,10 +455,20 @@ def main():
     except Exception as e:
         logger.warning(f"Error al procesar datos de la web: {str(e)}. Continuando con el resto del proceso.")
 
-    # Procesar FAQs y catálogo desde CSV
-    process_faqs()
-    process_catalogo()
+    # Procesar FAQs y catálogo desde CSV, escribiendo solo lo que cambió
+    faqs = process_faqs()
+    catalogo = process_catalogo()
+    
+    rendered, managed_dirs = {}, []
+    for files, directory in [(faqs, FAQS_DIR), (catalogo, PRODUCTOS_DIR)]:
+        # Si un CSV no se pudo leer, sus archivos quedan como estaban
+        if files is not None:
+            rendered.update(files)
+            managed_dirs.append(directory)
+    manifest = sync_generated_files(rendered, managed_dirs)
+    
     logger.info("Preparación de la base de conocimientos completada")
+    return manifest
 
 
 if __name__ == "__main__":
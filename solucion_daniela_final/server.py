@@ -0,0 +1,263 @@
+"""
+Servicio HTTP asíncrono para el chatbot de Casa Mueble.
+
+Carga una sola vez el modelo de embeddings, el índice FAISS y el LLM, y atiende
+muchas conversaciones en paralelo: la búsqueda corre en un pool de hilos y el LLM
+se llama con ainvoke. Endpoints:
+- POST /chat     {"session_id": opcional, "message": "..."}
+- POST /chat/stream  mismo cuerpo; devuelve la respuesta en texto a medida que se genera
+- GET  /health
+- GET  /metrics
+- GET  /metrics/prometheus  spans, contadores e histogramas del pipeline (con METRICS_ENABLED)
+"""
+import time
+import uuid
+import asyncio
+import logging
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional
+
+from aiohttp import web
+
+from config import (
+    SERVER_HOST, SERVER_PORT, SERVER_RETRIEVAL_WORKERS, SERVER_MAX_SESSIONS, METRICS_ENABLED, METRICS_JSONL_PATH
+)
+from main import (
+    aprocess_query, astream_query, create_answer_cache, create_conversation_memory, get_chain, load_components
+)
+from utils import metrics as pipeline_metrics
+from utils.answer_cache import AnswerCache
+from utils.stub_llm import StubLLM
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ERROR_RESPONSE = "Lo siento, ha ocurrido un error al procesar tu consulta. Por favor, intenta de nuevo."
+
+
+class SessionStore:
+    """
+    Memorias de conversación (ConversationMemory) en memoria, con un lock por sesión y desalojo LRU.
+    """
+
+    def __init__(self, max_sessions: int, memory_factory: Callable[[], Any]):
+        self.max_sessions = max_sessions
+        self.memory_factory = memory_factory
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        """Devuelve la sesión, creándola si no existe."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"memory": self.memory_factory(), "lock": asyncio.Lock()}
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+async def handle_chat(request: web.Request) -> web.Response:
+    """Procesa un mensaje del cliente dentro de su sesión."""
+    app = request.app
+    try:
+        payload = await request.json()
+    except ValueError:
+        return web.json_response({"error": "El cuerpo debe ser JSON"}, status=400)
+    
+    message = str(payload.get("message", "")).strip()
+    if not message:
+        return web.json_response({"error": "Falta el campo 'message'"}, status=400)
+    
+    session_id = payload.get("session_id") or uuid.uuid4().hex
+    session = app["sessions"].get(session_id)
+    metrics = app["metrics"]
+    metrics["requests_total"] += 1
+    start = time.perf_counter()
+    
+    # Los turnos de una misma sesión se procesan en orden
+    async with session["lock"]:
+        memory = session["memory"]
+        memory.add("user", message)
+        
+        try:
+            response = await aprocess_query(
+                message, app["vector_db"], app["llm"], memory.history(), app["answer_cache"], app["executor"],
+                retrieval_context=memory.retrieval_context()
+            )
+        except Exception as e:
+            logger.error(f"Error al procesar la consulta: {str(e)}")
+            metrics["errors_total"] += 1
+            response = ERROR_RESPONSE
+        
+        memory.add("assistant", response)
+    
+    latency = time.perf_counter() - start
+    metrics["latency_seconds_sum"] += latency
+    
+    return web.json_response({
+        "session_id": session_id,
+        "response": response,
+        "latency_ms": round(latency * 1000, 1),
+    })
+
+
+async def handle_chat_stream(request: web.Request) -> web.StreamResponse:
+    """Procesa un mensaje y envía los tokens de la respuesta a medida que se generan."""
+    app = request.app
+    try:
+        payload = await request.json()
+    except ValueError:
+        return web.json_response({"error": "El cuerpo debe ser JSON"}, status=400)
+    
+    message = str(payload.get("message", "")).strip()
+    if not message:
+        return web.json_response({"error": "Falta el campo 'message'"}, status=400)
+    
+    session_id = payload.get("session_id") or uuid.uuid4().hex
+    session = app["sessions"].get(session_id)
+    metrics = app["metrics"]
+    metrics["requests_total"] += 1
+    
+    stream = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8", "X-Session-Id": session_id})
+    await stream.prepare(request)
+    
+    async with session["lock"]:
+        memory = session["memory"]
+        memory.add("user", message)
+        
+        timings: Dict[str, float] = {}
+        parts = []
+        try:
+            async for token in astream_query(
+                message, app["vector_db"], app["llm"], memory.history(), app["answer_cache"], app["executor"], timings,
+                retrieval_context=memory.retrieval_context()
+            ):
+                parts.append(token)
+                await stream.write(token.encode("utf-8"))
+        except Exception as e:
+            logger.error(f"Error al procesar la consulta: {str(e)}")
+            metrics["errors_total"] += 1
+            if not parts:
+                parts.append(ERROR_RESPONSE)
+                await stream.write(ERROR_RESPONSE.encode("utf-8"))
+        
+        # El historial guarda el texto completo al terminar el stream
+        memory.add("assistant", "".join(parts))
+    
+    metrics["latency_seconds_sum"] += timings.get("total_seconds", 0.0)
+    metrics["ttft_seconds_sum"] += timings.get("ttft_seconds", 0.0)
+    metrics["stream_requests_total"] += 1
+    await stream.write_eof()
+    return stream
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    """Indica si el servicio está listo para responder."""
+    return web.json_response({"status": "ok", "llm": type(request.app["llm"]).__name__ if request.app["llm"] else None})
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """Devuelve contadores del servicio y de las cachés."""
+    app = request.app
+    metrics = dict(app["metrics"])
+    metrics["sessions_active"] = len(app["sessions"])
+    metrics["latency_seconds_avg"] = (
+        metrics["latency_seconds_sum"] / metrics["requests_total"] if metrics["requests_total"] else 0.0
+    )
+    metrics["ttft_seconds_avg"] = (
+        metrics["ttft_seconds_sum"] / metrics["stream_requests_total"] if metrics["stream_requests_total"] else 0.0
+    )
+    
+    embeddings = app["vector_db"].embedding_function
+    if hasattr(embeddings, "stats"):
+        metrics["embedding_cache"] = embeddings.stats()
+    if app["answer_cache"] is not None:
+        metrics["answer_cache"] = app["answer_cache"].stats()
+    if pipeline_metrics.enabled():
+        metrics["pipeline"] = pipeline_metrics.snapshot()
+    
+    return web.json_response(metrics)
+
+
+async def handle_prometheus(request: web.Request) -> web.Response:
+    """Devuelve las métricas del pipeline de consultas en formato de texto de Prometheus."""
+    return web.Response(text=pipeline_metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def close_executor(app: web.Application) -> None:
+    """Libera el pool de hilos al apagar el servicio."""
+    app["executor"].shutdown(wait=False)
+
+
+def create_app(vector_db, llm=None, answer_cache: Optional[AnswerCache] = None,
+               workers: int = SERVER_RETRIEVAL_WORKERS, max_sessions: int = SERVER_MAX_SESSIONS) -> web.Application:
+    """
+    Crea la aplicación con los componentes ya cargados.
+    
+    Args:
+        vector_db (FAISS): Base de datos vectorial
+        llm: Modelo de lenguaje o None
+        answer_cache (Optional[AnswerCache], optional): Caché semántica de respuestas
+        workers (int, optional): Hilos para la búsqueda
+        max_sessions (int, optional): Sesiones que se mantienen en memoria
+        
+    Returns:
+        web.Application: Aplicación aiohttp lista para servir
+    """
+    app = web.Application()
+    app["vector_db"] = vector_db
+    app["llm"] = llm
+    app["answer_cache"] = answer_cache
+    app["executor"] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+    app["sessions"] = SessionStore(max_sessions, lambda: create_conversation_memory(vector_db, llm))
+    app["metrics"] = {
+        "requests_total": 0,
+        "stream_requests_total": 0,
+        "errors_total": 0,
+        "latency_seconds_sum": 0.0,
+        "ttft_seconds_sum": 0.0,
+    }
+    
+    app.router.add_post("/chat", handle_chat)
+    app.router.add_post("/chat/stream", handle_chat_stream)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/metrics/prometheus", handle_prometheus)
+    app.on_cleanup.append(close_executor)
+    
+    return app
+
+
+def main():
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Servicio HTTP del asistente de Casa Mueble")
+    parser.add_argument("--host", default=SERVER_HOST, help="Dirección donde escuchar")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Puerto donde escuchar")
+    parser.add_argument("--stub-llm", action="store_true", help="Usar un LLM simulado (sin llamadas externas)")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="Latencia del LLM simulado en segundos")
+    parser.add_argument("--stub-tokens-per-second", type=float, default=0.0,
+                        help="Ritmo de tokens del LLM simulado (0: todos juntos)")
+    parser.add_argument("--stub-output-tokens", type=int, default=0,
+                        help="Largo en tokens de la respuesta simulada (0: respuesta corta fija)")
+    args = parser.parse_args()
+    
+    pipeline_metrics.configure(METRICS_ENABLED, METRICS_JSONL_PATH)
+    embeddings, vector_db, llm, timings = load_components()
+    logger.info(f"Componentes cargados en {timings['total']:.2f} s")
+    if args.stub_llm:
+        llm = StubLLM(latency=args.stub_latency, tokens_per_second=args.stub_tokens_per_second,
+                      output_tokens=args.stub_output_tokens)
+        get_chain(llm)
+    
+    web.run_app(create_app(vector_db, llm, create_answer_cache()), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Fixtures compartidas de las pruebas unitarias.
+"""
+import re
+import zlib
+from typing import List
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from config import CATALOGO_PATH
+from utils.bm25 import fold_accents
+
+DIMENSION = 32
+
+
+class KeywordEmbeddings(Embeddings):
+    """Embeddings deterministas sin modelo: cada palabra suma en una dimensión fija."""
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.zeros(DIMENSION, dtype=np.float32)
+        for word in re.findall(r"\w+", fold_accents(text)):
+            vector[zlib.crc32(word.encode("utf-8")) % DIMENSION] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+@pytest.fixture
+def embeddings() -> KeywordEmbeddings:
+    return KeywordEmbeddings()
+
+
+@pytest.fixture(scope="session")
+def catalog_path() -> str:
+    return CATALOGO_PATH
@@ -0,0 +1,53 @@
+"""
+Pruebas de la caché semántica de respuestas.
+"""
+import pytest
+
+from utils.answer_cache import AnswerCache
+
+CONTEXTS = ["Envíos a todo el país\n[Fuente: faq.md]"]
+QUESTION = "¿hacen envíos?"
+
+
+@pytest.fixture
+def cache(tmp_path) -> AnswerCache:
+    (tmp_path / "index.faiss").write_bytes(b"v1")
+    cache = AnswerCache(str(tmp_path), threshold=0.95, ttl_seconds=3600, max_entries=2)
+    cache.put([1.0, 0.0], CONTEXTS, [], QUESTION, "Sí, a todo el país.")
+    return cache
+
+
+@pytest.mark.parametrize("vector, contexts, history, expected", [
+    ([1.0, 0.0], CONTEXTS, [], "Sí, a todo el país."),
+    ([0.99, 0.05], CONTEXTS, [], "Sí, a todo el país."),
+    ([0.0, 1.0], CONTEXTS, [], None),
+    ([1.0, 0.0], ["Otro contexto"], [], None),
+    ([1.0, 0.0], CONTEXTS, [{"role": "user", "content": "hola"}, {"role": "assistant", "content": "¡Hola!"}], None),
+    ([1.0, 0.0], CONTEXTS, [{"role": "user", "content": QUESTION}], "Sí, a todo el país."),
+])
+def test_get(cache, vector, contexts, history, expected):
+    assert cache.get(vector, contexts, history, QUESTION) == expected
+
+
+def test_summary_entry_is_part_of_the_history_key(cache):
+    history = [{"role": "summary", "content": "El cliente preguntó por camastros"}]
+    assert cache.get([1.0, 0.0], CONTEXTS, history, QUESTION) is None
+
+
+def test_index_change_invalidates(cache, tmp_path):
+    (tmp_path / "index.faiss").write_bytes(b"version 2")
+    assert cache.get([1.0, 0.0], CONTEXTS, [], QUESTION) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_expired_entries_are_dropped(cache):
+    cache.ttl_seconds = -1
+    assert cache.get([1.0, 0.0], CONTEXTS, [], QUESTION) is None
+
+
+def test_max_entries_evicts_oldest(cache):
+    cache.put([0.0, 1.0], CONTEXTS, [], "b", "respuesta b")
+    cache.put([0.7, 0.7], ["c"], [], "c", "respuesta c")
+    assert cache.get([1.0, 0.0], CONTEXTS, [], QUESTION) is None
+    assert cache.get([0.0, 1.0], CONTEXTS, [], "b") == "respuesta b"
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 2}
@@ -0,0 +1,75 @@
+"""
+Pruebas del índice BM25 y de la fusión de rankings.
+"""
+import pytest
+
+from utils.bm25 import BM25Index, fold_accents, reciprocal_rank_fusion, tokenize
+
+CHUNKS = {
+    "leonor": "Camastro Leonor de madera con almohadón impermeable",
+    "envio": "Realizamos envíos a todo el país con costo según la distancia",
+    "perikles": "Fogonero Perikles de hierro con parrilla desmontable",
+    "clemente": "Sillón Clemente de hierro y almohadón",
+}
+
+
+@pytest.fixture
+def index() -> BM25Index:
+    return BM25Index.build(list(CHUNKS), list(CHUNKS.values()))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Sillón", "sillon"),
+    ("ENVÍO", "envio"),
+    ("Cañería", "caneria"),
+])
+def test_fold_accents(text, expected):
+    assert fold_accents(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("¿Cuánto sale el sillón?", ["sale", "sillon"]),
+    ("envíos a todo el país", ["envios", "todo", "pais"]),
+    ("de la que", []),
+])
+def test_tokenize_drops_stopwords(text, expected):
+    assert tokenize(text) == expected
+
+
+@pytest.mark.parametrize("query, best", [
+    ("camastro leonor", "leonor"),
+    ("envios al pais", "envio"),
+    ("perikles", "perikles"),
+    ("Sillón de hierro", "clemente"),
+])
+def test_search_ranks_best_match_first(index, query, best):
+    assert index.search(query)[0][0] == best
+
+
+def test_search_without_known_terms_is_empty(index):
+    assert index.search("garantía extendida") == []
+
+
+def test_save_and_load_roundtrip(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("hierro") == index.search("hierro")
+
+
+@pytest.mark.parametrize("removed, added", [
+    (["envio"], {}),
+    ([], {"efesto": "Fogonero Efesto de hierro"}),
+    (["perikles"], {"perikles2": "Fogonero Perikles de hierro reforzado"}),
+])
+def test_updated_matches_full_build(index, removed, added):
+    updated = index.updated(removed, list(added), list(added.values()))
+    
+    chunks = {key: text for key, text in CHUNKS.items() if key not in removed}
+    chunks.update(added)
+    rebuilt = BM25Index.build(list(chunks), list(chunks.values()))
+    for query in ["hierro", "fogonero perikles", "envios", "almohadon"]:
+        assert updated.search(query) == pytest.approx(rebuilt.search(query))
+
+
+def test_reciprocal_rank_fusion_favors_documents_in_both_rankings():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "e"]])[0] == "b"
@@ -0,0 +1,78 @@
+"""
+Pruebas del motor de consultas de precio sobre catalogo.csv.
+"""
+import pytest
+
+from utils.catalog_engine import CatalogEngine, format_price, parse_amount
+
+LOW_PRICED = ["Kit Barral Simple Completo", "Estaca Asador", "Kit Barral Doble Completo"]
+
+
+@pytest.fixture(scope="module")
+def engine(catalog_path) -> CatalogEngine:
+    return CatalogEngine.from_csv(catalog_path)
+
+
+@pytest.mark.parametrize("number, multiplier, expected", [
+    ("200.000", None, 200000),
+    ("200,000", None, 200000),
+    ("200", "mil", 200000),
+    ("150", "k", 150000),
+    ("99,90", None, 99.9),
+])
+def test_parse_amount(number, multiplier, expected):
+    assert parse_amount(number, multiplier) == pytest.approx(expected)
+
+
+def test_format_price():
+    assert format_price(1234567.5) == "$1.234.567,50"
+
+
+@pytest.mark.parametrize("query, description, products", [
+    ("productos de menos de 100 mil", "Productos de hasta $100.000,00", LOW_PRICED),
+    ("¿qué tienen entre 100 y 200 mil?", "Productos entre $100.000,00 y $200.000,00",
+     ["Mesa Brisa 100x50 cm", "Media Parrilla", "Fogonero Efesto", "Fogonero Perikles"]),
+    ("entre $50.000 y $140.000", "Productos entre $50.000,00 y $140.000,00",
+     ["Estaca Asador", "Kit Barral Doble Completo", "Mesa Brisa 100x50 cm", "Media Parrilla"]),
+    ("camastros de más de $300.000", "Productos desde $300.000,00", ["Camastro Clara", "Camastro Delfina"]),
+    ("fogoneros de menos de 300.000", "Productos de hasta $300.000,00",
+     ["Fogonero Efesto", "Fogonero Perikles", "Fogonero con Media Parrilla"]),
+    ("¿cuál es el camastro más barato?", "Opción más económica", ["Camastro Leonor"]),
+    ("el más caro", "Opción de mayor precio", ["Sillón Clemente"]),
+    ("¿cuál cuesta más, fogonero perikles o fogonero efesto?", "Comparación de precios",
+     ["Fogonero Efesto", "Fogonero Perikles"]),
+])
+def test_structured_price_queries(engine, query, description, products):
+    result = engine.answer(query)
+    assert result["description"] == description
+    assert [product["nombre"] for product in result["products"]] == products
+
+
+def test_cheaper_than_single_product_in_category_uses_whole_catalog(engine):
+    result = engine.answer("algo más barato que el Sillón Clemente")
+    names = [product["nombre"] for product in result["products"]]
+    assert names[:3] == LOW_PRICED
+    assert "Sillón Clemente" not in names
+    assert len(names) == len(engine.names) - 1
+
+
+@pytest.mark.parametrize("query", [
+    "¿hacen envíos de más de 100 km?",
+    "¿cuánto sale el envío a Córdoba?",
+    "¿puedo pagar en 3 cuotas?",
+    "¿aceptan tarjeta de crédito?",
+    "mesa para 4 personas",
+    "¿tienen mesas para más de 6 personas?",
+    "¿el camastro leonor es de madera?",
+    "hola",
+])
+def test_non_price_queries_are_not_answered(engine, query):
+    assert engine.answer(query) is None
+
+
+def test_cache_roundtrip(engine, catalog_path, tmp_path):
+    cache_path = str(tmp_path / "catalog.npz")
+    CatalogEngine.load(catalog_path, cache_path)
+    cached = CatalogEngine.load(catalog_path, cache_path)
+    assert list(cached.names) == list(engine.names)
+    assert cached.answer("el más caro") == engine.answer("el más caro")
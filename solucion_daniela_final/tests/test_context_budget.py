@@ -0,0 +1,93 @@
+"""
+Pruebas del armado del contexto dentro del presupuesto de tokens.
+"""
+import sys
+
+import pytest
+from langchain_core.documents import Document
+
+from utils import context_budget
+from utils.context_budget import (
+    TokenCounter, overlap_length, pack_contexts, remove_overlap, similarity_from_distance
+)
+
+
+class WordCounter:
+    """Cuenta una palabra por token, para que los presupuestos de las pruebas sean exactos."""
+
+    def count(self, text):
+        return len(text.split())
+
+    def truncate(self, text, max_tokens):
+        return " ".join(text.split()[:max_tokens])
+
+
+def doc(text, source="faq.md"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+@pytest.mark.parametrize("score, lower_is_better, expected", [
+    (0.0, True, 1.0),
+    (2.0, True, 0.0),
+    (0.5, True, 0.75),
+    (0.8, False, 0.8),
+])
+def test_similarity_from_distance(score, lower_is_better, expected):
+    assert similarity_from_distance(score, lower_is_better) == pytest.approx(expected)
+
+
+SHARED = "el envío se coordina con el cliente por WhatsApp"
+
+
+@pytest.mark.parametrize("first, second, expected", [
+    (f"Primera parte. {SHARED}", f"{SHARED} y llega en 5 días", len(SHARED)),
+    ("texto sin relación alguna con el otro", "otro texto distinto por completo", 0),
+    ("termina en abc", "abc empieza igual", 0),  # menos de MIN_OVERLAP_CHARS
+])
+def test_overlap_length(first, second, expected):
+    assert overlap_length(first, second, 250) == expected
+
+
+@pytest.mark.parametrize("text, previous, expected", [
+    (f"{SHARED} y llega en 5 días", [f"Primera parte. {SHARED}"], "y llega en 5 días"),
+    ("parte ya incluida", ["una parte ya incluida en otro chunk"], ""),
+    ("texto nuevo", ["otro chunk"], "texto nuevo"),
+])
+def test_remove_overlap(text, previous, expected):
+    assert remove_overlap(text, previous, 250) == expected
+
+
+def test_pack_contexts_applies_similarity_cutoff_and_dedupes():
+    results = [(doc("uno dos"), 0.9), (doc("uno dos"), 0.9), (doc("bajo umbral"), 0.1), (doc("bm25"), None)]
+    contexts, stats = pack_contexts(results, 100, WordCounter(), min_similarity=0.2)
+    assert contexts == ["uno dos\n[Fuente: faq.md]", "bm25\n[Fuente: faq.md]"]
+    assert stats["below_cutoff"] == 1
+
+
+@pytest.mark.parametrize("budget, expected_contexts, over_budget", [
+    (100, 2, 0),
+    (8, 1, 1),   # el segundo chunk no entra
+    (4, 1, 1),   # el primero se recorta antes que quedarse sin contexto
+])
+def test_pack_contexts_respects_budget(budget, expected_contexts, over_budget):
+    results = [(doc("a b c d e", "a.md"), None), (doc("f g h i j", "b.md"), None)]
+    contexts, stats = pack_contexts(results, budget, WordCounter())
+    assert len(contexts) == expected_contexts
+    assert stats["over_budget"] == over_budget
+    assert stats["tokens"] <= budget
+
+
+def test_pack_contexts_max_results():
+    results = [(doc(f"chunk {i}", f"{i}.md"), None) for i in range(5)]
+    contexts, _ = pack_contexts(results, 100, WordCounter(), max_results=2)
+    assert len(contexts) == 2
+
+
+def test_token_counter_falls_back_to_characters_and_warns_once(monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    monkeypatch.setattr(context_budget, "_fallback_warned", False)
+    counters = [TokenCounter(), TokenCounter()]
+    for counter in counters:
+        assert counter.count("12345678") == 2
+        assert counter.truncate("123456789", 2) == "12345678"
+    assert sum("tiktoken" in record.getMessage() for record in caplog.records) == 1
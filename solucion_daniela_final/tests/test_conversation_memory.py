@@ -0,0 +1,87 @@
+"""
+Pruebas de la memoria de conversación con resumen incremental.
+"""
+import pytest
+
+from utils.conversation_memory import ConversationMemory, extractive_summary, shorten
+
+
+def converse(memory, turns):
+    for i in range(turns):
+        memory.add("user", f"pregunta {i}")
+        memory.add("assistant", f"respuesta {i}. Detalle que no va al resumen.")
+    memory.wait()
+
+
+@pytest.mark.parametrize("text, max_chars, expected", [
+    ("corto", 10, "corto"),
+    ("una frase  con   espacios", 100, "una frase con espacios"),
+    ("palabras que no entran enteras", 14, "palabras que…"),
+])
+def test_shorten(text, max_chars, expected):
+    assert shorten(text, max_chars) == expected
+
+
+def test_extractive_summary_keeps_question_and_first_sentence():
+    summary = extractive_summary("", [
+        {"role": "user", "content": "¿Hacen envíos?"},
+        {"role": "assistant", "content": "Sí, a todo el país. El costo depende de la distancia."},
+    ])
+    assert summary == "- El cliente preguntó: ¿Hacen envíos?\n  Se le respondió: Sí, a todo el país."
+
+
+@pytest.mark.parametrize("turns, recent_turns, summarized", [
+    (2, 3, False),
+    (3, 3, False),
+    (5, 3, True),
+])
+def test_history_keeps_recent_turns_verbatim(turns, recent_turns, summarized):
+    memory = ConversationMemory(recent_turns=recent_turns)
+    converse(memory, turns)
+    history = memory.history()
+    
+    assert (history[0]["role"] == "summary") is summarized
+    assert len(memory.messages()) == 2 * min(turns, recent_turns)
+    assert memory.messages()[-1]["content"].startswith(f"respuesta {turns - 1}")
+    if summarized:
+        assert "pregunta 0" in memory.summary()
+        assert "Detalle" not in memory.summary()
+
+
+def test_transcript_keeps_folded_turns():
+    memory = ConversationMemory(recent_turns=1)
+    converse(memory, 4)
+    transcript = memory.transcript()
+    assert len(transcript) == 8
+    assert transcript[0] == {"role": "user", "content": "pregunta 0"}
+    assert len(memory.messages()) == 2
+
+
+def test_summary_is_bounded():
+    memory = ConversationMemory(recent_turns=1, max_summary_chars=120)
+    converse(memory, 20)
+    assert len(memory.summary()) <= 120
+    assert "pregunta 18" in memory.summary()
+
+
+def test_failed_summarizer_falls_back_to_extractive():
+    def broken(summary, messages):
+        raise RuntimeError("LLM caído")
+    
+    memory = ConversationMemory(recent_turns=1, summarizer=broken)
+    converse(memory, 2)
+    assert memory.summary().startswith("- El cliente preguntó: pregunta 0")
+
+
+@pytest.mark.parametrize("messages, max_entities, expected", [
+    (["camastro leonor"], 2, "camastro leonor"),
+    (["camastro leonor", "envío", "camastro leonor"], 2, "envío, camastro leonor"),
+    (["a", "b", "c"], 2, "b, c"),
+    (["a", "b"], 0, ""),
+])
+def test_retrieval_context_tracks_recent_entities(messages, max_entities, expected):
+    memory = ConversationMemory(max_entities=max_entities, entity_extractor=lambda text: [text])
+    for message in messages:
+        memory.add("user", message)
+        memory.add("assistant", "respuesta")
+    assert memory.retrieval_context() == expected
@@ -0,0 +1,95 @@
+"""
+Pruebas del almacén persistente de embeddings.
+"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+from utils.embedding_store import EmbeddingStore
+
+
+class CountingEmbeddings:
+    """Vectoriza con el largo del texto y cuenta cuántos textos recibió."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+
+def test_embed_only_computes_new_texts(tmp_path):
+    embeddings = CountingEmbeddings()
+    store = EmbeddingStore(str(tmp_path), "modelo")
+    assert store.embed(["a", "bb"], embeddings) == [[1.0, 1.0, 0.0], [2.0, 1.0, 0.0]]
+    assert store.embed(["bb", "ccc"], embeddings) == [[2.0, 1.0, 0.0], [3.0, 1.0, 0.0]]
+    assert embeddings.calls == 3
+    assert store.report()["hits"] == 1
+
+
+def test_vectors_persist_per_model(tmp_path):
+    EmbeddingStore(str(tmp_path), "modelo/a").put(["a"], [[1.0, 2.0]])
+    assert EmbeddingStore(str(tmp_path), "modelo/a").get(["a"]) == [[1.0, 2.0]]
+    assert EmbeddingStore(str(tmp_path), "modelo/b").get(["a"]) == [None]
+
+
+@pytest.mark.parametrize("extra_bytes", [
+    np.asarray([[9.0, 9.0]], dtype=np.float32).tobytes(),  # fila agregada sin actualizar index.json
+    b"\x00\x01\x02",  # fila escrita a medias
+])
+def test_load_truncates_rows_missing_from_index(tmp_path, extra_bytes):
+    store = EmbeddingStore(str(tmp_path), "modelo")
+    store.put(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    with open(store.vectors_path, "ab") as f:
+        f.write(extra_bytes)
+    
+    reloaded = EmbeddingStore(str(tmp_path), "modelo")
+    assert os.path.getsize(reloaded.vectors_path) == 2 * 2 * 4
+    reloaded.put(["c"], [[5.0, 6.0]])
+    assert EmbeddingStore(str(tmp_path), "modelo").get(["a", "b", "c"]) == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+
+
+def test_load_drops_rows_past_end_of_file(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "modelo")
+    store.put(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    with open(store.vectors_path, "r+b") as f:
+        f.truncate(2 * 4 + 3)
+    
+    reloaded = EmbeddingStore(str(tmp_path), "modelo")
+    assert reloaded.get(["a", "b"]) == [[1.0, 2.0], None]
+    reloaded.put(["c"], [[5.0, 6.0]])
+    assert EmbeddingStore(str(tmp_path), "modelo").get(["a", "c"]) == [[1.0, 2.0], [5.0, 6.0]]
+
+
+def test_put_appends_to_log_until_flush(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "modelo")
+    store.put(["a"], [[1.0, 2.0]])
+    store.put(["b", "a"], [[3.0, 4.0], [1.0, 2.0]])
+    with open(store.index_path, "r", encoding="utf-8") as f:
+        assert json.load(f)["rows"] == {}
+    with open(store.log_path, "r", encoding="utf-8") as f:
+        assert [line.split()[1] for line in f] == ["0", "1"]
+    assert store.get(["a", "b"]) == [[1.0, 2.0], [3.0, 4.0]]
+    
+    store.flush()
+    assert not os.path.exists(store.log_path)
+    with open(store.index_path, "r", encoding="utf-8") as f:
+        assert sorted(json.load(f)["rows"].values()) == [0, 1]
+    assert store.get(["a", "b"]) == [[1.0, 2.0], [3.0, 4.0]]
+
+
+def test_load_replays_log_without_flush(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "modelo")
+    store.put(["a"], [[1.0, 2.0]])
+    store.flush()
+    store.put(["b"], [[3.0, 4.0]])
+    store.put(["c"], [[5.0, 6.0]])
+    with open(store.log_path, "a", encoding="utf-8") as f:
+        f.write("entrada_a_medias")
+    
+    reloaded = EmbeddingStore(str(tmp_path), "modelo")
+    assert reloaded.get(["a", "b", "c"]) == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+    assert not os.path.exists(reloaded.log_path)
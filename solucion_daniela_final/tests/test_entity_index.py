@@ -0,0 +1,79 @@
+"""
+Pruebas del índice de entidades de producto.
+"""
+import pandas as pd
+import pytest
+
+from utils.entity_index import EntityIndex, edit_distance
+
+
+@pytest.fixture(scope="module")
+def index(catalog_path) -> EntityIndex:
+    names = pd.read_csv(catalog_path)["Producto"].tolist()
+    return EntityIndex.build(names, {name: [f"{name}-0"] for name in names})
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("sillon", ["Sillón Clemente"]),
+    ("quiero un sillon", ["Sillón Clemente"]),
+    ("¿tienen sillones?", ["Sillón Clemente"]),
+    ("perikless", ["Fogonero Perikles"]),
+    ("precio del camastro leonor", ["Camastro Leonor"]),
+    ("fogonero con media parrilla", ["Fogonero con Media Parrilla"]),
+    ("media parrilla", ["Media Parrilla"]),
+    ("camastro clara", ["Camastro Clara"]),
+    ("¿Y la Clara?", ["Camastro Clara"]),
+    ("una mesa brisa", ["Mesa Brisa 100x50 cm"]),
+    ("leonor o delfina", ["Camastro Leonor", "Camastro Delfina"]),
+    ("una respuesta clara sobre envíos", []),
+    ("me gusta la brisa del mar", []),
+    ("¿qué camastros tienen?", []),
+    ("hola", []),
+])
+def test_match(index, query, expected):
+    assert [entity["name"] for entity in index.match(query)] == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("precio del camastro leonor", True),
+    ("¿cuánto sale el sillón clemente?", True),
+    ("medidas de la mesa brisa", True),
+    ("¿el camastro leonor tiene envío gratis?", False),
+    ("¿el fogonero perikles tiene garantía?", False),
+    ("¿hacen envíos?", False),
+])
+def test_is_product_lookup(index, query, expected):
+    assert index.is_product_lookup(query) is expected
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("perikles", "perikles", 0),
+    ("perikless", "perikles", 1),
+    ("prekiles", "perikles", 2),
+    ("efesto", "efetso", 1),
+])
+def test_edit_distance(a, b, expected):
+    assert edit_distance(a, b) == expected
+
+
+def test_short_words_are_not_corrected(index):
+    assert index.correct("clra") is None
+
+
+def test_update_chunks_replaces_removed_ids(index, tmp_path):
+    index.save(str(tmp_path))
+    loaded = EntityIndex.load(str(tmp_path))
+    loaded.update_chunks(["Camastro Leonor-0"], {"Camastro Leonor": ["Camastro Leonor-1"]})
+    assert loaded.match("camastro leonor")[0]["chunk_ids"] == ["Camastro Leonor-1"]
+    assert loaded.match("sillon")[0]["chunk_ids"] == ["Sillón Clemente-0"]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("cuanto sale el perikless?", "producto Fogonero Perikles específico"),
+    ("¿y la mesa brisa?", "producto Mesa Brisa 100x50 cm específico"),
+])
+def test_expand_query_reinforces_matched_products(index, query, expected):
+    from main import expand_query
+    expanded = expand_query(query, entity_index=index)
+    assert expanded.endswith(expected)
+    assert expand_query("una respuesta clara sobre envíos", entity_index=index) == "una respuesta clara sobre envíos"
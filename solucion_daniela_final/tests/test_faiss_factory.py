@@ -0,0 +1,75 @@
+"""
+Pruebas de los tipos de índice FAISS: borrado y re-agregado de chunks según supports_removal.
+"""
+import numpy as np
+import pytest
+
+from utils.faiss_factory import create_vector_store, supports_removal
+
+DIMENSION = 16
+
+TEXTS = [f"chunk {i}" for i in range(40)] + ["chunk nuevo"]
+
+# Vectores aleatorios fijos: cada chunk tiene uno bien separado de los demás
+VECTORS = dict(zip(TEXTS, np.random.default_rng(0).standard_normal((len(TEXTS), DIMENSION)).astype(np.float32)))
+
+FACTORIES = [
+    ("Flat", True),
+    ("SQ8", True),
+    ("IVF4,Flat", False),   # conserva los ids originales al borrar
+    ("HNSW8", False),       # no permite borrar
+]
+
+
+def build_store(factory, embeddings, texts=TEXTS[:-1]):
+    db = create_vector_store(factory, embeddings, np.stack([VECTORS[text] for text in texts]),
+                             nprobe=4, ef_search=64)
+    add(db, texts)
+    return db
+
+
+def add(db, texts):
+    db.add_embeddings([(text, VECTORS[text].tolist()) for text in texts])
+
+
+def assert_each_chunk_finds_itself(db, texts):
+    for text in texts:
+        found = db.similarity_search_by_vector(VECTORS[text].tolist(), k=1)
+        assert found[0].page_content == text
+
+
+@pytest.mark.parametrize("factory, removable", FACTORIES)
+def test_supports_removal(factory, removable, embeddings):
+    assert supports_removal(build_store(factory, embeddings).index) is removable
+
+
+@pytest.mark.parametrize("factory", [factory for factory, removable in FACTORIES if removable])
+def test_delete_and_readd_keeps_rows_aligned(factory, embeddings):
+    db = build_store(factory, embeddings)
+    removed_ids = [db.index_to_docstore_id[position] for position in (0, 1, 2, 10)]
+    removed_texts = [db.docstore.search(docstore_id).page_content for docstore_id in removed_ids]
+    
+    db.delete(removed_ids)
+    kept = [text for text in TEXTS[:-1] if text not in removed_texts]
+    assert db.index.ntotal == len(kept)
+    assert_each_chunk_finds_itself(db, kept)
+    
+    add(db, removed_texts + ["chunk nuevo"])
+    assert db.index.ntotal == len(TEXTS)
+    assert_each_chunk_finds_itself(db, TEXTS)
+
+
+@pytest.mark.parametrize("factory", [factory for factory, removable in FACTORIES if not removable])
+def test_non_removable_indexes_are_rebuilt(factory, embeddings):
+    # Lo que hace indexer.sync_documents: reconstruir con los chunks que quedan y agregar los nuevos
+    kept = TEXTS[3:]
+    rebuilt = build_store(factory, embeddings, kept)
+    assert rebuilt.index.ntotal == len(TEXTS) - 3
+    assert_each_chunk_finds_itself(rebuilt, kept)
+
+
+def test_ivf_removal_keeps_original_ids(embeddings):
+    db = build_store("IVF4,Flat", embeddings)
+    db.index.remove_ids(np.array([0, 1, 2], dtype=np.int64))
+    _, labels = db.index.search(VECTORS[TEXTS[10]][None, :], 1)
+    assert labels[0][0] == 10  # LangChain renumeraría esta fila como 7
@@ -0,0 +1,62 @@
+"""
+Pruebas del atajo de preguntas frecuentes: calibración del umbral y seguimientos de la conversación.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.entity_index import EntityIndex
+from utils.faq_index import calibrate_threshold, normalize_rows
+
+# Dos FAQs ortogonales
+MATRIX = normalize_rows([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+
+
+def unit(*values):
+    return normalize_rows([values])[0]
+
+
+def test_threshold_excludes_every_negative():
+    positives = [(unit(1.0, 0.05, 0.0), 0), (unit(1.0, 0.3, 0.2), 0), (unit(0.1, 1.0, 0.6), 1)]
+    # Un negativo entre los positivos: con precisión mínima baja el umbral igual tiene que quedar por encima
+    negatives = [unit(1.0, 0.2, 0.1), unit(0.0, 0.0, 1.0)]
+    calibration = calibrate_threshold(MATRIX, positives, negatives, min_precision=0.5)
+    
+    max_negative = max(float(np.max(MATRIX @ vector)) for vector in negatives)
+    assert calibration["max_negative_score"] == pytest.approx(max_negative)
+    assert calibration["threshold"] > max_negative
+    assert calibration["recall"] == pytest.approx(1 / 3)
+
+
+def test_threshold_without_negatives_covers_all_correct_positives():
+    positives = [(unit(1.0, 0.05, 0.0), 0), (unit(0.1, 1.0, 0.6), 1)]
+    calibration = calibrate_threshold(MATRIX, positives, [], min_precision=0.98)
+    assert calibration["recall"] == 1.0
+    assert calibration["threshold"] == pytest.approx(min(float(np.max(MATRIX @ vector)) for vector, _ in positives))
+
+
+def test_threshold_when_a_negative_matches_exactly():
+    calibration = calibrate_threshold(MATRIX, [(unit(1.0, 0.0, 0.0), 0)], [unit(1.0, 0.0, 0.0)], min_precision=0.5)
+    assert calibration["threshold"] > calibration["max_negative_score"]
+    assert calibration["recall"] == 0.0
+
+
+@pytest.fixture(scope="module")
+def vector_db(catalog_path):
+    names = pd.read_csv(catalog_path)["Producto"].tolist()
+    return SimpleNamespace(entity_index=EntityIndex.build(names, {}))
+
+
+@pytest.mark.parametrize("query, chat_history, retrieval_context, expected", [
+    ("¿y ese tiene envío?", [], "Camastro Leonor", True),
+    ("¿y ese tiene envío?", [{"role": "user", "content": "precio del camastro leonor"}], None, True),
+    ("¿y ese tiene envío?", [], "", False),
+    ("¿Realizan envíos a todo el país?", [], "Camastro Leonor", False),
+    ("¿y el fogonero perikles tiene envío?", [], "Camastro Leonor", False),
+    ("¿y ese tiene envío?", [{"role": "user", "content": "hola"}], None, False),
+])
+def test_refers_to_context(vector_db, query, chat_history, retrieval_context, expected):
+    from main import refers_to_context
+    assert refers_to_context(query, vector_db, chat_history, retrieval_context) is expected
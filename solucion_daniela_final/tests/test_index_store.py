@@ -0,0 +1,104 @@
+"""
+Pruebas del formato nativo del índice (sin pickle, con memory-map).
+"""
+import json
+import os
+
+import pytest
+from langchain_community.vectorstores.faiss import FAISS
+
+from utils.index_store import (
+    DOCSTORE_FILE, IDS_FILE, LEGACY_PICKLE_FILE, MANIFEST_FILE, VECTORS_FILE, LazyDocstore, has_legacy_index,
+    has_native_index, load_index, load_native_index, migrate_legacy_index, save_native_index
+)
+
+TEXTS = ["Camastro Leonor de madera", "Envíos a todo el país", "Fogonero Perikles de hierro"]
+
+
+@pytest.fixture
+def saved_dir(tmp_path, embeddings):
+    db = FAISS.from_texts(TEXTS, embeddings, metadatas=[{"source": f"{i}.md"} for i in range(len(TEXTS))])
+    save_native_index(db, str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_roundtrip(saved_dir, embeddings, use_mmap):
+    db = load_native_index(saved_dir, embeddings, use_mmap=use_mmap)
+    assert isinstance(db.docstore, LazyDocstore)
+    assert db.index.ntotal == len(TEXTS)
+    found = db.similarity_search("fogonero perikles", k=1)[0]
+    assert found.page_content == TEXTS[2]
+    assert found.metadata == {"source": "2.md"}
+
+
+def test_manifest_checksums_detect_corruption(saved_dir, embeddings):
+    with open(os.path.join(saved_dir, DOCSTORE_FILE), "r+b") as f:
+        f.write(b"X")
+    with pytest.raises(ValueError, match="Checksum"):
+        load_native_index(saved_dir, embeddings, verify=True)
+    assert load_native_index(saved_dir, embeddings).index.ntotal == len(TEXTS)
+
+
+def test_manifest_sizes_detect_truncation_without_hashing(saved_dir, embeddings):
+    with open(os.path.join(saved_dir, DOCSTORE_FILE), "ab") as f:
+        f.write(b"{}\n")
+    with pytest.raises(ValueError, match="Tamaño"):
+        load_native_index(saved_dir, embeddings)
+
+
+def test_ids_are_stored_outside_the_manifest(saved_dir):
+    with open(os.path.join(saved_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert "ids" not in manifest
+    with open(os.path.join(saved_dir, IDS_FILE), "r", encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == len(TEXTS)
+
+
+@pytest.mark.parametrize("field, value", [("format", "otro"), ("version", 99)])
+def test_unknown_manifest_is_rejected(saved_dir, embeddings, field, value):
+    path = os.path.join(saved_dir, MANIFEST_FILE)
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest[field] = value
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError):
+        load_native_index(saved_dir, embeddings)
+
+
+def test_delete_add_and_save_again(saved_dir, embeddings):
+    db = load_native_index(saved_dir, embeddings, use_mmap=False)
+    envio_id = db.index_to_docstore_id[1]
+    db.delete([envio_id])
+    db.add_texts(["Sillón Clemente de hierro"], metadatas=[{"source": "3.md"}])
+    assert isinstance(db.docstore.search(envio_id), str)
+    
+    save_native_index(db, saved_dir)
+    reloaded = load_native_index(saved_dir, embeddings)
+    contents = [reloaded.docstore.search(docstore_id).page_content
+                for docstore_id in reloaded.index_to_docstore_id.values()]
+    assert contents == [TEXTS[0], TEXTS[2], "Sillón Clemente de hierro"]
+    assert reloaded.similarity_search("sillon clemente", k=1)[0].metadata == {"source": "3.md"}
+
+
+def test_load_index_without_files(tmp_path, embeddings):
+    assert not has_native_index(str(tmp_path))
+    assert load_index(str(tmp_path), embeddings) is None
+
+
+def test_legacy_pickle_is_only_loaded_by_migration(tmp_path, embeddings):
+    FAISS.from_texts(TEXTS, embeddings).save_local(str(tmp_path))
+    assert has_legacy_index(str(tmp_path))
+    with pytest.raises(ValueError, match="migrate-index"):
+        load_index(str(tmp_path), embeddings)
+    
+    assert migrate_legacy_index(str(tmp_path), embeddings) == len(TEXTS)
+    assert not os.path.exists(os.path.join(str(tmp_path), LEGACY_PICKLE_FILE))
+    assert load_index(str(tmp_path), embeddings).similarity_search("fogonero perikles", k=1)[0].page_content == TEXTS[2]
+    with pytest.raises(FileNotFoundError):
+        migrate_legacy_index(str(tmp_path), embeddings)
+
+
+def test_vectors_file_is_written(saved_dir):
+    assert os.path.getsize(os.path.join(saved_dir, VECTORS_FILE)) > 0
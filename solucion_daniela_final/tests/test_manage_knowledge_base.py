@@ -0,0 +1,85 @@
+"""
+Pruebas de los comandos incrementales: el índice armado desde los CSV (INDEX_SOURCE = 'csv')
+y la reconstrucción completa cuando no se puede sincronizar.
+"""
+import os
+
+import pytest
+
+import config
+import indexer
+import manage_knowledge_base
+from prepare_knowledge_base import FAQS_DIR, PRODUCTOS_DIR
+
+FAQ_FILE = "faq_000_general.md"
+PRODUCT_FILE = "producto_000_camastro_leonor.md"
+
+
+@pytest.fixture
+def csv_mode(monkeypatch):
+    monkeypatch.setattr(config, "INDEX_SOURCE", "csv")
+    monkeypatch.setattr(indexer, "INDEX_SOURCE", "csv")
+    synced = []
+    monkeypatch.setattr(indexer, "sync_documents", lambda documents, *args: synced.append(documents) or {})
+    monkeypatch.setattr(manage_knowledge_base, "update_index_incremental", lambda paths: synced.append(paths))
+    return synced
+
+
+@pytest.mark.parametrize("command, filename", [
+    (manage_knowledge_base.delete_knowledge_file, PRODUCT_FILE),
+    (manage_knowledge_base.delete_knowledge_file, FAQ_FILE),
+    (manage_knowledge_base.update_knowledge_file, PRODUCT_FILE),
+    (manage_knowledge_base.update_knowledge_file, FAQ_FILE),
+])
+def test_commands_reject_files_generated_from_csv(csv_mode, command, filename):
+    assert command(filename) is False
+    assert manage_knowledge_base.find_knowledge_file(filename) is not None  # no se borró
+    assert csv_mode == []
+
+
+def test_add_rejects_generated_file_name(csv_mode, tmp_path):
+    source = tmp_path / "faq_999_general.md"
+    source.write_text("# Pregunta\n\nRespuesta\n", encoding="utf-8")
+    assert manage_knowledge_base.add_knowledge_file(str(source), "faqs") is False
+    assert not os.path.exists(os.path.join(FAQS_DIR, source.name))
+
+
+@pytest.mark.parametrize("path, expected_type", [
+    (os.path.join(PRODUCTOS_DIR, PRODUCT_FILE), "producto"),
+    (os.path.join(FAQS_DIR, FAQ_FILE), "faq"),
+    (os.path.join(FAQS_DIR, "faq_000_general_borrado.md"), None),  # sin fila en el CSV
+])
+def test_sync_files_rebuilds_generated_keys_from_csv(csv_mode, path, expected_type):
+    indexer.sync_files([path])
+    documents = csv_mode[0][indexer.source_key(path)]
+    if expected_type is None:
+        assert documents == []
+    else:
+        assert documents and all(doc.metadata.get("tipo") == expected_type for doc in documents)
+
+
+def test_sync_files_reads_hand_written_markdown(csv_mode, tmp_path):
+    path = tmp_path / "knowledge_base" / "faqs" / "horarios.md"
+    path.parent.mkdir(parents=True)
+    path.write_text("# Horarios\n\nDe 9 a 18.\n", encoding="utf-8")
+    indexer.sync_files([str(path)])
+    assert [doc.page_content for doc in csv_mode[0]["faqs/horarios.md"]] == ["# Horarios\n\nDe 9 a 18.\n"]
+
+
+@pytest.mark.parametrize("chunks", [12, None])
+def test_sync_without_index_reports_full_rebuild(monkeypatch, embeddings, chunks):
+    monkeypatch.setattr(indexer, "load_index", lambda embeddings: None)
+    monkeypatch.setattr(indexer, "main", lambda: chunks)
+    if chunks is None:
+        with pytest.raises(RuntimeError):
+            indexer.sync_documents({"faqs/horarios.md": []}, embeddings)
+    else:
+        assert indexer.sync_documents({"faqs/horarios.md": []}, embeddings) == {"rebuilt": True, "chunks": 12}
+
+
+def test_report_sync_distinguishes_rebuild(caplog):
+    with caplog.at_level("INFO"):
+        manage_knowledge_base.report_sync({"rebuilt": True, "chunks": 12})
+        manage_knowledge_base.report_sync({"rebuilt": False, "added": 1, "removed": 2, "unchanged": 3})
+    assert "reconstruyó completo (12 chunks)" in caplog.text
+    assert "1 chunks agregados, 2 eliminados, 3 sin cambios" in caplog.text
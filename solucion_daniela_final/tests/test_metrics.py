@@ -0,0 +1,48 @@
+"""
+Pruebas de la instrumentación de los turnos con respuesta en streaming.
+"""
+import asyncio
+import json
+
+import pytest
+
+import main
+from utils import metrics
+
+
+class StubChain:
+    """Cadena que devuelve siempre los mismos tokens."""
+
+    def stream(self, inputs):
+        yield from ["Hola", ", ", "cliente"]
+
+    async def astream(self, inputs):
+        for token in self.stream(inputs):
+            yield token
+
+
+@pytest.fixture
+def turns(monkeypatch, tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics.configure(True, str(path))
+    monkeypatch.setattr(main, "prepare_query", lambda *args: {"response": None, "inputs": {}, "cache_entry": None})
+    monkeypatch.setattr(main, "get_chain", lambda llm: StubChain())
+    monkeypatch.setattr(main, "finish_query", lambda turn, response, *args: response)
+    yield lambda: [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    metrics.configure(False)
+
+
+def test_stream_query_records_llm_span_in_turn(turns):
+    assert "".join(main.stream_query("hola", None, llm=object())) == "Hola, cliente"
+    [record] = turns()
+    assert record["kind"] == "stream"
+    assert "llm" in [span["stage"] for span in record["spans"]]
+
+
+def test_astream_query_records_llm_span_in_turn(turns):
+    async def collect():
+        return [token async for token in main.astream_query("hola", None, llm=object())]
+    
+    assert "".join(asyncio.run(collect())) == "Hola, cliente"
+    [record] = turns()
+    assert "llm" in [span["stage"] for span in record["spans"]]
@@ -0,0 +1,189 @@
+"""
+Caché semántica de respuestas del chatbot, invalidada al reconstruir el índice FAISS.
+"""
+import os
+import time
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def index_version(index_dir: str) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    Calcula una firma del índice a partir de los archivos de su directorio.
+    
+    Args:
+        index_dir (str): Directorio del índice FAISS
+        
+    Returns:
+        Tuple[Tuple[str, int, int], ...]: Nombre, fecha de modificación y tamaño de cada archivo
+    """
+    if not os.path.isdir(index_dir):
+        return ()
+    
+    version = []
+    for name in sorted(os.listdir(index_dir)):
+        path = os.path.join(index_dir, name)
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            version.append((name, stat.st_mtime_ns, stat.st_size))
+    
+    return tuple(version)
+
+
+def _hash_texts(texts: List[str]) -> str:
+    """Resume una lista de textos en un hash estable."""
+    digest = hashlib.sha1()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    """Normaliza un vector a norma 1 para comparar por coseno."""
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    return array / norm if norm else array
+
+
+class AnswerCache:
+    """
+    Reutiliza respuestas para consultas casi idénticas.
+    
+    Una entrada se considera válida cuando el embedding de la nueva consulta supera el
+    umbral de similitud coseno con el de la consulta guardada, el contexto recuperado es
+    el mismo y los últimos mensajes del historial coinciden.
+    """
+
+    def __init__(self, index_dir: str, threshold: float = 0.95, ttl_seconds: float = 3600,
+                 max_entries: int = 512, history_turns: int = 2):
+        """
+        Args:
+            index_dir (str): Directorio del índice; si cambia, la caché se vacía
+            threshold (float, optional): Similitud coseno mínima. Default es 0.95.
+            ttl_seconds (float, optional): Vigencia de cada entrada en segundos. Default es 3600.
+            max_entries (int, optional): Cantidad máxima de entradas. Default es 512.
+            history_turns (int, optional): Mensajes previos que deben coincidir; 0 ignora el historial
+        """
+        self.index_dir = index_dir
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.history_turns = history_turns
+        self.hits = 0
+        self.misses = 0
+        self._version = index_version(index_dir)
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _context_key(self, contexts: List[str], chat_history: Optional[List[Dict[str, str]]], question: str) -> str:
+        """Construye la clave exacta: contexto recuperado más el historial relevante."""
+        history = list(chat_history or [])
+        # El mensaje actual del usuario no forma parte del historial previo
+        if history and history[-1].get("role") == "user" and history[-1].get("content") == question:
+            history = history[:-1]
+        
+        parts = list(contexts)
+        if self.history_turns > 0:
+            for message in history[-self.history_turns:]:
+                parts.append(f"{message['role']}:{message['content']}")
+        
+        return _hash_texts(parts)
+
+    def _check_version(self) -> None:
+        """Vacía la caché si el índice fue reconstruido. Debe llamarse con el lock tomado."""
+        version = index_version(self.index_dir)
+        if version != self._version:
+            if self._entries:
+                logger.info("Índice FAISS modificado: se invalida la caché de respuestas")
+            self._entries.clear()
+            self._version = version
+
+    def _expire(self) -> None:
+        """Elimina entradas vencidas. Debe llamarse con el lock tomado."""
+        now = time.monotonic()
+        expired = [entry_id for entry_id, entry in self._entries.items()
+                   if now - entry["created_at"] > self.ttl_seconds]
+        for entry_id in expired:
+            del self._entries[entry_id]
+
+    def get(self, query_vector: List[float], contexts: List[str],
+            chat_history: Optional[List[Dict[str, str]]], question: str) -> Optional[str]:
+        """
+        Busca una respuesta guardada para una consulta equivalente.
+        
+        Args:
+            query_vector (List[float]): Embedding de la consulta
+            contexts (List[str]): Contexto recuperado para la consulta
+            chat_history (Optional[List[Dict[str, str]]]): Historial de la conversación
+            question (str): Consulta original del usuario
+            
+        Returns:
+            Optional[str]: Respuesta guardada o None si no hay coincidencia
+        """
+        key = self._context_key(contexts, chat_history, question)
+        vector = _unit(query_vector)
+        
+        with self._lock:
+            self._check_version()
+            self._expire()
+            
+            best_id, best_similarity = None, self.threshold
+            for entry_id, entry in self._entries.items():
+                if entry["key"] != key:
+                    continue
+                similarity = float(np.dot(entry["vector"], vector))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            
+            if best_id is None:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            logger.info(f"Respuesta servida desde caché (similitud {best_similarity:.3f})")
+            return self._entries[best_id]["response"]
+
+    def put(self, query_vector: List[float], contexts: List[str],
+            chat_history: Optional[List[Dict[str, str]]], question: str, response: str) -> None:
+        """
+        Guarda una respuesta generada por el LLM.
+        
+        Args:
+            query_vector (List[float]): Embedding de la consulta
+            contexts (List[str]): Contexto recuperado para la consulta
+            chat_history (Optional[List[Dict[str, str]]]): Historial de la conversación
+            question (str): Consulta original del usuario
+            response (str): Respuesta a guardar
+        """
+        entry = {
+            "key": self._context_key(contexts, chat_history, question),
+            "vector": _unit(query_vector),
+            "response": response,
+            "created_at": time.monotonic(),
+        }
+        
+        with self._lock:
+            self._check_version()
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Devuelve los contadores de uso de la caché.
+        
+        Returns:
+            Dict[str, float]: Aciertos, fallos y cantidad de entradas
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
@@ -0,0 +1,223 @@
+"""
+Índice invertido BM25 sobre los mismos chunks del índice FAISS.
+"""
+import os
+import re
+import json
+import math
+import logging
+import unicodedata
+from collections import Counter
+from typing import List, Dict, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25.json"
+BM25_VERSION = 1
+
+# Palabras demasiado frecuentes en español como para aportar a la búsqueda léxica
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los", "me", "mi", "no",
+    "o", "para", "por", "que", "se", "si", "su", "sus", "te", "tu", "un", "una", "y", "ya",
+    "como", "cual", "cuanto", "donde", "hay", "tiene", "tienen", "tienes", "hacen", "son",
+}
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def fold_accents(text: str) -> str:
+    """
+    Quita tildes y diacríticos y pasa a minúsculas ("Sillón" -> "sillon").
+    
+    Args:
+        text (str): Texto original
+        
+    Returns:
+        str: Texto sin acentos, en minúsculas
+    """
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Divide un texto en términos normalizados para BM25.
+    
+    Args:
+        text (str): Texto a tokenizar
+        
+    Returns:
+        List[str]: Términos sin acentos ni stopwords
+    """
+    return [token for token in TOKEN_PATTERN.findall(fold_accents(text)) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Índice BM25 (Okapi) con listas de postings por término.
+    
+    Los documentos se identifican por su id de docstore, así los resultados se
+    combinan directamente con los de FAISS.
+    """
+
+    def __init__(self, ids: List[str], doc_lengths: List[int], postings: Dict[str, List[List[int]]],
+                 k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            ids (List[str]): Id de docstore de cada documento
+            doc_lengths (List[int]): Cantidad de términos de cada documento
+            postings (Dict[str, List[List[int]]]): Para cada término, pares [posición, frecuencia]
+            k1 (float, optional): Saturación de la frecuencia del término. Default es 1.5.
+            b (float, optional): Normalización por longitud. Default es 0.75.
+        """
+        self.ids = ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avg_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        total = len(ids)
+        self.idf = {
+            term: math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5))
+            for term, entries in postings.items()
+        }
+
+    @classmethod
+    def build(cls, ids: List[str], texts: List[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Construye el índice a partir de los textos de los chunks.
+        
+        Args:
+            ids (List[str]): Id de docstore de cada chunk
+            texts (List[str]): Texto de cada chunk
+            k1 (float, optional): Parámetro k1 de BM25. Default es 1.5.
+            b (float, optional): Parámetro b de BM25. Default es 0.75.
+            
+        Returns:
+            BM25Index: Índice construido
+        """
+        postings: Dict[str, List[List[int]]] = {}
+        doc_lengths = []
+        for position, text in enumerate(texts):
+            terms = tokenize(text)
+            doc_lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                postings.setdefault(term, []).append([position, frequency])
+        
+        return cls(ids, doc_lengths, postings, k1, b)
+
+    def updated(self, removed_ids: List[str], ids: List[str], texts: List[str]) -> "BM25Index":
+        """
+        Quita y agrega chunks sin volver a tokenizar los que no cambiaron.
+        
+        Args:
+            removed_ids (List[str]): Ids de docstore de los chunks eliminados
+            ids (List[str]): Ids de docstore de los chunks nuevos
+            texts (List[str]): Texto de cada chunk nuevo
+            
+        Returns:
+            BM25Index: Índice nuevo con los cambios aplicados
+        """
+        removed = set(removed_ids)
+        kept = [position for position, docstore_id in enumerate(self.ids) if docstore_id not in removed]
+        new_positions = {old: new for new, old in enumerate(kept)}
+        
+        postings: Dict[str, List[List[int]]] = {}
+        for term, entries in self.postings.items():
+            entries = [[new_positions[position], frequency] for position, frequency in entries
+                       if position in new_positions]
+            if entries:
+                postings[term] = entries
+        
+        all_ids = [self.ids[position] for position in kept]
+        doc_lengths = [self.doc_lengths[position] for position in kept]
+        for docstore_id, text in zip(ids, texts):
+            terms = tokenize(text)
+            for term, frequency in Counter(terms).items():
+                postings.setdefault(term, []).append([len(all_ids), frequency])
+            all_ids.append(docstore_id)
+            doc_lengths.append(len(terms))
+        
+        return type(self)(all_ids, doc_lengths, postings, self.k1, self.b)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Busca los documentos con mayor puntaje BM25.
+        
+        Args:
+            query (str): Consulta en texto libre
+            k (int, optional): Cantidad de resultados. Default es 5.
+            
+        Returns:
+            List[Tuple[str, float]]: Pares (id de docstore, puntaje), del mayor al menor
+        """
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, frequency in self.postings[term]:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[position] / self.avg_length
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * length_norm
+                )
+        
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[position], score) for position, score in best]
+
+    def save(self, index_dir: str) -> None:
+        """Guarda el índice como JSON junto al índice FAISS."""
+        path = os.path.join(index_dir, BM25_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": BM25_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "ids": self.ids,
+                "doc_lengths": self.doc_lengths,
+                "postings": self.postings,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["BM25Index"]:
+        """
+        Carga el índice guardado, si existe.
+        
+        Args:
+            index_dir (str): Directorio del índice
+            
+        Returns:
+            Optional[BM25Index]: Índice cargado o None si no existe o es de otra versión
+        """
+        path = os.path.join(index_dir, BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != BM25_VERSION:
+            logger.warning("Índice BM25 de otra versión, se ignora hasta reconstruirlo")
+            return None
+        
+        return cls(data["ids"], data["doc_lengths"], data["postings"], data["k1"], data["b"])
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Combina varios rankings con Reciprocal Rank Fusion.
+    
+    Args:
+        rankings (List[List[str]]): Listas de ids ordenadas de más a menos relevante
+        k (int, optional): Constante de suavizado de RRF. Default es 60.
+        
+    Returns:
+        List[str]: Ids ordenados por puntaje combinado
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    
+    return sorted(scores, key=scores.get, reverse=True)
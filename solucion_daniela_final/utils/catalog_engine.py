@@ -0,0 +1,358 @@
+"""
+Motor de consultas estructuradas sobre catalogo.csv.
+
+Responde preguntas de precio (rangos, más barato/caro, orden y comparación) con
+filtros y ordenamientos sobre columnas NumPy, sin embeddings ni búsqueda vectorial.
+El catálogo se guarda en un archivo columnar .npz para recargarlo rápido y se
+reconstruye solo si cambia el CSV.
+"""
+import os
+import re
+import logging
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.bm25 import fold_accents
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_VERSION = 2
+
+# Términos de categoría que pueden aparecer en los nombres de producto
+CATEGORY_TERMS = ["camastro", "sillon", "fogonero", "parrilla", "barral", "mesa", "estaca", "asador", "kit"]
+
+# Monto: signo $ opcional, número, multiplicador "mil"/"k" opcional y "pesos" opcional (4 grupos)
+NUMBER_PATTERN = r"(\$)?\s*(\d[\d.,]*)\s*(?:(mil|k)\b)?(\s*(?:pesos|ars)\b)?"
+NUMBER_GROUPS = 4
+
+RANGE_PATTERNS = [
+    ("between", re.compile(rf"entre\s+{NUMBER_PATTERN}\s+y\s+{NUMBER_PATTERN}")),
+    ("max", re.compile(rf"(?:menos de|menor a|menor que|por debajo de|hasta|no mas de|maximo|debajo de)\s+{NUMBER_PATTERN}")),
+    ("min", re.compile(rf"(?:mas de|mayor a|mayor que|por encima de|desde|arriba de|minimo)\s+{NUMBER_PATTERN}")),
+]
+CHEAPEST_PATTERN = re.compile(r"mas (?:barat[oa]s?|economic[oa]s?)\b|menor precio|precio mas bajo")
+PRICIEST_PATTERN = re.compile(r"mas car[oa]s?\b|mayor precio|precio mas alto")
+SORT_PATTERN = re.compile(r"ordenad[oa]s? por precio|por precio|lista de precios|todos los precios")
+COMPARE_PATTERN = re.compile(r"compar|diferencia|cual (?:es|sale|cuesta) mas|que (?:es|sale|cuesta) mas|\bvs\b|versus")
+PRICE_CONTEXT_PATTERN = re.compile(r"\$|precio|cuesta|cuestan|sale|salen|pesos|presupuesto|barat|econom|caro|valor")
+# Preguntas de envío o forma de pago: las responden las FAQs, no el catálogo
+NON_CATALOG_PATTERN = re.compile(r"\benvi[oa]\w*|\bpag[oa]\w*|\bcuotas?\b|\bkm\b|kilometr|\btarjeta|financ|transferencia")
+# Separador de miles dentro del número ("200.000", "1,500")
+THOUSANDS_PATTERN = re.compile(r"\d[.,]\d{3}(?:\D|$)")
+
+# Montos menores a este valor sin "$", "pesos", "mil" ni separador de miles se toman como
+# cantidades ("más de 4 personas", "a más de 100 km"), aunque la consulta hable de precios
+MIN_IMPLICIT_AMOUNT = 1000
+
+
+def parse_amount(number: str, multiplier: Optional[str]) -> float:
+    """
+    Convierte un monto escrito por el cliente a número.
+    
+    Acepta separadores de miles con punto o coma ("200.000", "200,000") y sufijos "mil" o "k".
+    
+    Args:
+        number (str): Parte numérica
+        multiplier (Optional[str]): "mil", "k" o None
+        
+    Returns:
+        float: Monto en pesos
+    """
+    digits = number.strip(".,")
+    # Un separador seguido de exactamente dos dígitos al final se toma como decimal
+    match = re.match(r"^(.*?)[.,](\d{2})$", digits)
+    if match and not re.search(r"[.,]\d{3}$", digits):
+        value = float(re.sub(r"[.,]", "", match.group(1)) + "." + match.group(2))
+    else:
+        value = float(re.sub(r"[.,]", "", digits))
+    
+    if multiplier:
+        value *= 1000
+    return value
+
+
+def explicit_amount(match: re.Match, first_group: int) -> Optional[float]:
+    """
+    Lee un monto de NUMBER_PATTERN y lo acepta solo si se ve que es un precio.
+    
+    Args:
+        match (re.Match): Coincidencia que contiene NUMBER_PATTERN
+        first_group (int): Número del primer grupo del monto dentro de la coincidencia
+        
+    Returns:
+        Optional[float]: Monto en pesos, o None si parece una cantidad (personas, km, productos)
+    """
+    dollar, number, multiplier, pesos = (match.group(first_group + i) for i in range(NUMBER_GROUPS))
+    value = parse_amount(number, multiplier)
+    if dollar or multiplier or pesos or THOUSANDS_PATTERN.search(number) or value >= MIN_IMPLICIT_AMOUNT:
+        return value
+    return None
+
+
+def format_price(value: float) -> str:
+    """Formatea un precio en pesos con separador de miles '.' y decimales ','."""
+    formatted = f"{value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+    return f"${formatted}"
+
+
+def singular(word: str) -> str:
+    """Lleva una palabra en plural a la forma usada en CATEGORY_TERMS."""
+    for candidate in (word, word[:-2] if word.endswith("es") else None, word[:-1] if word.endswith("s") else None):
+        if candidate in CATEGORY_TERMS:
+            return candidate
+    return word
+
+
+class CatalogEngine:
+    """
+    Catálogo en formato columnar con índices por categoría.
+    """
+
+    def __init__(self, names: np.ndarray, descriptions: np.ndarray, prices: np.ndarray,
+                 category_rows: Dict[str, np.ndarray], categories: Optional[np.ndarray] = None):
+        """
+        Args:
+            names (np.ndarray): Nombre de cada producto
+            descriptions (np.ndarray): Descripción de cada producto
+            prices (np.ndarray): Precio en pesos (float64, NaN si falta)
+            category_rows (Dict[str, np.ndarray]): Filas de cada término de categoría
+            categories (Optional[np.ndarray], optional): Columna de categoría del CSV ("" si falta)
+        """
+        self.names = names
+        self.descriptions = descriptions
+        self.prices = prices
+        self.category_rows = category_rows
+        self.categories = categories if categories is not None else np.full(len(names), "", dtype=str)
+        self.folded_names = [fold_accents(str(name)) for name in names]
+
+    @classmethod
+    def from_csv(cls, csv_path: str) -> "CatalogEngine":
+        """
+        Construye el motor leyendo catalogo.csv.
+        
+        Args:
+            csv_path (str): Ruta de catalogo.csv
+            
+        Returns:
+            CatalogEngine: Motor listo para consultar
+        """
+        df = pd.read_csv(csv_path)
+        columns = df.columns.tolist()
+        producto_col = next((col for col in columns if 'producto' in col.lower() or 'nombre' in col.lower()), columns[0])
+        descripcion_col = next((col for col in columns if 'descrip' in col.lower()), None)
+        precio_col = next((col for col in columns if 'precio' in col.lower()), None)
+        categoria_col = next((col for col in columns if 'categor' in col.lower()), None)
+        
+        df = df[df[producto_col].notna()]
+        names = df[producto_col].astype(str).str.strip().to_numpy(dtype=str)
+        descriptions = (df[descripcion_col].fillna("").astype(str).to_numpy(dtype=str)
+                        if descripcion_col else np.full(len(df), "", dtype=str))
+        prices = (pd.to_numeric(df[precio_col], errors="coerce").to_numpy(dtype=np.float64)
+                  if precio_col else np.full(len(df), np.nan))
+        categories = (df[categoria_col].fillna("").astype(str).str.strip().to_numpy(dtype=str)
+                      if categoria_col else np.full(len(df), "", dtype=str))
+        
+        category_rows = {}
+        folded = [set(re.findall(r"\w+", fold_accents(name))) for name in names]
+        for term in CATEGORY_TERMS:
+            rows = np.array([i for i, words in enumerate(folded) if term in words], dtype=np.int64)
+            if len(rows):
+                category_rows[term] = rows
+        
+        return cls(names, descriptions, prices, category_rows, categories)
+
+    def save(self, path: str, source_signature: str) -> None:
+        """
+        Guarda el catálogo en un archivo columnar .npz.
+        
+        Args:
+            path (str): Ruta del archivo
+            source_signature (str): Firma del CSV de origen para detectar cambios
+        """
+        arrays = {f"category__{term}": rows for term, rows in self.category_rows.items()}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, version=np.array(CATALOG_CACHE_VERSION), signature=np.array(source_signature),
+                 names=self.names, descriptions=self.descriptions, prices=self.prices,
+                 categories=self.categories, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, csv_path: str, cache_path: str) -> "CatalogEngine":
+        """
+        Carga el catálogo desde el archivo columnar, o desde el CSV si cambió.
+        
+        Args:
+            csv_path (str): Ruta de catalogo.csv
+            cache_path (str): Ruta del archivo .npz
+            
+        Returns:
+            CatalogEngine: Motor listo para consultar
+        """
+        stat = os.stat(csv_path)
+        signature = f"{stat.st_mtime_ns}:{stat.st_size}"
+        
+        if os.path.exists(cache_path):
+            with np.load(cache_path, allow_pickle=False) as data:
+                if int(data["version"]) == CATALOG_CACHE_VERSION and str(data["signature"]) == signature:
+                    category_rows = {key.split("__", 1)[1]: data[key] for key in data.files if key.startswith("category__")}
+                    return cls(data["names"], data["descriptions"], data["prices"], category_rows,
+                               data["categories"])
+        
+        engine = cls.from_csv(csv_path)
+        try:
+            engine.save(cache_path, signature)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar la caché del catálogo: {str(e)}")
+        return engine
+
+    def _ordered(self, rows: np.ndarray, descending: bool = False) -> List[Dict[str, Any]]:
+        """Productos de las filas indicadas ordenados por precio."""
+        mask = np.zeros(len(self.names), dtype=bool)
+        mask[rows] = True
+        mask &= ~np.isnan(self.prices)
+        selected = np.flatnonzero(mask)
+        order = selected[np.argsort(self.prices[selected], kind="stable")]
+        if descending:
+            order = order[::-1]
+        return [
+            {"nombre": str(self.names[i]), "descripcion": str(self.descriptions[i]), "precio": float(self.prices[i])}
+            for i in order
+        ]
+
+    def categories_in(self, folded_query: str) -> np.ndarray:
+        """Filas de las categorías mencionadas en la consulta; todas si no menciona ninguna."""
+        terms = {singular(word) for word in re.findall(r"\w+", folded_query)}
+        rows = [self.category_rows[term] for term in terms if term in self.category_rows]
+        if not rows:
+            return np.arange(len(self.names))
+        return np.unique(np.concatenate(rows))
+
+    def similar_rows(self, reference: int) -> np.ndarray:
+        """
+        Filas de los productos comparables con el de referencia.
+        
+        Usa la columna de categoría del catálogo si la tiene; si no, los términos de categoría del
+        nombre. Si con eso no queda ningún otro producto, compara contra todo el catálogo.
+        """
+        if self.categories[reference]:
+            rows = np.flatnonzero(self.categories == self.categories[reference])
+        else:
+            rows = self.categories_in(self.folded_names[reference])
+        if not np.any(rows != reference):
+            return np.arange(len(self.names))
+        return rows
+
+    def products_in(self, folded_query: str) -> List[int]:
+        """Filas de los productos nombrados completos en la consulta, en orden de aparición."""
+        found = [(folded_query.find(name), i) for i, name in enumerate(self.folded_names) if name in folded_query]
+        return [i for _, i in sorted(found)]
+
+    def answer(self, query: str, product_names: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Responde una pregunta estructurada de precio, si la consulta lo es.
+        
+        Args:
+            query (str): Consulta del usuario
+            product_names (Optional[List[str]], optional): Productos ya detectados por el índice de entidades
+            
+        Returns:
+            Optional[Dict[str, Any]]: 'description' de la consulta interpretada y 'products' con el
+            resultado exacto, o None si la consulta no es estructurada
+        """
+        folded = fold_accents(query)
+        if NON_CATALOG_PATTERN.search(folded):
+            return None
+        price_context = bool(PRICE_CONTEXT_PATTERN.search(folded))
+        
+        named = [i for i, name in enumerate(self.names) if product_names and name in product_names]
+        named = named or self.products_in(folded)
+        cheapest = CHEAPEST_PATTERN.search(folded)
+        priciest = PRICIEST_PATTERN.search(folded)
+        
+        # Comparación entre productos concretos
+        if len(named) >= 2 and (COMPARE_PATTERN.search(folded) or price_context):
+            return {"description": "Comparación de precios", "products": self._ordered(np.array(named))}
+        
+        # "Algo más barato/caro que X": misma categoría, por debajo o por encima de su precio
+        if len(named) == 1 and (cheapest or priciest) and not np.isnan(self.prices[named[0]]):
+            reference = named[0]
+            rows = self.similar_rows(reference)
+            price = self.prices[reference]
+            if cheapest:
+                products = [p for p in self._ordered(rows) if p["precio"] < price]
+                description = f"Productos más económicos que {self.names[reference]} ({format_price(price)})"
+            else:
+                products = [p for p in self._ordered(rows) if p["precio"] > price]
+                description = f"Productos de mayor precio que {self.names[reference]} ({format_price(price)})"
+            return {"description": description, "products": products}
+        
+        if named:
+            return None
+        
+        rows = self.categories_in(folded)
+        
+        # Rangos de precio
+        for kind, pattern in RANGE_PATTERNS:
+            match = pattern.search(folded)
+            if not match:
+                continue
+            if kind == "between":
+                low = explicit_amount(match, 1)
+                high = explicit_amount(match, 1 + NUMBER_GROUPS)
+                # "entre 100 y 200 mil": el multiplicador del segundo monto vale para los dos
+                if match.group(3 + NUMBER_GROUPS) and not match.group(3):
+                    low = parse_amount(match.group(2), match.group(3 + NUMBER_GROUPS))
+                if low is None or high is None:
+                    continue
+                low, high = min(low, high), max(low, high)
+                description = f"Productos entre {format_price(low)} y {format_price(high)}"
+            elif kind == "max":
+                low, high = -np.inf, explicit_amount(match, 1)
+                if high is None:
+                    continue
+                description = f"Productos de hasta {format_price(high)}"
+            else:
+                low, high = explicit_amount(match, 1), np.inf
+                if low is None:
+                    continue
+                description = f"Productos desde {format_price(low)}"
+            prices = self.prices[rows]
+            selected = rows[(prices >= low) & (prices <= high)]
+            return {"description": description, "products": self._ordered(selected)}
+        
+        # Más barato / más caro
+        if cheapest:
+            return {"description": "Opción más económica", "products": self._ordered(rows)[:1]}
+        if priciest:
+            return {"description": "Opción de mayor precio", "products": self._ordered(rows, descending=True)[:1]}
+        
+        # Listado ordenado por precio
+        if SORT_PATTERN.search(folded):
+            return {"description": "Productos ordenados por precio", "products": self._ordered(rows)}
+        
+        return None
+
+
+def format_catalog_answer(result: Dict[str, Any]) -> str:
+    """
+    Convierte el resultado del motor en texto para el contexto o la respuesta.
+    
+    Args:
+        result (Dict[str, Any]): Resultado de CatalogEngine.answer
+        
+    Returns:
+        str: Listado de productos con precio y descripción
+    """
+    if not result["products"]:
+        return f"{result['description']}: no hay productos del catálogo que cumplan esa condición."
+    
+    lines = [f"{result['description']} (datos exactos del catálogo):"]
+    for product in result["products"]:
+        line = f"- {product['nombre']}: {format_price(product['precio'])}"
+        if product["descripcion"]:
+            line += f". {product['descripcion']}"
+        lines.append(line)
+    return "\n".join(lines)
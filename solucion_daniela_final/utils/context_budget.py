@@ -0,0 +1,190 @@
+"""
+Armado del contexto del prompt dentro de un presupuesto de tokens.
+
+Los resultados llegan ordenados por relevancia. Se descartan los que no superan la similitud
+mínima, se quita el texto repetido entre chunks del mismo archivo (el chunk_overlap del splitter)
+y se empaquetan en orden hasta llenar el presupuesto, contando tokens con el tokenizador del LLM.
+"""
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# Caracteres por token para estimar si no está instalado tiktoken
+CHARS_PER_TOKEN = 4
+
+# El aviso de la estimación por caracteres se da una sola vez por proceso
+_fallback_warned = False
+_encoding_lock = threading.Lock()
+
+# Solapamiento mínimo (en caracteres) para considerarlo texto repetido y no una coincidencia
+MIN_OVERLAP_CHARS = 20
+
+
+class TokenCounter:
+    """
+    Cuenta tokens con tiktoken (el tokenizador de los modelos de OpenAI), cargado al primer uso.
+    
+    Si tiktoken no está instalado (ver requirements.txt) se estima con CHARS_PER_TOKEN caracteres
+    por token y se avisa una sola vez por proceso, aunque haya varios contadores.
+    """
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+
+    def _get_encoding(self):
+        global _fallback_warned
+        if self._loaded:
+            return self._encoding
+        
+        with _encoding_lock:
+            if not self._loaded:
+                try:
+                    import tiktoken
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    if not _fallback_warned:
+                        _fallback_warned = True
+                        logger.warning(f"No se pudo cargar tiktoken ({str(e)}); los tokens se estiman "
+                                       f"con {CHARS_PER_TOKEN} caracteres por token")
+                self._loaded = True
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        """Cantidad de tokens del texto."""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Recorta el texto a los primeros max_tokens tokens."""
+        encoding = self._get_encoding()
+        if encoding is None:
+            return text[:max_tokens * CHARS_PER_TOKEN]
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def similarity_from_distance(score: float, lower_is_better: bool) -> float:
+    """
+    Convierte el puntaje de FAISS en similitud coseno.
+    
+    Con vectores normalizados (all-MiniLM-L6-v2 normaliza sus embeddings) la distancia L2 al
+    cuadrado es 2 - 2·coseno; con producto interno el puntaje ya es el coseno.
+    
+    Args:
+        score (float): Puntaje devuelto por el índice
+        lower_is_better (bool): True si el puntaje es una distancia
+    
+    Returns:
+        float: Similitud coseno
+    """
+    return 1.0 - score / 2.0 if lower_is_better else score
+
+
+def overlap_length(first: str, second: str, max_overlap: int) -> int:
+    """
+    Largo del sufijo de 'first' que es prefijo de 'second'.
+    
+    Args:
+        first (str): Texto anterior
+        second (str): Texto siguiente
+        max_overlap (int): Solapamiento máximo a buscar
+    
+    Returns:
+        int: Caracteres solapados, o 0 si son menos de MIN_OVERLAP_CHARS
+    """
+    for length in range(min(len(first), len(second), max_overlap), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def remove_overlap(text: str, previous: List[str], max_overlap: int) -> str:
+    """
+    Quita del texto lo que ya está en los chunks elegidos del mismo archivo.
+    
+    Args:
+        text (str): Contenido del chunk candidato
+        previous (List[str]): Contenidos ya elegidos del mismo archivo
+        max_overlap (int): Solapamiento máximo (el chunk_overlap del splitter, con margen)
+    
+    Returns:
+        str: Texto sin la parte repetida; vacío si el chunk ya estaba contenido
+    """
+    for chosen in previous:
+        if text in chosen:
+            return ""
+        head = overlap_length(chosen, text, max_overlap)
+        if head:
+            text = text[head:].lstrip()
+        tail = overlap_length(text, chosen, max_overlap)
+        if tail:
+            text = text[:-tail].rstrip()
+    return text
+
+
+def pack_contexts(results: List[Tuple[Document, Optional[float]]], token_budget: int, counter: TokenCounter,
+                  min_similarity: float = 0.0, max_results: Optional[int] = None,
+                  max_overlap: int = 400) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Elige y formatea los chunks que entran en el presupuesto de tokens.
+    
+    Args:
+        results (List[Tuple[Document, Optional[float]]]): Documentos por relevancia con su similitud
+            coseno; None para los que no vienen de la búsqueda densa (BM25, búsqueda por producto)
+        token_budget (int): Tokens máximos del contexto, con las líneas de fuente incluidas
+        counter (TokenCounter): Contador de tokens
+        min_similarity (float, optional): Similitud mínima de los resultados densos
+        max_results (Optional[int], optional): Cantidad máxima de chunks
+        max_overlap (int, optional): Solapamiento máximo entre chunks del mismo archivo
+    
+    Returns:
+        Tuple[List[str], Dict[str, Any]]: Contextos con su línea [Fuente: ...] y estadísticas
+        ('tokens', 'below_cutoff', 'over_budget', 'overlap_chars')
+    """
+    contexts: List[str] = []
+    chosen_by_source: Dict[str, List[str]] = {}
+    seen_contents = set()
+    stats = {"tokens": 0, "below_cutoff": 0, "over_budget": 0, "overlap_chars": 0}
+    
+    for doc, similarity in results:
+        if max_results is not None and len(contexts) >= max_results:
+            break
+        if doc.page_content in seen_contents:
+            continue
+        seen_contents.add(doc.page_content)
+        if similarity is not None and similarity < min_similarity:
+            stats["below_cutoff"] += 1
+            continue
+        
+        source = doc.metadata.get("source", "Unknown source")
+        previous = chosen_by_source.setdefault(source, [])
+        text = remove_overlap(doc.page_content, previous, max_overlap)
+        stats["overlap_chars"] += len(doc.page_content) - len(text)
+        if not text:
+            continue
+        
+        formatted = f"{text}\n[Fuente: {source}]"
+        tokens = counter.count(formatted)
+        remaining = token_budget - stats["tokens"]
+        if tokens > remaining:
+            # El chunk más relevante se recorta antes que quedarse sin contexto
+            if contexts:
+                stats["over_budget"] += 1
+                continue
+            source_line = f"\n[Fuente: {source}]"
+            text = counter.truncate(text, max(remaining - counter.count(source_line), 0))
+            formatted = text + source_line
+            tokens = counter.count(formatted)
+        
+        contexts.append(formatted)
+        previous.append(doc.page_content)
+        stats["tokens"] += tokens
+    
+    return contexts, stats
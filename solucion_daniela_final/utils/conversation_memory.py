@@ -0,0 +1,182 @@
+"""
+Memoria de conversación con resumen incremental y tamaño acotado.
+
+Conserva textuales los últimos turnos y va plegando los anteriores en un resumen corto, en un hilo
+aparte para no demorar la respuesta. Por separado lleva los productos y temas que mencionó el
+cliente, un contexto chico para la búsqueda que no arrastra las respuestas largas del asistente.
+"""
+import re
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Largo máximo de cada mensaje dentro del resumen extractivo
+SUMMARY_LINE_CHARS = 160
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def shorten(text: str, max_chars: int) -> str:
+    """Recorta el texto a max_chars caracteres sin cortar palabras."""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+def extractive_summary(summary: str, messages: List[Dict[str, str]]) -> str:
+    """
+    Suma al resumen una línea por mensaje, sin llamar al LLM.
+    
+    Args:
+        summary (str): Resumen actual
+        messages (List[Dict[str, str]]): Mensajes a plegar, con 'role' y 'content'
+    
+    Returns:
+        str: Resumen con las preguntas del cliente y la primera oración de cada respuesta
+    """
+    lines = summary.split("\n") if summary else []
+    for message in messages:
+        if message["role"] == "user":
+            lines.append(f"- El cliente preguntó: {shorten(message['content'], SUMMARY_LINE_CHARS)}")
+        else:
+            first_sentence = SENTENCE_END.split(message["content"].strip(), 1)[0]
+            lines.append(f"  Se le respondió: {shorten(first_sentence, SUMMARY_LINE_CHARS)}")
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """
+    Historial de una conversación: últimos turnos textuales, resumen de los anteriores y contexto de búsqueda.
+    
+    Uso:
+        memory.add("user", mensaje)
+        process_query(mensaje, ..., memory.history(), retrieval_context=memory.retrieval_context())
+        memory.add("assistant", respuesta)
+    """
+
+    def __init__(self, recent_turns: int = 3, max_summary_chars: int = 1200, max_entities: int = 4,
+                 entity_extractor: Optional[Callable[[str], List[str]]] = None,
+                 summarizer: Optional[Callable[[str, List[Dict[str, str]]], str]] = None):
+        """
+        Args:
+            recent_turns (int, optional): Turnos (pregunta y respuesta) que se conservan textuales
+            max_summary_chars (int, optional): Largo máximo del resumen; se descarta lo más antiguo
+            max_entities (int, optional): Productos y temas recientes que forman el contexto de búsqueda
+            entity_extractor (Optional[Callable[[str], List[str]]], optional): Devuelve los productos
+                y temas nombrados en un mensaje del cliente
+            summarizer (Optional[Callable[[str, List[Dict[str, str]]], str]], optional): Pliega mensajes
+                en el resumen; por defecto extractive_summary. Si falla se usa extractive_summary.
+        """
+        self.recent_turns = max(recent_turns, 1)
+        self.max_summary_chars = max_summary_chars
+        self.max_entities = max_entities
+        self.entity_extractor = entity_extractor
+        self.summarizer = summarizer or extractive_summary
+        self._summary = ""
+        self._pending: List[Dict[str, str]] = []
+        self._recent: List[Dict[str, str]] = []
+        self._entities: List[str] = []
+        self._transcript: List[Dict[str, str]] = []
+        self._folding: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def add(self, role: str, content: str) -> None:
+        """
+        Agrega un mensaje; los turnos que quedan fuera de la ventana se resumen en segundo plano.
+        
+        Args:
+            role (str): "user" o "assistant"
+            content (str): Texto del mensaje
+        """
+        entities = self.entity_extractor(content) if role == "user" and self.entity_extractor else []
+        with self._lock:
+            message = {"role": role, "content": content}
+            self._recent.append(message)
+            self._transcript.append(message)
+            for entity in entities:
+                if entity in self._entities:
+                    self._entities.remove(entity)
+                self._entities.append(entity)
+            if len(self._entities) > self.max_entities:
+                del self._entities[:len(self._entities) - self.max_entities]
+            
+            # Se pliega recién con la respuesta, así el turno en curso queda entero en la ventana
+            overflow = len(self._recent) - 2 * self.recent_turns
+            if role != "assistant" or overflow <= 0:
+                return
+            self._pending.extend(self._recent[:overflow])
+            del self._recent[:overflow]
+            if self._folding is None:
+                self._folding = threading.Thread(target=self._fold, name="memory-summary", daemon=True)
+                self._folding.start()
+
+    def _fold(self) -> None:
+        """Pliega los mensajes pendientes en el resumen hasta que no quede ninguno."""
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._folding = None
+                    return
+                summary, messages = self._summary, list(self._pending)
+            
+            try:
+                new_summary = self.summarizer(summary, messages)
+            except Exception as e:
+                logger.warning(f"No se pudo resumir la conversación ({str(e)}); se usa el resumen extractivo")
+                new_summary = extractive_summary(summary, messages)
+            
+            # Si supera el largo máximo se conserva lo más reciente, desde un comienzo de línea
+            if len(new_summary) > self.max_summary_chars:
+                new_summary = new_summary[-self.max_summary_chars:]
+                new_summary = new_summary.split("\n", 1)[-1] if "\n" in new_summary else new_summary
+            
+            with self._lock:
+                self._summary = new_summary.strip()
+                del self._pending[:len(messages)]
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Espera a que termine el resumen en curso, si lo hay."""
+        folding = self._folding
+        if folding is not None:
+            folding.join(timeout)
+
+    def history(self) -> List[Dict[str, str]]:
+        """
+        Historial para el prompt.
+        
+        Returns:
+            List[Dict[str, str]]: Resumen (rol "summary") si lo hay, los mensajes que todavía se están
+            resumiendo y los últimos turnos textuales
+        """
+        with self._lock:
+            summary = [{"role": "summary", "content": self._summary}] if self._summary else []
+            return summary + list(self._pending) + list(self._recent)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Mensajes textuales que todavía no se plegaron en el resumen."""
+        with self._lock:
+            return list(self._pending) + list(self._recent)
+
+    def transcript(self) -> List[Dict[str, str]]:
+        """Todos los mensajes de la conversación, incluidos los ya plegados en el resumen (para el log)."""
+        with self._lock:
+            return list(self._transcript)
+
+    def summary(self) -> str:
+        """Resumen de los turnos anteriores a la ventana."""
+        with self._lock:
+            return self._summary
+
+    def retrieval_context(self) -> str:
+        """
+        Contexto para expandir la consulta de búsqueda.
+        
+        Returns:
+            str: Productos y temas mencionados por el cliente, del más antiguo al más reciente;
+            vacío si todavía no nombró ninguno
+        """
+        with self._lock:
+            return ", ".join(self._entities)
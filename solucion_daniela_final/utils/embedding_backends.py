@@ -0,0 +1,71 @@
+"""
+Backends de embeddings intercambiables para CPU.
+
+Todos devuelven un objeto Embeddings de LangChain con la misma interfaz
+(embed_documents / embed_query), así el resto del código no cambia según el backend:
+- "pytorch": SentenceTransformer en precisión completa (comportamiento original)
+- "onnx": el mismo modelo exportado a ONNX Runtime
+- "onnx-int8": variante ONNX con cuantización dinámica int8
+"""
+import logging
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ["pytorch", "onnx", "onnx-int8"]
+
+
+def embedding_model_key(model_name: str, backend: str) -> str:
+    """
+    Identificador del modelo para las cachés de embeddings.
+    
+    Los vectores de backends distintos difieren levemente, por eso no se comparten.
+    
+    Args:
+        model_name (str): Nombre del modelo
+        backend (str): Backend de embeddings
+        
+    Returns:
+        str: Nombre del modelo, con sufijo del backend si no es el original
+    """
+    return model_name if backend == "pytorch" else f"{model_name}@{backend}"
+
+
+def create_embedding_model(model_name: str, cache_dir: str, backend: str = "pytorch",
+                           onnx_int8_file: str = "onnx/model_quint8_avx2.onnx", batch_size: int = 32,
+                           multi_process: bool = False) -> Embeddings:
+    """
+    Crea el modelo de embeddings con el backend indicado.
+    
+    Args:
+        model_name (str): Nombre del modelo de sentence-transformers
+        cache_dir (str): Carpeta de caché de modelos
+        backend (str, optional): "pytorch", "onnx" u "onnx-int8". Default es "pytorch".
+        onnx_int8_file (str, optional): Archivo ONNX cuantizado dentro del repositorio del modelo
+        batch_size (int, optional): Textos por pasada del modelo. Default es 32 (el de sentence-transformers).
+        multi_process (bool, optional): Codificar con un proceso por núcleo (útil solo para lotes grandes)
+        
+    Returns:
+        Embeddings: Modelo de embeddings listo para usar
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: {backend}. Opciones: {EMBEDDING_BACKENDS}")
+    
+    from langchain_huggingface import HuggingFaceEmbeddings
+    
+    model_kwargs = {}
+    if backend == "onnx":
+        model_kwargs = {"backend": "onnx"}
+    elif backend == "onnx-int8":
+        model_kwargs = {"backend": "onnx", "model_kwargs": {"file_name": onnx_int8_file}}
+    
+    logger.info(f"Backend de embeddings: {backend}")
+    
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        cache_folder=cache_dir,
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": batch_size},
+        multi_process=multi_process
+    )
@@ -0,0 +1,182 @@
+"""
+Caché de embeddings con desalojo LRU y un nivel opcional en disco.
+"""
+import logging
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza un texto para usarlo como clave de caché.
+    
+    Args:
+        text (str): Texto original
+        
+    Returns:
+        str: Texto en forma NFC, en minúsculas y con espacios colapsados
+    """
+    return " ".join(unicodedata.normalize("NFC", text).lower().split())
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envuelve un modelo de embeddings y guarda los vectores ya calculados.
+    
+    La clave es el nombre del modelo más el texto normalizado, por lo que consultas
+    repetidas ("leonor", "fogonero", etc.) cuestan una búsqueda en un diccionario en
+    lugar de una pasada del modelo. Consultas y documentos comparten la caché porque
+    el modelo configurado los codifica de la misma manera.
+    """
+
+    def __init__(self, embeddings: Optional[Embeddings], model_name: str, max_size: int = 4096,
+                 disk_path: Optional[str] = None):
+        """
+        Args:
+            embeddings (Embeddings): Modelo de embeddings a envolver; puede asignarse después
+                si el modelo se carga en paralelo con el índice
+            model_name (str): Nombre del modelo, forma parte de la clave
+            max_size (int, optional): Cantidad máxima de vectores en memoria. Default es 4096.
+            disk_path (Optional[str], optional): Archivo SQLite para el nivel en disco
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"No se pudo abrir la caché de embeddings en disco: {str(e)}")
+                self._disk = None
+
+    def _key(self, text: str) -> str:
+        """Construye la clave de caché para un texto."""
+        raw = f"{self.model_name}\x00{normalize_text(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        """Busca un vector en memoria y luego en disco. Debe llamarse con el lock tomado."""
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return vector
+        
+        if self._disk is not None:
+            row = self._disk.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                self._remember(key, vector)
+                self.hits += 1
+                self.disk_hits += 1
+                return vector
+        
+        self.misses += 1
+        return None
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        """Guarda un vector en memoria desalojando el menos usado. Debe llamarse con el lock tomado."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _store(self, items: Dict[str, List[float]]) -> None:
+        """Guarda vectores nuevos en memoria y, si está habilitado, en disco."""
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            
+            if self._disk is not None and items:
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+                )
+                self._disk.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Calcula embeddings para una lista de textos, reutilizando los que estén en caché.
+        
+        Args:
+            texts (List[str]): Textos a vectorizar
+            
+        Returns:
+            List[List[float]]: Un vector por texto, en el mismo orden
+        """
+        keys = [self._key(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, str] = {}
+        
+        with self._lock:
+            for i, key in enumerate(keys):
+                results[i] = self._get(key)
+                if results[i] is None and key not in missing:
+                    missing[key] = texts[i]
+        
+        # Los textos faltantes se calculan en un único lote
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            for i, key in enumerate(keys):
+                if results[i] is None:
+                    results[i] = computed[key]
+        
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Calcula el embedding de una consulta, reutilizándolo si está en caché.
+        
+        Args:
+            text (str): Consulta a vectorizar
+            
+        Returns:
+            List[float]: Vector de la consulta
+        """
+        key = self._key(text)
+        with self._lock:
+            vector = self._get(key)
+        
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store({key: vector})
+        
+        return vector
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Devuelve los contadores de uso de la caché.
+        
+        Returns:
+            Dict[str, float]: Aciertos, fallos, aciertos en disco, tamaño y tasa de aciertos
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "size": len(self._memory),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,267 @@
+"""
+Almacén persistente de embeddings direccionado por contenido.
+
+Cada chunk se identifica por el hash de su texto, de modo que una reconstrucción del
+índice solo vectoriza los textos nuevos aunque cambien chunk_size o chunk_overlap.
+Los vectores se guardan en una matriz float32 que se lee con memory-map. Cada lote nuevo
+agrega sus filas a la matriz y sus entradas (hash, fila) a rows.log; flush() las compacta en
+index.json al terminar la indexación, así el costo de cada lote no crece con el almacén.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+from typing import List, Dict, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    """
+    Calcula el hash de contenido de un chunk.
+    
+    Args:
+        text (str): Texto del chunk
+        
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Matriz de vectores en disco más un índice hash -> fila, separada por modelo.
+    """
+
+    def __init__(self, directory: str, model_name: str):
+        """
+        Args:
+            directory (str): Carpeta raíz del almacén
+            model_name (str): Nombre del modelo; cada modelo usa su propia subcarpeta
+        """
+        self.model_name = model_name
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name))
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.log_path = os.path.join(self.directory, "rows.log")
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        # Filas agregadas desde que se mapeó la matriz, en memoria hasta el próximo flush
+        self._recent: List[np.ndarray] = []
+        self.hits = 0
+        self.misses = 0
+        self.embed_seconds = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        """Lee el índice, aplica el registro de filas pendiente y abre la matriz con memory-map si existe."""
+        if not os.path.exists(self.index_path):
+            return
+        
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("model") != self.model_name:
+                logger.warning("El almacén de embeddings corresponde a otro modelo, se ignora")
+                return
+            self.dim = data["dim"]
+            self._rows = data["rows"]
+            indexed = len(self._rows)
+            replayed = self._replay_log()
+            self._repair_vectors()
+            if replayed or len(self._rows) != indexed:
+                self._compact()
+            self._open_matrix()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"No se pudo leer el almacén de embeddings: {str(e)}")
+            self.dim, self._rows, self._matrix = None, {}, None
+
+    def _replay_log(self) -> bool:
+        """
+        Aplica las entradas de rows.log que todavía no se compactaron en index.json.
+        
+        Las filas se numeran en orden, así que la lectura se detiene en la primera entrada
+        escrita a medias o fuera de secuencia.
+        
+        Returns:
+            bool: True si había un registro pendiente
+        """
+        if not os.path.exists(self.log_path):
+            return False
+        
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if not line.endswith("\n") or len(parts) != 2:
+                    break
+                key, row = parts[0], int(parts[1])
+                if key in self._rows:
+                    continue  # ya compactada antes de que se borrara el registro
+                if row != len(self._rows):
+                    break
+                self._rows[key] = row
+        return True
+
+    def _repair_vectors(self) -> None:
+        """
+        Alinea vectors.f32 con las filas registradas tras una escritura interrumpida.
+        
+        put agrega los vectores antes de registrar sus filas: si el proceso se cortó entre las dos
+        escrituras, el archivo tiene filas de más (o una fila a medias) que se recortan. Si tiene
+        menos filas que el índice, se descartan las entradas que apuntan más allá del final.
+        """
+        row_bytes = self.dim * np.dtype(np.float32).itemsize
+        expected = len(self._rows) * row_bytes
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        
+        if size > expected:
+            logger.warning(f"El almacén de embeddings tiene {size - expected} bytes sin indexar, se recortan")
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(expected)
+        elif size < expected:
+            available = size // row_bytes
+            logger.warning(f"Al almacén de embeddings le faltan {len(self._rows) - available} filas, "
+                           f"se descartan del índice")
+            self._rows = {key: row for key, row in self._rows.items() if row < available}
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(available * row_bytes)
+
+    def _open_matrix(self) -> None:
+        """Mapea en memoria las filas ya escritas."""
+        self._matrix = None
+        if self.dim and self._rows and os.path.exists(self.vectors_path):
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                     shape=(len(self._rows), self.dim))
+
+    def _compact(self) -> None:
+        """Escribe index.json con todas las filas de forma atómica y descarta rows.log."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "rows": self._rows}, f)
+        os.replace(tmp_path, self.index_path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+    def _vector(self, row: int) -> np.ndarray:
+        """Devuelve una fila, del memory-map o de las agregadas desde el último flush."""
+        mapped = 0 if self._matrix is None else len(self._matrix)
+        return self._matrix[row] if row < mapped else self._recent[row - mapped]
+
+    def get(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Busca los vectores guardados para una lista de textos.
+        
+        Args:
+            texts (List[str]): Textos a buscar
+            
+        Returns:
+            List[Optional[List[float]]]: Vector o None por cada texto
+        """
+        results: List[Optional[List[float]]] = []
+        for text in texts:
+            row = self._rows.get(text_hash(text))
+            if row is not None:
+                results.append(self._vector(row).tolist())
+                self.hits += 1
+            else:
+                results.append(None)
+                self.misses += 1
+        return results
+
+    def put(self, texts: List[str], vectors: List[List[float]]) -> None:
+        """
+        Agrega vectores nuevos al final de la matriz y registra sus filas en rows.log.
+        
+        index.json no se reescribe hasta flush(); si el proceso se corta antes, la próxima
+        carga aplica el registro.
+        
+        Args:
+            texts (List[str]): Textos vectorizados
+            vectors (List[List[float]]): Vectores correspondientes
+        """
+        pending: Dict[str, List[float]] = {}
+        for text, vector in zip(texts, vectors):
+            key = text_hash(text)
+            if key not in self._rows:
+                pending.setdefault(key, vector)
+        
+        if not pending:
+            return
+        
+        matrix = np.asarray(list(pending.values()), dtype=np.float32)
+        if self.dim is None:
+            self.dim = matrix.shape[1]
+        
+        # Un almacén vacío empieza de cero: index.json lleva el modelo y la dimensión que el registro necesita
+        fresh = not self._rows
+        if fresh:
+            self._compact()
+        
+        with open(self.vectors_path, "wb" if fresh else "ab") as f:
+            f.write(matrix.tobytes())
+        
+        first_row = len(self._rows)
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.writelines(f"{key} {first_row + i}\n" for i, key in enumerate(pending))
+        
+        for i, key in enumerate(pending):
+            self._rows[key] = first_row + i
+        self._recent.extend(matrix)
+
+    def flush(self) -> None:
+        """Compacta rows.log en index.json y vuelve a mapear la matriz con todas las filas."""
+        if not self._recent and not os.path.exists(self.log_path):
+            return
+        
+        self._compact()
+        self._recent = []
+        self._open_matrix()
+
+    def embed(self, texts: List[str], embeddings: Embeddings) -> List[List[float]]:
+        """
+        Devuelve los vectores de los textos, calculando solo los que no están guardados.
+        
+        Args:
+            texts (List[str]): Textos a vectorizar
+            embeddings (Embeddings): Modelo de embeddings para los textos nuevos
+            
+        Returns:
+            List[List[float]]: Un vector por texto, en el mismo orden
+        """
+        results = self.get(texts)
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        
+        if missing:
+            start = time.perf_counter()
+            vectors = embeddings.embed_documents([texts[i] for i in missing])
+            self.embed_seconds += time.perf_counter() - start
+            self.put([texts[i] for i in missing], vectors)
+            for i, vector in zip(missing, vectors):
+                results[i] = vector
+        
+        return results
+
+    def report(self) -> Dict[str, float]:
+        """
+        Resume el uso del almacén durante la ejecución.
+        
+        Returns:
+            Dict[str, float]: Aciertos, fallos, tasa de aciertos y segundos ahorrados estimados
+        """
+        total = self.hits + self.misses
+        seconds_per_text = self.embed_seconds / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "embed_seconds": round(self.embed_seconds, 3),
+            "saved_seconds_estimate": round(self.hits * seconds_per_text, 3),
+        }
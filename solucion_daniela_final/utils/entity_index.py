@@ -0,0 +1,333 @@
+"""
+Índice de entidades de producto generado desde catalogo.csv.
+
+Resuelve menciones de productos sin depender de tildes ni de errores de tipeo:
+- los nombres y sus palabras distintivas se guardan sin acentos en un trie de tokens,
+  que encuentra la coincidencia más larga ("fogonero con media parrilla" antes que "media parrilla");
+- los tokens desconocidos se corrigen con un diccionario de borrados al estilo SymSpell
+  ("perikless" -> "perikles").
+Cada entidad guarda los ids de docstore de sus chunks para recuperarlos sin búsqueda vectorial.
+Una palabra de categoría que nombra a un solo producto también lo identifica ("sillón" -> "Sillón Clemente"),
+mientras que los nombres que son palabras comunes ("clara") solo cuentan con su categoría al lado o con mayúscula.
+"""
+import os
+import re
+import json
+import logging
+from itertools import combinations
+from typing import List, Dict, Optional, Set, Tuple
+
+from utils.bm25 import STOPWORDS, fold_accents
+
+logger = logging.getLogger(__name__)
+
+ENTITIES_FILE = "entities.json"
+ENTITIES_VERSION = 2
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Tipos de producto; identifican a un producto solo si el catálogo tiene uno de ese tipo
+CATEGORY_WORDS = {"camastro", "sillon", "fogonero", "parrilla", "barral", "mesa", "kit"}
+
+# Palabras de nombres de producto que por sí solas no identifican a un producto
+GENERIC_WORDS = CATEGORY_WORDS | {
+    "mesas", "completo", "simple", "doble", "juego", "media", "redondas", "con", "de",
+}
+
+# Nombres de producto que también son palabras comunes ("una respuesta clara"): solo identifican
+# al producto si la consulta nombra su categoría o los escribe con mayúscula
+COMMON_WORDS = {"clara", "brisa"}
+
+# Palabras de una consulta que solo pide los datos de un producto (precio, medidas, descripción)
+LOOKUP_WORDS = {
+    "precio", "precios", "cuesta", "cuestan", "costo", "vale", "valen", "sale", "salen", "info",
+    "informacion", "datos", "detalle", "detalles", "descripcion", "caracteristicas", "medida",
+    "medidas", "material", "materiales", "color", "colores", "quiero", "queria", "busco", "ver",
+    "saber", "sobre", "dame", "pasame", "contame", "mostrame", "producto", "hola", "gracias",
+}
+
+
+def split_words(text: str) -> List[str]:
+    """Divide un texto en palabras sin acentos y en minúsculas."""
+    return WORD_PATTERN.findall(fold_accents(text))
+
+
+def singular(word: str) -> str:
+    """Pasa al singular las palabras de categoría ("sillones" -> "sillon"); las demás quedan igual."""
+    for suffix in ("es", "s"):
+        if word.endswith(suffix) and word[:-len(suffix)] in CATEGORY_WORDS:
+            return word[:-len(suffix)]
+    return word
+
+
+def plural(word: str) -> str:
+    """Plural regular de una palabra sin acentos ("sillon" -> "sillones", "mesa" -> "mesas")."""
+    return word + ("s" if word[-1] in "aeiou" else "es")
+
+
+def edit_distance(a: str, b: str) -> int:
+    """
+    Distancia de Damerau-Levenshtein (variante de transposiciones adyacentes).
+    
+    Args:
+        a (str): Primera palabra
+        b (str): Segunda palabra
+        
+    Returns:
+        int: Cantidad mínima de ediciones
+    """
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        previous_previous, previous = previous, current
+    return previous[len(b)]
+
+
+def max_edits(word: str) -> int:
+    """Ediciones toleradas según el largo de la palabra; las cortas no se corrigen para evitar falsos positivos."""
+    if len(word) < 6:
+        return 0
+    return 1 if len(word) < 9 else 2
+
+
+def deletes(word: str, distance: int) -> Set[str]:
+    """Todas las variantes de la palabra con hasta `distance` letras borradas."""
+    variants = {word}
+    for removed in range(1, min(distance, len(word) - 1) + 1):
+        for positions in combinations(range(len(word)), removed):
+            variants.add("".join(char for i, char in enumerate(word) if i not in positions))
+    return variants
+
+
+class EntityIndex:
+    """
+    Matcher de productos con trie de tokens y corrección de tipeo.
+    """
+
+    def __init__(self, entities: List[Dict], delete_map: Dict[str, List[str]]):
+        """
+        Args:
+            entities (List[Dict]): Entidades con 'name', 'aliases', 'context_aliases' y 'chunk_ids'
+            delete_map (Dict[str, List[str]]): Variante con borrados -> palabras del vocabulario
+        """
+        self.entities = entities
+        self.delete_map = delete_map
+        self.vocabulary = {word for entity in entities for alias in entity["aliases"] for word in alias.split()}
+        
+        # Palabras del nombre que habilitan un alias común ("camastro" para "clara"), en singular y plural
+        self.context_words = []
+        for entity in entities:
+            words = {singular(word) for word in split_words(entity["name"])} - STOPWORDS - COMMON_WORDS
+            self.context_words.append(words | {plural(word) for word in words})
+        
+        # Trie de tokens: cada nodo es un dict y la clave None guarda el índice de la entidad
+        self.trie: Dict = {}
+        for position, entity in enumerate(entities):
+            for alias in entity["aliases"]:
+                node = self.trie
+                for word in alias.split():
+                    node = node.setdefault(word, {})
+                node[None] = position
+
+    @classmethod
+    def build(cls, product_names: List[str], chunk_ids: Dict[str, List[str]]) -> "EntityIndex":
+        """
+        Construye el índice a partir de los nombres del catálogo.
+        
+        Args:
+            product_names (List[str]): Nombres de producto tal como figuran en catalogo.csv
+            chunk_ids (Dict[str, List[str]]): Ids de docstore de los chunks de cada producto
+            
+        Returns:
+            EntityIndex: Índice construido
+        """
+        names_words = {name: split_words(name) for name in product_names}
+        
+        # Una palabra es distintiva si aparece en un solo producto y no es genérica;
+        # las de categoría se cuentan en singular para que "mesa" y "mesas" compartan dueños
+        owners: Dict[str, Set[str]] = {}
+        for name, words in names_words.items():
+            for word in words:
+                owners.setdefault(singular(word), set()).add(name)
+        
+        entities = []
+        for name, words in names_words.items():
+            aliases = {" ".join(words)}
+            aliases.update(
+                word for word in words
+                if len(owners[singular(word)]) == 1 and word.isalpha() and len(word) >= 5 and word not in GENERIC_WORDS
+            )
+            for word in {singular(word) for word in words} & CATEGORY_WORDS:
+                if len(owners[word]) == 1:
+                    aliases.update({word, plural(word)})
+            entities.append({
+                "name": name,
+                "aliases": sorted(aliases),
+                "context_aliases": sorted(aliases & COMMON_WORDS),
+                "chunk_ids": chunk_ids.get(name, []),
+            })
+        
+        # Diccionario de borrados precalculado para la corrección de tipeo
+        delete_map: Dict[str, Set[str]] = {}
+        for word in {word for words in names_words.values() for word in words}:
+            for variant in deletes(word, max_edits(word)):
+                delete_map.setdefault(variant, set()).add(word)
+        
+        return cls(entities, {variant: sorted(words) for variant, words in delete_map.items()})
+
+    def correct(self, word: str) -> Optional[str]:
+        """
+        Corrige una palabra al término más cercano del vocabulario.
+        
+        Args:
+            word (str): Palabra sin acentos
+            
+        Returns:
+            Optional[str]: Palabra del vocabulario o None si no hay una suficientemente cercana
+        """
+        if word in self.vocabulary:
+            return word
+        
+        limit = max_edits(word)
+        if limit == 0:
+            return None
+        
+        candidates = set()
+        for variant in deletes(word, limit):
+            candidates.update(self.delete_map.get(variant, []))
+        
+        best, best_distance = None, limit + 1
+        for candidate in sorted(candidates):
+            distance = edit_distance(word, candidate)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        
+        return best if best_distance <= limit else None
+
+    def _scan(self, text: str) -> Tuple[List[int], List[str]]:
+        """
+        Recorre el texto buscando la coincidencia más larga en cada posición.
+        
+        Args:
+            text (str): Consulta del usuario
+            
+        Returns:
+            Tuple[List[int], List[str]]: Posiciones de las entidades encontradas, sin repetir, y
+            palabras del texto que no forman parte de ninguna mención
+        """
+        tokens = WORD_PATTERN.findall(text)
+        words = [self.correct(word) or word for word in (fold_accents(token) for token in tokens)]
+        present = set(words)
+        found: List[int] = []
+        rest: List[str] = []
+        
+        i = 0
+        while i < len(words):
+            node, j, matched, end = self.trie, i, None, i
+            while j < len(words) and words[j] in node:
+                node = node[words[j]]
+                j += 1
+                if None in node:
+                    matched, end = node[None], j
+            
+            # Un alias que es palabra común necesita la categoría del producto o una mayúscula
+            if (matched is not None and end == i + 1 and words[i] in self.entities[matched].get("context_aliases", [])
+                    and not tokens[i][0].isupper() and not present & self.context_words[matched]):
+                matched = None
+            
+            if matched is not None:
+                if matched not in found:
+                    found.append(matched)
+                i = end
+            else:
+                rest.append(words[i])
+                i += 1
+        
+        return found, rest
+
+    def match(self, text: str) -> List[Dict]:
+        """
+        Encuentra los productos mencionados en un texto.
+        
+        Args:
+            text (str): Consulta del usuario
+            
+        Returns:
+            List[Dict]: Entidades encontradas, sin repetir, en orden de aparición
+        """
+        found, _ = self._scan(text)
+        return [self.entities[position] for position in found]
+
+    def is_product_lookup(self, text: str) -> bool:
+        """
+        Indica si el texto solo nombra productos y pide sus datos ("precio del camastro leonor").
+        
+        Args:
+            text (str): Consulta del usuario
+            
+        Returns:
+            bool: True si menciona productos y el resto son palabras vacías o de consulta de datos;
+            False si además pregunta por otro tema ("¿el camastro leonor tiene envío gratis?")
+        """
+        found, rest = self._scan(text)
+        return bool(found) and all(
+            word in STOPWORDS or word in LOOKUP_WORDS or singular(word) in GENERIC_WORDS or word.isdigit()
+            for word in rest
+        )
+
+    def update_chunks(self, removed_ids: List[str], chunk_ids: Dict[str, List[str]]) -> None:
+        """
+        Actualiza los chunks de cada producto sin reconstruir los alias ni el diccionario de borrados.
+        
+        Args:
+            removed_ids (List[str]): Ids de docstore de los chunks eliminados
+            chunk_ids (Dict[str, List[str]]): Ids de docstore de los chunks nuevos de cada producto
+        """
+        removed = set(removed_ids)
+        for entity in self.entities:
+            entity["chunk_ids"] = [
+                docstore_id for docstore_id in entity["chunk_ids"] if docstore_id not in removed
+            ] + chunk_ids.get(entity["name"], [])
+
+    def names(self) -> List[str]:
+        """Nombres de todos los productos del catálogo."""
+        return [entity["name"] for entity in self.entities]
+
+    def save(self, index_dir: str) -> None:
+        """Guarda el índice como JSON junto al índice FAISS."""
+        path = os.path.join(index_dir, ENTITIES_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": ENTITIES_VERSION, "entities": self.entities, "deletes": self.delete_map},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["EntityIndex"]:
+        """
+        Carga el índice guardado, si existe.
+        
+        Args:
+            index_dir (str): Directorio del índice
+            
+        Returns:
+            Optional[EntityIndex]: Índice cargado o None si no existe o es de otra versión
+        """
+        path = os.path.join(index_dir, ENTITIES_FILE)
+        if not os.path.exists(path):
+            return None
+        
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != ENTITIES_VERSION:
+            logger.warning("Índice de entidades de otra versión, se ignora hasta reconstruirlo")
+            return None
+        
+        return cls(data["entities"], data["deletes"])
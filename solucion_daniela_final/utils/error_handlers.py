@@ -5,12 +5,16 @@ import logging
 import functools
 from typing import Callable, Any
 
+from utils import metrics
+
 logger = logging.getLogger(__name__)
 
 def error_handler(func: Callable) -> Callable:
     """
     Decorador para manejar excepciones en funciones y registrarlas.
     
+    Con la instrumentación habilitada (utils.metrics) también mide la duración de la función como un span.
+    
     Args:
         func (Callable): La función a decorar
         
@@ -20,7 +24,8 @@ def error_handler(func: Callable) -> Callable:
     @functools.wraps(func)
     def wrapper(*args: Any, **kwargs: Any) -> Any:
         try:
-            return func(*args, **kwargs)
+            with metrics.span(func.__name__):
+                return func(*args, **kwargs)
         except Exception as e:
             logger.error(f"Error en {func.__name__}: {str(e)}", exc_info=True)
             return None
@@ -0,0 +1,121 @@
+"""
+Índices FAISS configurables con una cadena de fábrica de FAISS.
+
+Ejemplos: "Flat" (búsqueda exacta, el comportamiento original), "HNSW32" (grafo),
+"IVF64,Flat" (listas invertidas) e "IVF64,PQ16x8" (listas invertidas con vectores comprimidos).
+Los tipos que lo necesitan se entrenan con una muestra de vectores antes de agregar el resto.
+"""
+import logging
+from typing import Optional
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FACTORY = "Flat"
+
+
+def create_index(factory: str, dimension: int) -> faiss.Index:
+    """
+    Crea un índice vacío con distancia L2, la misma que usa LangChain por defecto.
+    
+    Args:
+        factory (str): Cadena de fábrica de FAISS
+        dimension (int): Dimensión de los vectores
+    
+    Returns:
+        faiss.Index: Índice vacío (posiblemente sin entrenar)
+    """
+    return faiss.index_factory(dimension, factory, faiss.METRIC_L2)
+
+
+def needs_training(factory: str, dimension: int) -> bool:
+    """Indica si el tipo de índice necesita entrenarse antes de agregar vectores."""
+    return not create_index(factory, dimension).is_trained
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    """
+    Indica si se pueden borrar vectores sin romper el mapeo fila -> documento de LangChain.
+    
+    FAISS.delete de LangChain renumera index_to_docstore_id de 0 a n-1, así que solo sirven los
+    índices planos (Flat, PQ, SQ), que compactan las filas al borrar. HNSW no permite borrar e IVF
+    conserva los ids originales, que quedarían desfasados.
+    """
+    return isinstance(faiss.downcast_index(index), faiss.IndexFlatCodes)
+
+
+def configure_search(index: faiss.Index, nprobe: int, ef_search: int) -> None:
+    """
+    Ajusta los parámetros de búsqueda que correspondan al tipo de índice.
+    
+    Args:
+        index (faiss.Index): Índice cargado
+        nprobe (int): Listas a recorrer en índices IVF
+        ef_search (int): Tamaño de la lista de candidatos en índices HNSW
+    """
+    parameters = faiss.ParameterSpace()
+    for name, value in [("nprobe", nprobe), ("efSearch", ef_search)]:
+        try:
+            parameters.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # El parámetro no aplica a este tipo de índice
+
+
+def build_trained_index(factory: str, sample: np.ndarray) -> faiss.Index:
+    """
+    Crea el índice y lo entrena con la muestra si hace falta.
+    
+    Si la muestra no alcanza para entrenar (por ejemplo, menos vectores que listas IVF),
+    se usa un índice plano y se avisa en el log.
+    
+    Args:
+        factory (str): Cadena de fábrica de FAISS
+        sample (np.ndarray): Vectores de entrenamiento (float32, una fila por vector)
+    
+    Returns:
+        faiss.Index: Índice listo para agregar vectores
+    """
+    dimension = sample.shape[1]
+    index = create_index(factory, dimension)
+    if index.is_trained:
+        return index
+    
+    try:
+        logger.info(f"Entrenando índice {factory} con {len(sample)} vectores")
+        index.train(sample)
+        return index
+    except RuntimeError as e:
+        logger.warning(f"No se pudo entrenar el índice {factory} ({str(e)}); se usa {DEFAULT_FACTORY}")
+        return create_index(DEFAULT_FACTORY, dimension)
+
+
+def create_vector_store(factory: str, embeddings: Embeddings, sample: np.ndarray,
+                        nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> FAISS:
+    """
+    Crea una base vectorial de LangChain vacía sobre el índice configurado.
+    
+    Args:
+        factory (str): Cadena de fábrica de FAISS
+        embeddings (Embeddings): Modelo de embeddings
+        sample (np.ndarray): Vectores para entrenar el índice si el tipo lo necesita
+        nprobe (Optional[int], optional): Listas a recorrer en índices IVF
+        ef_search (Optional[int], optional): Candidatos en índices HNSW
+    
+    Returns:
+        FAISS: Base vectorial lista para add_embeddings
+    """
+    index = build_trained_index(factory, np.ascontiguousarray(sample, dtype=np.float32))
+    if nprobe is not None and ef_search is not None:
+        configure_search(index, nprobe, ef_search)
+    
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(),
+        index_to_docstore_id={},
+    )
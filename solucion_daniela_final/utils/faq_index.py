@@ -0,0 +1,331 @@
+"""
+Índice de preguntas frecuentes para responder sin pasar por el LLM.
+
+Guarda una matriz normalizada con el embedding de cada pregunta de FAQs.csv y su
+"Respuesta optimizada". Si la consulta del cliente supera el umbral de similitud
+con la FAQ más cercana, se devuelve directamente la respuesta curada.
+El umbral se calibra al construir el índice con variantes de las propias preguntas
+(positivos) y consultas de producto que no deben responderse con una FAQ (negativos).
+"""
+import os
+import csv
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.bm25 import fold_accents
+
+logger = logging.getLogger(__name__)
+
+FAQ_INDEX_FILE = "faq_index.npz"
+FAQ_INDEX_VERSION = 1
+
+# Paráfrasis reales de las consultas más frecuentes, para calibrar con algo más que variantes de forma
+CALIBRATION_PARAPHRASES = {
+    "¿Realizan envíos a todo el país?": [
+        "¿hacen envíos a Córdoba?", "mandan al interior?", "¿llegan con envío a Mendoza?",
+    ],
+    "¿Cuánto tiempo tarda en llegar mi pedido?": [
+        "¿en cuántos días me llega?", "cuanto demora la entrega", "¿cuánto tarda el envío?",
+    ],
+    "¿Cómo puedo calcular el costo de envío?": [
+        "¿cuánto sale el envío?", "cuanto cuesta mandarlo a mi casa",
+    ],
+    "¿Qué opciones de envío ofrecen?": [
+        "¿cómo envían los muebles?", "que formas de envio tienen",
+    ],
+    "¿Cuáles son los métodos de pago disponibles?": [
+        "¿cómo puedo pagar?", "aceptan tarjeta de crédito?", "¿se puede pagar con transferencia?",
+    ],
+    "¿Puedo ver los productos antes de comprarlos?": [
+        "¿tienen showroom?", "¿puedo ir a ver los muebles?", "tienen local para ver los productos",
+    ],
+    "¿Puedo retirar mi compra en algún local?": [
+        "¿puedo pasar a buscar el pedido?", "se puede retirar en persona?",
+    ],
+    "¿Ofrecen garantía en sus productos?": [
+        "¿los muebles tienen garantía?", "que garantia tienen",
+    ],
+}
+
+# Preguntas casi idénticas del CSV ("¿Realizan muebles a medida?" / "¿Hacen muebles a medida?")
+# cuentan como acierto al calibrar si la más cercana supera esta similitud con la esperada
+DUPLICATE_SIMILARITY = 0.9
+
+# Consultas que deben seguir el flujo de búsqueda aunque se parezcan a una FAQ
+CALIBRATION_NEGATIVES = [
+    "¿Tienen mesas de comedor de 6 personas?",
+    "Quiero un camastro para el jardín",
+    "¿Qué fogoneros tienen?",
+    "¿Cuál es el producto más vendido?",
+    "Busco un sillón de hierro con almohadón",
+    "¿Tienen parrillas grandes?",
+    "¿De qué material son los barrales?",
+    "hola",
+    "gracias",
+]
+
+
+def read_faq_rows(csv_path: str) -> Tuple[List[str], List[List[str]]]:
+    """
+    Lee FAQs.csv tolerando comas sin comillas en la última columna.
+    
+    Las respuestas del archivo suelen tener comas sin comillas ("Sí, podés..."); los campos
+    que sobran se vuelven a unir en la última columna en lugar de descartarse.
+    
+    Args:
+        csv_path (str): Ruta del CSV de FAQs
+    
+    Returns:
+        Tuple[List[str], List[List[str]]]: Encabezados y filas con la misma cantidad de campos
+    """
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        headers = [header.strip() for header in next(reader)]
+        rows = []
+        for row in reader:
+            if len(row) < 2:
+                continue
+            if len(row) > len(headers):
+                row = row[:len(headers) - 1] + [",".join(row[len(headers) - 1:])]
+            rows.append([field.strip() for field in row] + [""] * (len(headers) - len(row)))
+    
+    return headers, rows
+
+
+def read_faqs(csv_path: str) -> List[Dict[str, str]]:
+    """
+    Devuelve las preguntas y respuestas curadas de FAQs.csv.
+    
+    Args:
+        csv_path (str): Ruta del CSV de FAQs
+    
+    Returns:
+        List[Dict[str, str]]: 'question' y 'answer' de cada FAQ con ambos campos completos
+    """
+    headers, rows = read_faq_rows(csv_path)
+    pregunta_col = next((i for i, col in enumerate(headers) if 'pregunta' in col.lower()), 0)
+    respuesta_col = next((i for i, col in enumerate(headers) if 'respuesta' in col.lower()), 1)
+    
+    return [
+        {"question": row[pregunta_col], "answer": row[respuesta_col]}
+        for row in rows if row[pregunta_col] and row[respuesta_col]
+    ]
+
+
+def question_variants(question: str) -> List[str]:
+    """
+    Genera variantes de forma de una pregunta: sin signos ni tildes, con saludo y con un error de tipeo.
+    
+    Args:
+        question (str): Pregunta original
+    
+    Returns:
+        List[str]: Variantes de la pregunta
+    """
+    bare = question.strip("¿? ")
+    folded = fold_accents(bare)
+    variants = [folded, f"hola, {bare[0].lower()}{bare[1:]}", f"{folded} por favor"]
+    
+    typo = typo_variant(folded)
+    if typo is not None:
+        variants.append(typo)
+    
+    return variants
+
+
+def typo_variant(text: str) -> Optional[str]:
+    """
+    Simula un error de tipeo transponiendo dos letras en el medio de la palabra más larga.
+    
+    Args:
+        text (str): Texto original
+    
+    Returns:
+        Optional[str]: Texto con el error, o None si no hay palabras de más de 4 letras
+    """
+    words = text.split()
+    if not words:
+        return None
+    
+    longest = max(words, key=len)
+    if len(longest) <= 4:
+        return None
+    
+    middle = len(longest) // 2
+    typo = longest[:middle - 1] + longest[middle] + longest[middle - 1] + longest[middle + 1:]
+    return text.replace(longest, typo, 1)
+
+
+def normalize_rows(vectors: List[List[float]]) -> np.ndarray:
+    """Convierte los vectores en una matriz float32 de filas con norma 1."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def calibrate_threshold(matrix: np.ndarray, positives: List[Tuple[np.ndarray, int]], negatives: List[np.ndarray],
+                        min_precision: float) -> Dict[str, Any]:
+    """
+    Elige el umbral de similitud más bajo que mantiene la precisión pedida y deja afuera a todos los negativos.
+    
+    Una respuesta es correcta si la FAQ más cercana a un positivo es la esperada (o un duplicado); los positivos
+    que caen en otra FAQ cuentan como respuestas incorrectas si superan el umbral. Ningún negativo puede
+    superarlo: el umbral queda siempre por encima del mayor puntaje de un negativo.
+    
+    Args:
+        matrix (np.ndarray): Embeddings normalizados de las preguntas
+        positives (List[Tuple[np.ndarray, int]]): Vector normalizado y fila de la FAQ esperada
+        negatives (List[np.ndarray]): Vectores normalizados que no deben responderse con una FAQ
+        min_precision (float): Precisión mínima entre las consultas respondidas por el atajo
+    
+    Returns:
+        Dict[str, Any]: 'threshold', 'precision' y 'recall' sobre los positivos, y el mayor puntaje de un negativo
+    """
+    samples = []
+    for vector, expected in positives:
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        is_correct = best == expected or float(matrix[best] @ matrix[expected]) >= DUPLICATE_SIMILARITY
+        samples.append((float(scores[best]), is_correct, True))
+    for vector in negatives:
+        samples.append((float(np.max(matrix @ vector)), False, False))
+    
+    # Recorrer los puntajes de mayor a menor hasta el primer negativo y quedarse con el último umbral
+    # que cumple la precisión
+    max_negative = max((score for score, _, is_positive in samples if not is_positive), default=None)
+    samples.sort(key=lambda sample: sample[0], reverse=True)
+    correct, answered = 0, 0
+    best = {"threshold": 1.0, "precision": 1.0, "recall": 0.0}
+    if max_negative is not None and max_negative >= 1.0:
+        best["threshold"] = float(np.nextafter(np.float32(max_negative), np.float32(np.inf)))
+    for score, is_correct, _ in samples:
+        if max_negative is not None and score <= max_negative:
+            break
+        answered += 1
+        correct += int(is_correct)
+        precision = correct / answered
+        if precision >= min_precision:
+            best = {"threshold": score, "precision": precision, "recall": correct / max(len(positives), 1)}
+    
+    best["max_negative_score"] = 0.0 if max_negative is None else max_negative
+    return best
+
+
+class FAQIndex:
+    """
+    Matriz de embeddings de preguntas frecuentes con sus respuestas curadas.
+    """
+    
+    def __init__(self, questions: List[str], answers: List[str], matrix: np.ndarray, threshold: float,
+                 model_name: str):
+        """
+        Args:
+            questions (List[str]): Preguntas de FAQs.csv
+            answers (List[str]): Respuesta optimizada de cada pregunta
+            matrix (np.ndarray): Embeddings normalizados de las preguntas (float32)
+            threshold (float): Similitud coseno mínima para responder con la FAQ
+            model_name (str): Modelo de embeddings con el que se calculó la matriz
+        """
+        self.questions = questions
+        self.answers = answers
+        self.matrix = matrix
+        self.threshold = threshold
+        self.model_name = model_name
+    
+    @classmethod
+    def build(cls, faqs: List[Dict[str, str]], embeddings: Embeddings, model_name: str,
+              negatives: Optional[List[str]] = None, min_precision: float = 0.98) -> "FAQIndex":
+        """
+        Vectoriza las preguntas y calibra el umbral.
+        
+        Args:
+            faqs (List[Dict[str, str]]): Preguntas y respuestas (ver read_faqs)
+            embeddings (Embeddings): Modelo de embeddings del índice
+            model_name (str): Identificador del modelo, para no mezclar matrices de modelos distintos
+            negatives (Optional[List[str]], optional): Consultas extra que no deben responderse con una FAQ
+            min_precision (float, optional): Precisión mínima exigida al calibrar
+        
+        Returns:
+            FAQIndex: Índice con el umbral calibrado
+        """
+        questions = [faq["question"] for faq in faqs]
+        answers = [faq["answer"] for faq in faqs]
+        matrix = normalize_rows(embeddings.embed_documents(questions))
+        
+        positive_texts, expected = [], []
+        for i, question in enumerate(questions):
+            for variant in question_variants(question) + CALIBRATION_PARAPHRASES.get(question, []):
+                positive_texts.append(variant)
+                expected.append(i)
+        negative_texts = CALIBRATION_NEGATIVES + list(negatives or [])
+        
+        vectors = normalize_rows(embeddings.embed_documents(positive_texts + negative_texts))
+        positives = list(zip(vectors[:len(positive_texts)], expected))
+        calibration = calibrate_threshold(matrix, positives, list(vectors[len(positive_texts):]), min_precision)
+        
+        logger.info(
+            f"Umbral de FAQs calibrado en {calibration['threshold']:.3f}: precisión {calibration['precision']:.1%}, "
+            f"cobertura {calibration['recall']:.1%} sobre {len(positives)} variantes; "
+            f"mayor similitud de un negativo {calibration['max_negative_score']:.3f} "
+            f"({len(questions)} FAQs, {len(negative_texts)} negativos)"
+        )
+        
+        return cls(questions, answers, matrix, calibration["threshold"], model_name)
+    
+    def match(self, query_vector: List[float], threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Busca la FAQ más cercana a la consulta.
+        
+        Args:
+            query_vector (List[float]): Embedding de la consulta
+            threshold (Optional[float], optional): Umbral a usar en lugar del calibrado
+        
+        Returns:
+            Optional[Dict[str, Any]]: 'question', 'answer' y 'score' si supera el umbral, o None
+        """
+        if not len(self.questions):
+            return None
+        
+        vector = normalize_rows([query_vector])[0]
+        scores = self.matrix @ vector
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        if score < (self.threshold if threshold is None else threshold):
+            return None
+        
+        return {"question": self.questions[best], "answer": self.answers[best], "score": score}
+    
+    def save(self, index_dir: str) -> None:
+        """Guarda la matriz, las FAQs y el umbral junto al índice FAISS."""
+        path = os.path.join(index_dir, FAQ_INDEX_FILE)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, version=np.array(FAQ_INDEX_VERSION), model=np.array(self.model_name),
+                 threshold=np.array(self.threshold), matrix=self.matrix,
+                 questions=np.array(self.questions, dtype=str), answers=np.array(self.answers, dtype=str))
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, index_dir: str, model_name: str) -> Optional["FAQIndex"]:
+        """
+        Carga el índice guardado, si existe y corresponde al modelo de embeddings actual.
+        
+        Args:
+            index_dir (str): Directorio del índice
+            model_name (str): Identificador del modelo de embeddings en uso
+        
+        Returns:
+            Optional[FAQIndex]: Índice cargado o None
+        """
+        path = os.path.join(index_dir, FAQ_INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != FAQ_INDEX_VERSION or str(data["model"]) != model_name:
+                logger.warning("Índice de FAQs de otra versión o modelo, se ignora hasta reconstruirlo")
+                return None
+            return cls(data["questions"].tolist(), data["answers"].tolist(), data["matrix"],
+                       float(data["threshold"]), model_name)
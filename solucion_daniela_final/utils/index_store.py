@@ -0,0 +1,334 @@
+"""
+Formato nativo del índice, sin pickle y apto para memory-map.
+
+Archivos dentro del directorio del índice:
+- index.faiss: vectores en formato FAISS (se pueden abrir con memory-map)
+- docstore.jsonl: un documento JSON por línea, en el orden de los vectores
+- docstore.offsets: desplazamientos int64 de cada línea (n + 1 valores)
+- docstore.ids: ids de docstore, uno por línea, en el orden de los vectores
+- manifest.json: cabecera con versión del formato, parámetros, tamaños y checksums
+
+Al cargar siempre se comparan los tamaños de los archivos con el manifiesto; los checksums
+completos se verifican solo si se pide (antes de modificar el índice).
+Un índice en el formato pickle anterior (index.pkl) no se carga: se convierte una vez con migrate_legacy_index.
+"""
+import os
+import mmap
+import json
+import hashlib
+import logging
+import threading
+from typing import List, Dict, Optional, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NAME = "casamueble-index"
+FORMAT_VERSION = 2
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.jsonl"
+OFFSETS_FILE = "docstore.offsets"
+IDS_FILE = "docstore.ids"
+LEGACY_PICKLE_FILE = "index.pkl"
+
+
+def _sha256(path: str) -> str:
+    """Calcula el checksum de un archivo leyendo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LazyDocstore(Docstore, AddableMixin):
+    """
+    Docstore que materializa cada documento recién cuando se lo pide.
+    
+    Lee docstore.jsonl a través de un memory-map usando la tabla de desplazamientos,
+    así la memoria residente no crece con el tamaño del corpus. Los documentos
+    agregados o eliminados después de la carga se guardan aparte hasta el próximo guardado.
+    """
+
+    def __init__(self, docstore_path: str, offsets_path: str, ids: List[str]):
+        """
+        Args:
+            docstore_path (str): Ruta de docstore.jsonl
+            offsets_path (str): Ruta de docstore.offsets
+            ids (List[str]): Ids de docstore en el orden de las líneas
+        """
+        self._positions = {docstore_id: i for i, docstore_id in enumerate(ids)}
+        self._offsets = np.memmap(offsets_path, dtype=np.int64, mode="r") if ids else np.zeros(1, dtype=np.int64)
+        self._file = open(docstore_path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if ids else b""
+        self._added: Dict[str, Document] = {}
+        self._deleted = set()
+        self._lock = threading.Lock()
+
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        Devuelve el documento con el id indicado.
+        
+        Args:
+            search (str): Id del documento
+            
+        Returns:
+            Union[str, Document]: Documento o mensaje de error, como InMemoryDocstore
+        """
+        if search in self._deleted:
+            return f"ID {search} not found."
+        if search in self._added:
+            return self._added[search]
+        
+        position = self._positions.get(search)
+        if position is None:
+            return f"ID {search} not found."
+        
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        record = json.loads(self._data[start:end])
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """Agrega documentos nuevos en memoria."""
+        with self._lock:
+            overlapping = set(texts) & (set(self._added) | (set(self._positions) - self._deleted))
+            if overlapping:
+                raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+            self._added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        """Marca documentos como eliminados."""
+        with self._lock:
+            for docstore_id in ids:
+                if docstore_id in self._added:
+                    del self._added[docstore_id]
+                elif docstore_id in self._positions:
+                    self._deleted.add(docstore_id)
+                else:
+                    raise ValueError(f"ID {docstore_id} not found.")
+
+    def close(self) -> None:
+        """Libera el memory-map y el archivo."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+def save_native_index(db: FAISS, index_dir: str) -> None:
+    """
+    Guarda el índice en el formato nativo, escribiendo cada archivo de forma atómica.
+    
+    Los checksums del manifiesto se calculan sobre los bytes mientras se escriben, sin volver a leer los archivos.
+    
+    Args:
+        db (FAISS): Índice a guardar
+        index_dir (str): Directorio de destino
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    paths = {name: os.path.join(index_dir, name) for name in [VECTORS_FILE, DOCSTORE_FILE, OFFSETS_FILE, IDS_FILE]}
+    
+    checksums = {}
+    vectors = faiss.serialize_index(db.index)
+    checksums[VECTORS_FILE] = hashlib.sha256(vectors).hexdigest()
+    vectors.tofile(paths[VECTORS_FILE] + ".tmp")
+    del vectors
+    
+    ids = []
+    offsets = [0]
+    digest = hashlib.sha256()
+    with open(paths[DOCSTORE_FILE] + ".tmp", "wb") as f:
+        for position in range(db.index.ntotal):
+            docstore_id = db.index_to_docstore_id[position]
+            doc = db.docstore.search(docstore_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Documento faltante en el docstore: {docstore_id}")
+            line = json.dumps(
+                {"id": docstore_id, "page_content": doc.page_content, "metadata": doc.metadata},
+                ensure_ascii=False
+            ).encode("utf-8") + b"\n"
+            f.write(line)
+            digest.update(line)
+            ids.append(docstore_id)
+            offsets.append(offsets[-1] + len(line))
+    
+    checksums[DOCSTORE_FILE] = digest.hexdigest()
+    
+    offsets_bytes = np.asarray(offsets, dtype=np.int64).tobytes()
+    checksums[OFFSETS_FILE] = hashlib.sha256(offsets_bytes).hexdigest()
+    with open(paths[OFFSETS_FILE] + ".tmp", "wb") as f:
+        f.write(offsets_bytes)
+    
+    ids_bytes = "".join(f"{docstore_id}\n" for docstore_id in ids).encode("utf-8")
+    checksums[IDS_FILE] = hashlib.sha256(ids_bytes).hexdigest()
+    with open(paths[IDS_FILE] + ".tmp", "wb") as f:
+        f.write(ids_bytes)
+    
+    # Cerrar el docstore perezoso antes de reemplazar los archivos que tiene mapeados
+    reopen = isinstance(db.docstore, LazyDocstore)
+    if reopen:
+        db.docstore.close()
+    
+    for path in paths.values():
+        os.replace(path + ".tmp", path)
+    
+    # Dejar el índice en memoria apuntando a los archivos nuevos
+    if reopen:
+        db.docstore = LazyDocstore(paths[DOCSTORE_FILE], paths[OFFSETS_FILE], ids)
+        db.index_to_docstore_id = dict(enumerate(ids))
+    
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "count": len(ids),
+        "dimension": db.index.d,
+        "normalize_L2": db._normalize_L2,
+        "distance_strategy": db.distance_strategy.value,
+        "sizes": {name: os.path.getsize(path) for name, path in paths.items()},
+        "checksums": checksums,
+    }
+    tmp_manifest = os.path.join(index_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, os.path.join(index_dir, MANIFEST_FILE))
+    
+    # El pickle anterior ya no es necesario
+    legacy_path = os.path.join(index_dir, LEGACY_PICKLE_FILE)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+
+def load_native_index(index_dir: str, embeddings: Embeddings, use_mmap: bool = True,
+                      verify: bool = False) -> FAISS:
+    """
+    Carga un índice guardado en el formato nativo.
+    
+    Args:
+        index_dir (str): Directorio del índice
+        embeddings (Embeddings): Modelo de embeddings
+        use_mmap (bool, optional): Abrir los vectores con memory-map (solo lectura). Default es True.
+        verify (bool, optional): Verificar además los checksums completos del manifiesto. Default es False.
+        
+    Returns:
+        FAISS: Índice listo para buscar
+        
+    Raises:
+        ValueError: Si el manifiesto es de otro formato o versión, o si los archivos no coinciden con él
+    """
+    with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    
+    if manifest.get("format") != FORMAT_NAME:
+        raise ValueError(f"Formato de índice desconocido: {manifest.get('format')}")
+    if manifest.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Versión de índice no soportada: {manifest.get('version')}")
+    
+    for name, size in manifest["sizes"].items():
+        path = os.path.join(index_dir, name)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            raise ValueError(f"Tamaño inválido en {name}: el índice está corrupto o incompleto")
+    
+    if verify:
+        for name, checksum in manifest["checksums"].items():
+            if _sha256(os.path.join(index_dir, name)) != checksum:
+                raise ValueError(f"Checksum inválido en {name}: el índice está corrupto o incompleto")
+    
+    vectors_path = os.path.join(index_dir, VECTORS_FILE)
+    index = None
+    if use_mmap:
+        try:
+            index = faiss.read_index(vectors_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning(f"No se pudo abrir el índice con memory-map, se carga en memoria: {str(e)}")
+    if index is None:
+        index = faiss.read_index(vectors_path)
+    
+    with open(os.path.join(index_dir, IDS_FILE), "r", encoding="utf-8") as f:
+        ids = f.read().splitlines()
+    docstore = LazyDocstore(
+        os.path.join(index_dir, DOCSTORE_FILE),
+        os.path.join(index_dir, OFFSETS_FILE),
+        ids
+    )
+    
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(ids)),
+        normalize_L2=manifest["normalize_L2"],
+        distance_strategy=DistanceStrategy(manifest["distance_strategy"]),
+    )
+
+
+def has_native_index(index_dir: str) -> bool:
+    """Indica si el directorio contiene un índice en formato nativo."""
+    return os.path.exists(os.path.join(index_dir, MANIFEST_FILE))
+
+
+def has_legacy_index(index_dir: str) -> bool:
+    """Indica si el directorio solo contiene un índice en el formato pickle anterior."""
+    return not has_native_index(index_dir) and os.path.exists(os.path.join(index_dir, LEGACY_PICKLE_FILE))
+
+
+def migrate_legacy_index(index_dir: str, embeddings: Embeddings) -> int:
+    """
+    Convierte un índice en el formato pickle anterior (index.faiss + index.pkl) al formato nativo.
+    
+    Es el único lugar donde se deserializa el pickle, y se ejecuta a pedido
+    (manage_knowledge_base.py migrate-index) sobre un índice de origen confiable.
+    
+    Args:
+        index_dir (str): Directorio del índice
+        embeddings (Embeddings): Modelo de embeddings
+        
+    Returns:
+        int: Cantidad de vectores migrados
+        
+    Raises:
+        FileNotFoundError: Si no hay un índice pickle para migrar
+    """
+    if not has_legacy_index(index_dir):
+        raise FileNotFoundError(f"No hay un índice en formato pickle para migrar en: {index_dir}")
+    
+    db = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+    save_native_index(db, index_dir)
+    logger.info(f"Índice migrado al formato nativo ({db.index.ntotal} vectores)")
+    return db.index.ntotal
+
+
+def load_index(index_dir: str, embeddings: Embeddings, use_mmap: bool = True,
+               verify: bool = False) -> Optional[FAISS]:
+    """
+    Carga el índice en formato nativo.
+    
+    Args:
+        index_dir (str): Directorio del índice
+        embeddings (Embeddings): Modelo de embeddings
+        use_mmap (bool, optional): Abrir los vectores con memory-map. Default es True.
+        verify (bool, optional): Verificar además los checksums completos del manifiesto. Default es False.
+        
+    Returns:
+        Optional[FAISS]: Índice cargado o None si no existe ninguno
+        
+    Raises:
+        ValueError: Si solo existe un índice en el formato pickle anterior, que no se carga sin migrarlo
+    """
+    if has_native_index(index_dir):
+        return load_native_index(index_dir, embeddings, use_mmap=use_mmap, verify=verify)
+    
+    if has_legacy_index(index_dir):
+        raise ValueError(
+            "El índice está en el formato pickle anterior y no se carga por seguridad; "
+            "ejecuta 'python manage_knowledge_base.py migrate-index' para convertirlo al formato nativo"
+        )
+    
+    return None
@@ -0,0 +1,295 @@
+"""
+Instrumentación liviana del pipeline de consultas: spans por etapa, contadores e histogramas.
+
+Cada turno (turn) agrupa los spans de sus etapas (expansión, embedding, búsquedas FAISS y BM25,
+formato del prompt, LLM) y sus contadores; al cerrarse se puede escribir como una línea JSON.
+Los acumulados se exportan en formato de texto de Prometheus. Deshabilitado, span() devuelve
+siempre el mismo context manager vacío y los contadores retornan sin hacer nada.
+"""
+import json
+import time
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Límites superiores de los buckets de cada histograma
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+CHARS_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+TOKENS_BUCKETS = (128, 256, 512, 1024, 1536, 2048, 3072, 4096, 6144, 8192, 16384)
+
+_enabled = False
+_jsonl_path: Optional[str] = None
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict[str, Any]] = {}
+_current_turn: contextvars.ContextVar = contextvars.ContextVar("metrics_turn", default=None)
+
+
+class _NoopSpan:
+    """Span (y turno) vacío que se usa cuando la instrumentación está deshabilitada."""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def configure(enabled: bool, jsonl_path: Optional[str] = None) -> None:
+    """
+    Habilita o deshabilita la instrumentación.
+    
+    Args:
+        enabled (bool): Registrar spans, contadores e histogramas
+        jsonl_path (Optional[str], optional): Archivo donde agregar una línea JSON por turno
+            (y por span fuera de un turno); None no escribe nada
+    """
+    global _enabled, _jsonl_path
+    _enabled = enabled
+    _jsonl_path = jsonl_path
+
+
+def enabled() -> bool:
+    """Indica si la instrumentación está habilitada."""
+    return _enabled
+
+
+def reset() -> None:
+    """Borra los contadores e histogramas acumulados."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def count(name: str, value: float = 1, **labels: str) -> None:
+    """
+    Suma al contador global y al del turno en curso.
+    
+    Args:
+        name (str): Nombre del contador (por ejemplo "faiss_queries")
+        value (float, optional): Cantidad a sumar. Default es 1.
+        **labels (str): Etiquetas del contador
+    """
+    if not _enabled:
+        return
+    
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    
+    turn = _current_turn.get()
+    if turn is not None:
+        turn_key = name + _format_labels(key[1])
+        turn["counters"][turn_key] = turn["counters"].get(turn_key, 0) + value
+
+
+def observe(name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels: str) -> None:
+    """
+    Registra una observación en un histograma (y en el turno en curso).
+    
+    Args:
+        name (str): Nombre del histograma (por ejemplo "context_chars")
+        value (float): Valor observado
+        buckets (Tuple[float, ...], optional): Límites superiores de los buckets
+        **labels (str): Etiquetas del histograma
+    """
+    if not _enabled:
+        return
+    
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for position, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][position] += 1
+                break
+        histogram["sum"] += value
+        histogram["count"] += 1
+    
+    turn = _current_turn.get()
+    if turn is not None and not labels:
+        turn["values"][name] = value
+
+
+@contextmanager
+def _span(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("stage_seconds", elapsed, stage=name)
+        turn = _current_turn.get()
+        if turn is not None:
+            turn["spans"].append({"stage": name, "ms": round(elapsed * 1000, 3)})
+        else:
+            _write_jsonl({"type": "span", "ts": time.time(), "stage": name, "ms": round(elapsed * 1000, 3)})
+
+
+def span(name: str):
+    """
+    Mide la duración de una etapa.
+    
+    Uso: ``with metrics.span("faiss_search"): ...``
+    
+    Args:
+        name (str): Nombre de la etapa
+    
+    Returns:
+        Context manager que registra la duración en el histograma stage_seconds y en el turno en curso
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _span(name)
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    """
+    Decorador que envuelve la función en un span.
+    
+    Args:
+        name (Optional[str], optional): Nombre de la etapa; por defecto el de la función
+    
+    Returns:
+        Callable: Decorador
+    """
+    def decorator(func: Callable) -> Callable:
+        stage = name or func.__name__
+        
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def turn(kind: str = "query"):
+    """
+    Agrupa los spans y contadores de un turno de conversación.
+    
+    Al cerrarse registra la latencia total en turn_seconds y escribe el turno como línea JSON.
+    
+    Uso: ``with metrics.turn() as record: ...``
+    
+    Args:
+        kind (str, optional): Tipo de turno (por ejemplo "query" o "stream")
+    
+    Returns:
+        Context manager que entrega el registro del turno ('spans', 'counters', 'values', y 'ms' al cerrarse),
+        o None si la instrumentación está deshabilitada
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _turn(kind)
+
+
+@contextmanager
+def _turn(kind: str) -> Iterator[Dict[str, Any]]:
+    record = {"type": "turn", "kind": kind, "ts": time.time(), "spans": [], "counters": {}, "values": {}}
+    token = _current_turn.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - start
+        try:
+            _current_turn.reset(token)
+        except ValueError:
+            # Un generador de streaming abandonado se cierra desde otro contexto (p. ej. el finalizador de asyncio)
+            _current_turn.set(None)
+        record["ms"] = round(elapsed * 1000, 3)
+        observe("turn_seconds", elapsed, kind=kind)
+        _write_jsonl(record)
+
+
+def _write_jsonl(record: Dict[str, Any]) -> None:
+    if _jsonl_path is None:
+        return
+    line = json.dumps(record, ensure_ascii=False)
+    with _lock:
+        with open(_jsonl_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{label}="{value}"' for label, value in pairs) + "}"
+
+
+def render_prometheus(prefix: str = "casamueble_") -> str:
+    """
+    Exporta los contadores e histogramas en el formato de texto de Prometheus.
+    
+    Args:
+        prefix (str, optional): Prefijo de los nombres de métrica
+    
+    Returns:
+        str: Texto listo para servir en un endpoint /metrics
+    """
+    lines: List[str] = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(((key, dict(value, counts=list(value["counts"]))) for key, value in _histograms.items()),
+                            key=lambda item: item[0])
+    
+    declared = set()
+    for (name, labels), value in counters:
+        metric = f"{prefix}{name}_total"
+        if metric not in declared:
+            lines.append(f"# TYPE {metric} counter")
+            declared.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    
+    for (name, labels), histogram in histograms:
+        metric = f"{prefix}{name}"
+        if metric not in declared:
+            lines.append(f"# TYPE {metric} histogram")
+            declared.add(metric)
+        cumulative = 0
+        for bound, bucket_count in zip(histogram["buckets"], histogram["counts"]):
+            cumulative += bucket_count
+            lines.append(f"{metric}_bucket{_format_labels(labels, ('le', str(bound)))} {cumulative}")
+        lines.append(f"{metric}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram['count']}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {histogram['count']}")
+    
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, Any]:
+    """
+    Devuelve los acumulados como diccionario serializable a JSON.
+    
+    Returns:
+        Dict[str, Any]: 'counters' y 'histograms' (cantidad, suma y promedio) por nombre y etiquetas
+    """
+    def label_name(name, labels):
+        return name + _format_labels(labels)
+    
+    with _lock:
+        return {
+            "counters": {label_name(name, labels): value for (name, labels), value in _counters.items()},
+            "histograms": {
+                label_name(name, labels): {
+                    "count": histogram["count"],
+                    "sum": histogram["sum"],
+                    "avg": histogram["sum"] / histogram["count"] if histogram["count"] else 0.0,
+                }
+                for (name, labels), histogram in _histograms.items()
+            },
+        }
@@ -0,0 +1,53 @@
+"""
+Utilidades para resolver modelos de HuggingFace desde la caché local.
+"""
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def is_model_cached(cache_dir: str, model_name: str) -> bool:
+    """
+    Indica si el modelo ya fue descargado en la carpeta de caché.
+    
+    Reconoce tanto el formato del hub (models--org--modelo) como el formato
+    anterior de sentence-transformers (org_modelo).
+    
+    Args:
+        cache_dir (str): Carpeta de caché de modelos
+        model_name (str): Nombre del modelo, por ejemplo 'sentence-transformers/all-MiniLM-L6-v2'
+        
+    Returns:
+        bool: True si se encontró una copia local del modelo
+    """
+    if not os.path.isdir(cache_dir):
+        return False
+    
+    candidates = {
+        "models--" + model_name.replace("/", "--"),
+        model_name.replace("/", "_"),
+    }
+    return any(name in candidates for name in os.listdir(cache_dir))
+
+
+def enable_offline_if_cached(cache_dir: str, model_name: str) -> bool:
+    """
+    Fuerza la resolución offline de modelos si el modelo está en caché.
+    
+    Debe llamarse antes de importar sentence-transformers o langchain_huggingface,
+    porque huggingface_hub lee estas variables al importarse.
+    
+    Args:
+        cache_dir (str): Carpeta de caché de modelos
+        model_name (str): Nombre del modelo
+        
+    Returns:
+        bool: True si se activó el modo offline
+    """
+    if not is_model_cached(cache_dir, model_name):
+        return False
+    
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    return True
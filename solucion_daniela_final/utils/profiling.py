@@ -0,0 +1,239 @@
+"""
+Modo de perfilado para main.py, indexer.py y manage_knowledge_base.py.
+
+Captura un perfil de CPU (cProfile) y una foto de memoria (tracemalloc) por corrida o cada N turnos,
+y los guarda en el directorio de perfiles:
+- <nombre>-<fecha>.prof: estadísticas de pstats (snakeviz, pstats)
+- <nombre>-<fecha>.cpu.collapsed: stacks colapsados en microsegundos (flamegraph.pl, speedscope, inferno)
+- <nombre>-<fecha>.mem.collapsed: stacks colapsados en bytes asignados y todavía vivos
+Además imprime las funciones con más tiempo acumulado y las líneas con más memoria asignada.
+"""
+import io
+import os
+import time
+import pstats
+import cProfile
+import logging
+import tracemalloc
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Profundidad máxima y tiempo mínimo de los stacks reconstruidos a partir del grafo de llamadas de cProfile
+MAX_STACK_DEPTH = 64
+MIN_STACK_SECONDS = 1e-5
+
+# Frames propios del perfilado que no aportan a la foto de memoria
+MEMORY_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+
+def profiling_requested(flag: bool, env_var: str) -> bool:
+    """
+    Indica si hay que perfilar, por la opción --profile o por la variable de entorno.
+    
+    Args:
+        flag (bool): Valor de la opción --profile
+        env_var (str): Nombre de la variable de entorno ("1", "true" o "yes" la activan)
+    
+    Returns:
+        bool: True si el perfilado está pedido
+    """
+    return flag or os.environ.get(env_var, "").strip().lower() in ("1", "true", "yes")
+
+
+def requested_profiler(name: str, flag: bool, env_var: str, output_dir: str, top: int = 20,
+                       frames: int = 25, every_turns: int = 0) -> Optional["Profiler"]:
+    """
+    Crea el perfilador si se pidió con --profile o con la variable de entorno.
+    
+    Args:
+        name (str): Prefijo de los archivos ("main", "indexer", ...)
+        flag (bool): Valor de la opción --profile
+        env_var (str): Nombre de la variable de entorno
+        output_dir (str): Directorio de perfiles
+        top (int, optional): Entradas del resumen impreso
+        frames (int, optional): Frames que guarda tracemalloc por asignación
+        every_turns (int, optional): Turnos por perfil; 0 guarda uno por corrida
+    
+    Returns:
+        Optional[Profiler]: Perfilador sin iniciar, o None si no se pidió
+    """
+    if not profiling_requested(flag, env_var):
+        return None
+    return Profiler(name, output_dir, top=top, frames=frames, every_turns=every_turns)
+
+
+def function_label(func: Tuple[str, int, str]) -> str:
+    """Nombre legible de una función de pstats: módulo:función:línea."""
+    filename, line, name = func
+    if filename == "~":
+        return name  # Funciones nativas, por ejemplo <built-in method faiss._swigfaiss...>
+    return f"{os.path.splitext(os.path.basename(filename))[0]}:{name}:{line}"
+
+
+def collapsed_cpu_stacks(stats: pstats.Stats) -> List[str]:
+    """
+    Reconstruye stacks colapsados a partir del grafo de llamadas de cProfile.
+    
+    cProfile solo guarda pares llamador -> llamado; el tiempo propio de cada función se reparte entre
+    sus caminos en proporción al tiempo acumulado que aporta cada llamador (las recursiones quedan
+    sumadas en el primer frame de la función).
+    
+    Args:
+        stats (pstats.Stats): Estadísticas del perfil
+    
+    Returns:
+        List[str]: Líneas "raíz;...;hoja microsegundos"
+    """
+    children: Dict[tuple, List[Tuple[tuple, float]]] = {}
+    totals: Dict[tuple, Tuple[float, float]] = {}
+    roots = []
+    for func, (_, _, tottime, cumtime, callers) in stats.stats.items():
+        totals[func] = (tottime, cumtime)
+        if not callers:
+            roots.append(func)
+        for caller, (_, _, _, edge_cumtime) in callers.items():
+            if caller != func:
+                children.setdefault(caller, []).append((func, edge_cumtime))
+    
+    lines: Dict[str, float] = {}
+    
+    def walk(func, path, cumtime, depth):
+        path = path + [function_label(func)]
+        total_tottime, total_cumtime = totals[func]
+        share = min(cumtime / total_cumtime, 1.0) if total_cumtime else 0.0
+        stack = ";".join(path)
+        lines[stack] = lines.get(stack, 0.0) + total_tottime * share
+        if depth >= MAX_STACK_DEPTH:
+            return
+        for child, edge_cumtime in children.get(func, []):
+            if edge_cumtime * share < MIN_STACK_SECONDS or function_label(child) in path:
+                continue
+            walk(child, path, edge_cumtime * share, depth + 1)
+    
+    for func in roots:
+        walk(func, [], totals[func][1], 0)
+    
+    return [f"{stack} {int(seconds * 1e6)}" for stack, seconds in lines.items() if int(seconds * 1e6) > 0]
+
+
+def collapsed_memory_stacks(snapshot: tracemalloc.Snapshot) -> List[str]:
+    """
+    Convierte una foto de tracemalloc en stacks colapsados por bytes asignados.
+    
+    Args:
+        snapshot (tracemalloc.Snapshot): Foto de memoria
+    
+    Returns:
+        List[str]: Líneas "raíz;...;hoja bytes"
+    """
+    lines = []
+    for stat in snapshot.statistics("traceback"):
+        # Los frames vienen del más antiguo al más reciente, el orden de los stacks colapsados
+        frames = [f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+        lines.append(f"{';'.join(frames)} {stat.size}")
+    return lines
+
+
+class Profiler:
+    """
+    Perfil de CPU y memoria de una corrida, con cortes opcionales cada N turnos.
+    
+    Uso: ``with Profiler("indexer", PROFILE_DIR): main()``
+    """
+
+    def __init__(self, name: str, output_dir: str, top: int = 20, frames: int = 25, every_turns: int = 0):
+        self.name = name
+        self.output_dir = output_dir
+        self.top = top
+        self.frames = frames
+        self.every_turns = every_turns
+        self._profile: Optional[cProfile.Profile] = None
+        self._turns = 0
+
+    def start(self) -> None:
+        """Empieza a medir CPU y memoria."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        tracemalloc.clear_traces()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> Dict[str, str]:
+        """
+        Deja de medir, guarda los archivos e imprime el resumen.
+        
+        Returns:
+            Dict[str, str]: Rutas de los archivos escritos ('prof', 'cpu', 'mem')
+        """
+        if self._profile is None:
+            return {}
+        self._profile.disable()
+        snapshot = tracemalloc.take_snapshot().filter_traces(MEMORY_FILTERS)
+        tracemalloc.stop()
+        profile, self._profile = self._profile, None
+        
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.name}-{time.strftime('%Y%m%d-%H%M%S')}")
+        if self.every_turns:
+            base += f"-turno{self._turns}"
+        paths = {"prof": base + ".prof", "cpu": base + ".cpu.collapsed", "mem": base + ".mem.collapsed"}
+        
+        stats = pstats.Stats(profile)
+        stats.dump_stats(paths["prof"])
+        with open(paths["cpu"], "w", encoding="utf-8") as f:
+            f.write("\n".join(collapsed_cpu_stacks(stats)) + "\n")
+        with open(paths["mem"], "w", encoding="utf-8") as f:
+            f.write("\n".join(collapsed_memory_stacks(snapshot)) + "\n")
+        
+        print(self.report(stats, snapshot))
+        logger.info(f"Perfil guardado en: {base}.*")
+        return paths
+
+    def report(self, stats: pstats.Stats, snapshot: tracemalloc.Snapshot) -> str:
+        """
+        Arma el resumen con las funciones de más tiempo acumulado y las líneas de más memoria.
+        
+        Args:
+            stats (pstats.Stats): Estadísticas de CPU
+            snapshot (tracemalloc.Snapshot): Foto de memoria
+        
+        Returns:
+            str: Texto del resumen
+        """
+        buffer = io.StringIO()
+        stats.stream = buffer
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        
+        memory = snapshot.statistics("lineno")[:self.top]
+        memory_lines = [
+            f"{stat.size / 1024:10.1f} KiB {stat.count:8d} bloques  "
+            f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}"
+            for stat in memory
+        ]
+        
+        return (
+            f"\n===== Perfil {self.name}: top {self.top} por tiempo acumulado =====\n"
+            + buffer.getvalue().strip()
+            + f"\n\n===== Perfil {self.name}: top {self.top} por memoria asignada =====\n"
+            + "\n".join(memory_lines)
+        )
+
+    def turn_finished(self) -> None:
+        """Cuenta un turno de conversación y guarda un perfil cada every_turns turnos."""
+        self._turns += 1
+        if self.every_turns and self._turns % self.every_turns == 0:
+            self.stop()
+            self.start()
+
+    def __enter__(self) -> "Profiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        self.stop()
+        return False
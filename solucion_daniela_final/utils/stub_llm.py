@@ -0,0 +1,142 @@
+"""
+LLM simulado y determinístico para pruebas locales sin llamadas a OpenAI.
+
+Opcionalmente simula la lectura del prompt antes del primer token y la caché de prefijos de los
+proveedores: el tramo inicial que coincide con un prompt anterior, en bloques enteros, no se vuelve a leer.
+"""
+import re
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from pydantic import PrivateAttr
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+PROMPT_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+class StubLLM(LLM):
+    """
+    LLM que responde un texto fijo derivado del prompt, con una latencia y un ritmo de tokens configurables.
+    
+    Sirve para levantar el servicio o medir la parte de recuperación sin pagar un LLM real.
+    """
+    
+    latency: float = 0.0
+    """Segundos de espera antes del primer token."""
+    
+    tokens_per_second: float = 0.0
+    """Ritmo de generación después del primer token; 0 entrega todos los tokens juntos."""
+    
+    output_tokens: int = 0
+    """Largo de la respuesta en tokens; 0 usa la respuesta corta fija."""
+    
+    prefill_tokens_per_second: float = 0.0
+    """Ritmo de lectura del prompt antes del primer token; 0 no agrega tiempo por el prompt."""
+    
+    prefix_cache_block: int = 0
+    """Tamaño de bloque de la caché de prefijos simulada, en tokens; 0 la deshabilita."""
+    
+    prefix_cache_entries: int = 256
+    """Prompts recordados por la caché de prefijos simulada."""
+    
+    _cached_prompts: List[List[str]] = PrivateAttr(default_factory=list)
+    _cache_stats: Dict[str, int] = PrivateAttr(
+        default_factory=lambda: {"prompts": 0, "prompt_tokens": 0, "cached_tokens": 0}
+    )
+    _cache_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _respond(self, prompt: str) -> str:
+        """Arma una respuesta determinística para el prompt."""
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        response = f"Respuesta simulada {digest}: gracias por tu consulta, en breve te ayudamos."
+        if not self.output_tokens:
+            return response
+        
+        # Repetir la respuesta hasta el largo pedido, siempre con las mismas palabras
+        words = response.split(" ")
+        return " ".join(words[i % len(words)] for i in range(self.output_tokens))
+
+    def _tokens(self, prompt: str) -> List[str]:
+        """Divide la respuesta en tokens (palabras con su espacio)."""
+        words = self._respond(prompt).split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def _cached_prefix(self, prompt_tokens: List[str]) -> int:
+        """Tokens iniciales ya leídos en un prompt anterior, redondeados a bloques enteros."""
+        longest = 0
+        for cached in self._cached_prompts:
+            length = 0
+            for cached_token, token in zip(cached, prompt_tokens):
+                if cached_token != token:
+                    break
+                length += 1
+            longest = max(longest, length)
+        return longest // self.prefix_cache_block * self.prefix_cache_block
+
+    def _prefill_seconds(self, prompt: str) -> float:
+        """Tiempo de lectura de la parte del prompt que no está en la caché de prefijos."""
+        if not self.prefill_tokens_per_second:
+            return 0.0
+        
+        prompt_tokens = PROMPT_TOKEN_PATTERN.findall(prompt)
+        cached = 0
+        with self._cache_lock:
+            if self.prefix_cache_block:
+                cached = self._cached_prefix(prompt_tokens)
+                self._cached_prompts.append(prompt_tokens)
+                del self._cached_prompts[:-self.prefix_cache_entries]
+            self._cache_stats["prompts"] += 1
+            self._cache_stats["prompt_tokens"] += len(prompt_tokens)
+            self._cache_stats["cached_tokens"] += cached
+        return (len(prompt_tokens) - cached) / self.prefill_tokens_per_second
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Prompts recibidos y tokens de prompt totales y leídos de la caché de prefijos."""
+        with self._cache_lock:
+            return dict(self._cache_stats)
+
+    def _generation_seconds(self, tokens: List[str]) -> float:
+        """Tiempo que tarda en generarse la respuesta completa, primer token incluido."""
+        if not self.tokens_per_second:
+            return self.latency
+        return self.latency + (len(tokens) - 1) / self.tokens_per_second
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        delay = self._prefill_seconds(prompt) + self._generation_seconds(self._tokens(prompt))
+        if delay:
+            time.sleep(delay)
+        return self._respond(prompt)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        delay = self._prefill_seconds(prompt) + self._generation_seconds(self._tokens(prompt))
+        if delay:
+            await asyncio.sleep(delay)
+        return self._respond(prompt)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        delay = self.latency + self._prefill_seconds(prompt)
+        if delay:
+            time.sleep(delay)
+        for position, token in enumerate(self._tokens(prompt)):
+            if position and self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield GenerationChunk(text=token)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        delay = self.latency + self._prefill_seconds(prompt)
+        if delay:
+            await asyncio.sleep(delay)
+        for position, token in enumerate(self._tokens(prompt)):
+            if position and self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield GenerationChunk(text=token)